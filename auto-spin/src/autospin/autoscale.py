@@ -0,0 +1,87 @@
+import asyncio
+import math
+import time
+from typing import Dict, List, Optional
+import httpx
+from pydantic import BaseModel
+from autospin.scripts.jobctl import parse_prometheus
+
+
+# Prometheus gauges exported by the engines, summed over all label sets of a replica
+METRICS: Dict[str, List[str]] = {
+    "queue_depth": ["sglang:num_queue_reqs", "vllm:num_requests_waiting"],
+    "running_requests": ["sglang:num_running_reqs", "vllm:num_requests_running"],
+    "token_throughput": ["sglang:gen_throughput"],
+}
+
+
+class AutoscaleConfig(BaseModel):
+    metric: str = "running_requests"
+    # desired value of `metric` per replica
+    target: float
+    # Supports {node}, {job_id} and {job_name}
+    metrics_url: str = "http://{node}:8080/metrics"
+    # weight of the newest sample in the exponential moving average
+    smoothing: float = 0.3
+    scale_up_cooldown: float = 300.0
+    scale_down_cooldown: float = 1800.0
+    timeout: float = 5.0
+
+
+class ScaleState(BaseModel):
+    instances: int
+    smoothed: Optional[float] = None
+    last_scale: float = 0.0
+
+
+def metric_value(values: Dict[str, float], metric: str) -> Optional[float]:
+    for name in METRICS[metric]:
+        if name in values:
+            return values[name]
+    return None
+
+
+async def _scrape(client: httpx.AsyncClient, url: str, metric: str, timeout: float) -> Optional[float]:
+    try:
+        response = await client.get(url, timeout=timeout)
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+    return metric_value(parse_prometheus(response.text), metric)
+
+
+async def _scrape_all(urls: List[str], metric: str, timeout: float) -> List[Optional[float]]:
+    async with httpx.AsyncClient() as client:
+        return await asyncio.gather(*[_scrape(client, url, metric, timeout) for url in urls])
+
+
+def scrape_replicas(jobs: List[dict], autoscale: AutoscaleConfig) -> Optional[float]:
+    """Sums `metric` over the running replicas, None when no replica could be scraped."""
+    urls = [autoscale.metrics_url.format(node=job.get("nodes", ""), job_id=job["jobId"], job_name=job["name"])
+            for job in jobs if job["status"]["state"] == "RUNNING"]
+    if not urls:
+        return None
+    samples = [value for value in asyncio.run(_scrape_all(urls, autoscale.metric, autoscale.timeout)) if value is not None]
+    if not samples:
+        return None
+    return sum(samples)
+
+
+def desired_instances(state: ScaleState, sample: Optional[float], autoscale: AutoscaleConfig,
+                      min_instances: int, max_instances: int, now: Optional[float] = None) -> ScaleState:
+    """Smooths `sample` into `state` and returns the new state with the scaled instance count."""
+    now = time.time() if now is None else now
+    current = min(max(state.instances, min_instances), max_instances)
+    smoothed = state.smoothed
+    if sample is not None:
+        smoothed = sample if smoothed is None else autoscale.smoothing * sample + (1 - autoscale.smoothing) * smoothed
+    if smoothed is None:
+        return ScaleState(instances=current, smoothed=smoothed, last_scale=state.last_scale)
+
+    wanted = min(max(math.ceil(smoothed / autoscale.target), min_instances), max_instances)
+    since_last_scale = now - state.last_scale
+    if (wanted > current and since_last_scale >= autoscale.scale_up_cooldown) or \
+            (wanted < current and since_last_scale >= autoscale.scale_down_cooldown):
+        return ScaleState(instances=wanted, smoothed=smoothed, last_scale=now)
+    return ScaleState(instances=current, smoothed=smoothed, last_scale=state.last_scale)
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+import click
+import firecrest as f7t
+import httpx
+from autospin.config import Config
+
+# a cached token is only reused while it stays valid for at least this many seconds
+MIN_TOKEN_VALIDITY: float = 60.0
+
+# system names already validated by this process, per Firecrest URL
+_known_systems: Dict[str, List[str]] = {}
+
+
+def _cache_file(config: Config, kind: str, *key: str) -> str:
+    digest = hashlib.sha256("\0".join(key).encode()).hexdigest()[:16]
+    return os.path.join(os.path.expanduser(config.cache_dir), f"{kind}-{digest}.json")
+
+
+def _read_cache(path: str) -> Optional[dict]:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(path: str, value: dict):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # mkstemp creates the file readable by the owner only, the token never hits the disk world-readable
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".autospin-cache-")
+    with os.fdopen(fd, 'w') as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+class CachedTokenAuth:
+    """Client credentials authorization whose access token is kept on disk until it expires.
+
+    Every autospin run with the same client reuses the token instead of requesting a new one,
+    concurrent requests of one run wait for a single refresh.
+    """
+
+    def __init__(self, client_id: str, client_secret: str, token_uri: str, cache_file: str):
+        self._client_id = client_id
+        self._client_secret = client_secret
+        self._token_uri = token_uri
+        self._cache_file = cache_file
+        self._lock = asyncio.Lock()
+        self._access_token: Optional[str] = None
+        self._expires_at = 0.0
+
+    def _valid(self) -> bool:
+        return self._access_token is not None and time.time() < self._expires_at - MIN_TOKEN_VALIDITY
+
+    async def access_token(self) -> str:
+        async with self._lock:
+            if self._valid():
+                return self._access_token
+            cached = _read_cache(self._cache_file) or {}
+            self._access_token, self._expires_at = cached.get("access_token"), float(cached.get("expires_at", 0))
+            if self._valid():
+                return self._access_token
+
+            async with httpx.AsyncClient() as session:
+                response = await session.post(self._token_uri, data={
+                    "grant_type": "client_credentials",
+                    "client_id": self._client_id,
+                    "client_secret": self._client_secret,
+                })
+            if response.status_code != 200:
+                raise RuntimeError(f"unable to obtain an access token: HTTP {response.status_code} {response.text}")
+            token = response.json()
+            self._access_token, self._expires_at = token["access_token"], time.time() + float(token["expires_in"])
+            try:
+                _write_cache(self._cache_file, {"access_token": self._access_token, "expires_at": self._expires_at})
+            except OSError as e:
+                click.echo(f"⚠️ Unable to cache the access token in {self._cache_file}: {e}")
+            return self._access_token
+
+    async def auth_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {await self.access_token()}"}
+
+
+async def system_names(client: f7t.v2.AsyncFirecrest, config: Config, refresh: bool = False) -> List[str]:
+    """Names of the Firecrest systems, memoized in memory and on disk for `systems_ttl` seconds."""
+    if config.firecrest_uri in _known_systems and not refresh:
+        return _known_systems[config.firecrest_uri]
+    path = _cache_file(config, "systems", config.firecrest_uri)
+    cached = None if refresh else _read_cache(path)
+    if cached is not None and time.time() - cached.get("fetched", 0) < config.systems_ttl:
+        names = cached["names"]
+    else:
+        names = [item["name"] for item in await client.systems()]
+        try:
+            _write_cache(path, {"names": names, "fetched": time.time()})
+        except OSError:
+            pass
+    _known_systems[config.firecrest_uri] = names
+    return names
+
+
+async def connect(config: Config) -> Optional[f7t.v2.AsyncFirecrest]:
+    """Async Firecrest client on one pooled HTTP session, None when the configured system doesn't exist.
+
+    The caller closes the session with `client.close_session()`.
+    """
+    authorization = CachedTokenAuth(config.client_id, config.client_secret, config.token_uri,
+                                    _cache_file(config, "token", config.token_uri, config.client_id))
+    client = f7t.v2.AsyncFirecrest(firecrest_url=config.firecrest_uri, authorization=authorization)
+
+    names = await system_names(client, config)
+    if config.system_name not in names:
+        # the cached list may predate the system, look it up once more before giving up
+        names = await system_names(client, config, refresh=True)
+    if config.system_name not in names:
+        click.echo("❌ Unable to find the required cluster/system")
+        await client.close_session()
+        return None
+    return client
+
+
+async def fetch_active_jobs(client: f7t.v2.AsyncFirecrest, config: Config) -> List[dict]:
+    # only jobs charged to the autospin account are listed, Slurm filters them before they are sent
+    jobs = await client.job_info(system_name=config.system_name, allusers=False, account=config.account)
+    return [item for item in jobs if item["status"]["state"] in ["PENDING", "RUNNING"]]
@@ -0,0 +1,144 @@
+import os
+import yaml
+from pydantic import BaseModel, model_validator
+from typing import Dict, Literal, Optional
+from autospin.autoscale import AutoscaleConfig
+from autospin.health import HealthConfig
+from autospin.packing import GPUS_PER_NODE
+from autospin.renewal import RenewalConfig
+
+AS_JOB_PREFIX:str="+as-"
+# SIGUSR1 arrives this long before the drain window ends, for stopping OCF and the engine
+DRAIN_MARGIN: int = 60
+
+
+def time_limit_seconds(time_limit: str) -> Optional[int]:
+    """Seconds of a SLURM time limit ([D-]HH:MM:SS, MM:SS or minutes), None when it can't be parsed."""
+    days, _, clock = time_limit.rpartition("-")
+    try:
+        parts = [int(part) for part in clock.split(":")]
+        days = int(days) if days else 0
+    except ValueError:
+        return None
+    if len(parts) == 1:
+        parts = [0, parts[0], 0]
+    elif len(parts) == 2:
+        parts = [0] + parts
+    hours, minutes, seconds = parts[-3:]
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+class ModelConfig(BaseModel):
+    instances: int = 0
+    model_name: str
+    model_path: str
+    model_args: str
+    sub_process:str
+    environment:str
+    serving_engine:str
+    time_limit:str
+    ocf_version:str
+    ocf_arch: str = "amd64"
+    # "warm" reads the checkpoint into the page cache, "copy" stages it to prestage_dir and serves from there
+    prestage: Optional[Literal["warm", "copy"]] = None
+    prestage_dir: str = "/tmp/autospin-stage"
+    prestage_threads: int = 16
+    # JSON lines file of common prefixes replayed before the server is advertised on OCF
+    warmup_corpus: Optional[str] = None
+    warmup_concurrency: int = 4
+    # restarts of a crashed or hung server inside its allocation before the job gives up
+    max_restarts: int = 5
+    # with autoscale, `instances` is the initial count and the controller keeps it within [min_instances, max_instances]
+    min_instances: Optional[int] = None
+    max_instances: Optional[int] = None
+    autoscale: Optional[AutoscaleConfig] = None
+    # GPUs one instance needs, instances of models needing less than a node share nodes with other
+    # models of the same environment and time limit (sub_process must then use --tp-size <= gpus)
+    gpus: Optional[int] = None
+    # nodes one instance is served from, ranks rendezvous at the first node of the allocation
+    nodes: int = 1
+    # seconds between GPU, host memory and engine gauge samples of the telemetry sidecar, off when unset
+    telemetry_interval: Optional[float] = None
+    # seconds before the time limit in which the server is deregistered from OCF and in-flight requests finish, 0 disables it
+    drain_timeout: float = 120.0
+
+    @model_validator(mode="after")
+    def check_packing(self):
+        if self.gpus is not None and not 0 < self.gpus <= GPUS_PER_NODE:
+            raise ValueError(f"gpus must be between 1 and {GPUS_PER_NODE}")
+        if self.packed() and self.autoscale is not None:
+            raise ValueError("packed models (gpus < a full node) can't be autoscaled")
+        if self.nodes < 1:
+            raise ValueError("nodes must be at least 1")
+        if self.packed() and self.nodes > 1:
+            raise ValueError("packed models (gpus < a full node) can't span several nodes")
+        if self.drain_timeout < 0:
+            raise ValueError("drain_timeout can't be negative")
+        # SLURM never sends a signal asked for before the job starts, the server wouldn't drain at all
+        seconds = time_limit_seconds(self.time_limit)
+        if self.drain_timeout and seconds is not None and self.drain_timeout + DRAIN_MARGIN >= seconds:
+            raise ValueError(f"drain_timeout {self.drain_timeout:g}s plus the {DRAIN_MARGIN}s margin must be shorter than time_limit {self.time_limit}")
+        return self
+
+    def packed(self) -> bool:
+        return self.gpus is not None and self.gpus < GPUS_PER_NODE
+
+    def instance_bounds(self):
+        low = self.instances if self.min_instances is None else self.min_instances
+        high = self.instances if self.max_instances is None else self.max_instances
+        return low, max(low, high)
+
+
+class Config(BaseModel):
+    models: Dict[str, ModelConfig]
+    client_id: str
+    client_secret: str
+    user_id:str
+    token_uri:str
+    firecrest_uri:str
+    system_name:str
+    account:str
+    bootstrap_addr:str
+    max_concurrency: int = 8
+    max_retries: int = 3
+    retry_backoff: float = 1.0
+    health: Optional[HealthConfig] = None
+    renewal: Optional[RenewalConfig] = None
+    state_file: str = "autospin-state.json"
+    # access token and Firecrest system names reused across runs
+    cache_dir: str = "~/.cache/autospin"
+    systems_ttl: float = 86400.0
+    # seconds the pre-flight checks trust that an existing file still exists, missing files are checked every run
+    preflight_ttl: float = 600.0
+    ocf_cache_dir: str = "/capstor/store/cscs/swissai/infra01/ocf-cache"
+    # optional pinned sha256 per "<version>/<arch>", e.g. "v0.1.8/amd64"
+    ocf_checksums: Dict[str, str] = {}
+
+    @model_validator(mode="after")
+    def check_renewal(self):
+        if self.renewal is not None and self.health is None:
+            raise ValueError("renewal needs health probes to know when a successor is ready")
+        return self
+
+    @property
+    def working_dir(self) -> str:
+        return f"/users/{self.user_id}/dispatcher"
+
+
+def load_config(file_path: str) -> Config:
+    with open(file_path, 'r') as f:
+        raw_data = yaml.safe_load(f)
+    return Config.model_validate(raw_data)
+
+
+def resolve_env(config: Config) -> Config:
+    if config.client_secret.startswith("env:"):
+        config.client_secret=os.getenv(config.client_secret.removeprefix("env:"))
+
+    if config.client_id.startswith("env:"):
+        config.client_id=os.getenv(config.client_id.removeprefix("env:"))
+
+    if config.user_id.startswith("env:"):
+        config.user_id=os.getenv(config.user_id.removeprefix("env:"))
+    return config
+
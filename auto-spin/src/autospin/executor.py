@@ -0,0 +1,58 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+from pydantic import BaseModel
+
+
+class Action(BaseModel):
+    kind: str
+    job_name: str
+    job_id: Optional[str] = None
+    script: Optional[str] = None
+
+
+class ActionResult(BaseModel):
+    action: Action
+    ok: bool
+    attempts: int
+    duration: float
+    error: Optional[str] = None
+    response: Any = None
+
+
+async def _run_action(action: Action, call: Callable[[Action], Awaitable[Any]], semaphore: asyncio.Semaphore,
+                      max_retries: int, retry_backoff: float) -> ActionResult:
+    start = time.monotonic()
+    attempt = 0
+    async with semaphore:
+        while True:
+            attempt += 1
+            try:
+                response = await call(action)
+                return ActionResult(action=action, ok=True, attempts=attempt,
+                                    duration=time.monotonic() - start, response=response)
+            except Exception as e:
+                if attempt > max_retries:
+                    return ActionResult(action=action, ok=False, attempts=attempt,
+                                        duration=time.monotonic() - start, error=str(e))
+                # exponential backoff: backoff, 2*backoff, 4*backoff, ...
+                await asyncio.sleep(retry_backoff * 2 ** (attempt - 1))
+
+
+async def _run_all(actions: List[Action], call: Callable[[Action], Awaitable[Any]], max_concurrency: int,
+                   max_retries: int, retry_backoff: float) -> List[ActionResult]:
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    return await asyncio.gather(*[
+        _run_action(action, call, semaphore, max_retries, retry_backoff) for action in actions
+    ])
+
+
+async def execute(actions: List[Action], call: Callable[[Action], Awaitable[Any]], max_concurrency: int = 8,
+                  max_retries: int = 3, retry_backoff: float = 1.0) -> List[ActionResult]:
+    """Awaits `call` for every action with at most `max_concurrency` in flight, retrying failures with backoff.
+
+    Results are returned in the same order as `actions`.
+    """
+    if not actions:
+        return []
+    return await _run_all(actions, call, max_concurrency, max_retries, retry_backoff)
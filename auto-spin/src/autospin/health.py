@@ -0,0 +1,96 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Set
+import httpx
+from pydantic import BaseModel
+from autospin.planner import parse_job_name
+from autospin.state import ProbeState
+
+
+class HealthConfig(BaseModel):
+    # Supports {node}, {job_id}, {job_name} and {slot}, e.g. "http://{node}:8080/health"
+    # or the metrics endpoint enabled with --enable-metrics: "http://{node}:8080/metrics"
+    url: str
+    timeout: float = 5.0
+    failure_threshold: int = 3
+    # jobs that started less than this many seconds ago are still loading weights
+    startup_grace: float = 1800.0
+    max_concurrency: int = 32
+
+
+def job_start_time(job: dict) -> Optional[float]:
+    start = (job.get("time") or {}).get("start")
+    return float(start) if start else None
+
+
+def probe_url(health: HealthConfig, job: dict) -> str:
+    return health.url.format(node=job.get("nodes", ""), job_id=job["jobId"], job_name=job["name"],
+                             slot=parse_job_name(job["name"])[0])
+
+
+async def _probe(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str, timeout: float) -> Optional[str]:
+    async with semaphore:
+        try:
+            response = await client.get(url, timeout=timeout)
+        except httpx.HTTPError as e:
+            return f"{type(e).__name__}: {e}"
+    if response.status_code != 200:
+        return f"HTTP {response.status_code}"
+    return None
+
+
+async def _probe_all(urls: Dict[str, str], health: HealthConfig) -> Dict[str, Optional[str]]:
+    semaphore = asyncio.Semaphore(max(1, health.max_concurrency))
+    async with httpx.AsyncClient() as client:
+        errors = await asyncio.gather(*[_probe(client, semaphore, url, health.timeout) for url in urls.values()])
+    return dict(zip(urls.keys(), errors))
+
+
+def probe_jobs(jobs: List[dict], health: HealthConfig) -> Dict[str, Optional[str]]:
+    """Probes every job once, returns the error per job id, None for the healthy ones."""
+    urls = {str(job["jobId"]): probe_url(health, job) for job in jobs}
+    if not urls:
+        return {}
+    return asyncio.run(_probe_all(urls, health))
+
+
+def check_health(jobs: List[dict], health: HealthConfig, probes: Dict[str, ProbeState],
+                 now: Optional[float] = None) -> Set[str]:
+    """Probes every running job past its startup grace period and updates `probes` in place.
+
+    Returns the ids of the jobs that failed `failure_threshold` consecutive probes.
+    State of jobs that are no longer active is dropped.
+    """
+    now = time.time() if now is None else now
+    active_ids = {str(job["jobId"]) for job in jobs}
+    for job_id in list(probes.keys()):
+        if job_id not in active_ids:
+            del probes[job_id]
+
+    ready = []
+    for job in jobs:
+        if job["status"]["state"] != "RUNNING":
+            continue
+        start = job_start_time(job)
+        if start is None:
+            # a job whose start time isn't reported yet may still be loading its weights
+            probe = probes.setdefault(str(job["jobId"]), ProbeState())
+            probe.running_since = now if probe.running_since is None else probe.running_since
+            start = probe.running_since
+        if now - start < health.startup_grace:
+            continue
+        ready.append(job)
+
+    unhealthy: Set[str] = set()
+    for job_id, error in probe_jobs(ready, health).items():
+        probe = probes.setdefault(job_id, ProbeState())
+        probe.last_probe = now
+        if error is None:
+            probe.consecutive_failures = 0
+            probe.last_error = ""
+            continue
+        probe.consecutive_failures += 1
+        probe.last_error = error
+        if probe.consecutive_failures >= health.failure_threshold:
+            unhealthy.add(job_id)
+    return unhealthy
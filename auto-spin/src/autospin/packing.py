@@ -0,0 +1,54 @@
+import re
+from typing import Dict, Hashable, List, Tuple
+from pydantic import BaseModel
+from autospin.scripts.jobctl import place_items
+
+GPUS_PER_NODE: int = 4
+BASE_PORT: int = 8080
+# libp2p ports of OCF, every additional server on a node listens on the next ones
+OCF_TCP_PORT: int = 43905
+OCF_UDP_PORT: int = 59820
+
+
+class PackItem(BaseModel):
+    model_id: str
+    instance: int
+    gpus: int
+
+
+class Bin(BaseModel):
+    group: Hashable
+    items: List[PackItem] = []
+    used: int = 0
+
+
+def place_models(items: List[Tuple[Hashable, PackItem]], gpus_per_node: int = GPUS_PER_NODE) -> List[Bin]:
+    """First-fit-decreasing placement of (group, item) pairs on nodes of `gpus_per_node` GPUs.
+
+    A node only hosts items of the same group (items sharing a container environment and
+    time limit). The placement itself is `place_items` of jobctl, shared with spin-model.
+    """
+    by_key = {(item.model_id, item.instance): item for _, item in items}
+    placement = place_items([(group, (item.model_id, item.instance), item.gpus) for group, item in items], gpus_per_node)
+    return [Bin(group=group, items=[by_key[key] for _, key, _ in packed], used=sum(gpus for _, _, gpus in packed))
+            for group, packed in placement]
+
+
+def gpu_slices(bin: Bin) -> List[str]:
+    """CUDA_VISIBLE_DEVICES of every item of a bin, in item order"""
+    slices, offset = [], 0
+    for item in bin.items:
+        slices.append(",".join(str(gpu) for gpu in range(offset, offset + item.gpus)))
+        offset += item.gpus
+    return slices
+
+
+def with_port(sub_process: str, port: int) -> str:
+    """Points the `--port` of a serving command at `port`"""
+    if re.search(r"--port[ =]\d+", sub_process):
+        return re.sub(r"--port([ =])\d+", lambda match: f"--port{match.group(1)}{port}", sub_process)
+    return f"{sub_process} --port {port}"
+
+
+def server_ports(index: int) -> Dict[str, int]:
+    return {"port": BASE_PORT + index, "ocf_tcp_port": OCF_TCP_PORT + index, "ocf_udp_port": OCF_UDP_PORT + index}
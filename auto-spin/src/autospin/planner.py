@@ -0,0 +1,129 @@
+import hashlib
+from typing import Dict, List, Optional, Set, Tuple
+from pydantic import BaseModel
+
+HASH_SEPARATOR: str = "@"
+HASH_LENGTH: int = 8
+# successors renewing a job before its time limit are named "<slot>@<hash>~<generation>"
+GENERATION_SEPARATOR: str = "~"
+
+
+class DesiredJob(BaseModel):
+    slot: str
+    model_id: str
+    instance: int
+    spec_hash: str
+    script: str
+    generation: int = 0
+    # ids of the models the job serves, several for pack jobs
+    models: List[str] = []
+
+    @property
+    def name(self) -> str:
+        name = f"{self.slot}{HASH_SEPARATOR}{self.spec_hash}"
+        return f"{name}{GENERATION_SEPARATOR}{self.generation}" if self.generation else name
+
+
+class ActiveJob(BaseModel):
+    name: str
+    job_id: str
+    state: str
+    slot: str
+    spec_hash: Optional[str] = None
+    generation: int = 0
+
+
+class PlanEntry(BaseModel):
+    slot: str
+    desired: Optional[DesiredJob] = None
+    active: List[ActiveJob] = []
+    reason: str = ""
+
+
+class Plan(BaseModel):
+    keep: List[PlanEntry] = []
+    start: List[PlanEntry] = []
+    replace: List[PlanEntry] = []
+    wait: List[PlanEntry] = []
+    cancel: List[PlanEntry] = []
+
+    def is_noop(self) -> bool:
+        return not (self.start or self.replace or self.cancel)
+
+
+def spec_hash(script: str) -> str:
+    return hashlib.sha256(script.encode()).hexdigest()[:HASH_LENGTH]
+
+
+def parse_job_name(name: str) -> Tuple[str, Optional[str]]:
+    """Splits a job name into its slot and spec hash, jobs submitted before hashing have no hash."""
+    slot, separator, job_hash = name.rpartition(HASH_SEPARATOR)
+    if not separator:
+        return name, None
+    return slot, job_hash.partition(GENERATION_SEPARATOR)[0]
+
+
+def parse_generation(name: str) -> int:
+    """Generation of a renewed job, 0 for the first job of a slot."""
+    _, separator, generation = name.rpartition(HASH_SEPARATOR)[2].partition(GENERATION_SEPARATOR)
+    return int(generation) if separator and generation.isdigit() else 0
+
+
+def index_active_jobs(jobs: List[dict], prefix: str) -> Dict[str, List[ActiveJob]]:
+    """Groups the active jobs owned by autospin by slot."""
+    by_slot: Dict[str, List[ActiveJob]] = {}
+    for item in jobs:
+        if not item["name"].startswith(prefix):
+            continue
+        slot, job_hash = parse_job_name(item["name"])
+        job = ActiveJob(name=item["name"], job_id=str(item["jobId"]), state=item["status"]["state"],
+                        slot=slot, spec_hash=job_hash, generation=parse_generation(item["name"]))
+        by_slot.setdefault(slot, []).append(job)
+    return by_slot
+
+
+def build_plan(desired: Dict[str, DesiredJob], active: Dict[str, List[ActiveJob]],
+               unhealthy: Optional[Set[str]] = None) -> Plan:
+    """Diffs desired jobs against active jobs, both indexed by slot, in linear time.
+
+    - keep: an active job runs the desired spec, a running one is preferred and duplicates of it are cancelled
+    - start: nothing is active for the slot
+    - replace: only jobs with an outdated spec or failing health probes (`unhealthy` job ids)
+      are active, the new job is submitted
+    - wait: the outdated jobs of a slot whose new job is still pending, they keep serving
+    - cancel: unhealthy jobs right away, outdated jobs once the new one is running, and active
+      jobs whose slot is no longer desired
+
+    Outdated jobs are only cancelled on a later cycle, so a failed or throttled submit never
+    takes a working replica down with nothing replacing it. Unhealthy jobs serve nothing, and
+    their replacement has the same name, which `--dependency=singleton` holds until they end.
+    """
+    unhealthy = unhealthy or set()
+    plan = Plan()
+    for slot, job in desired.items():
+        jobs = active.get(slot, [])
+        current = sorted((item for item in jobs if item.spec_hash == job.spec_hash and item.job_id not in unhealthy),
+                         key=lambda item: item.state != "RUNNING")
+        stale = [item for item in jobs if item.spec_hash != job.spec_hash or item.job_id in unhealthy]
+        failing = [item for item in stale if item.job_id in unhealthy]
+        outdated = [item for item in stale if item.job_id not in unhealthy]
+        if failing:
+            plan.cancel.append(PlanEntry(slot=slot, active=failing, reason="failing job"))
+        if current:
+            plan.keep.append(PlanEntry(slot=slot, desired=job, active=current[:1]))
+            if len(current) > 1:
+                plan.cancel.append(PlanEntry(slot=slot, active=current[1:], reason="duplicate"))
+            if outdated and current[0].state == "RUNNING":
+                plan.cancel.append(PlanEntry(slot=slot, active=outdated, reason="replaced job"))
+            elif outdated:
+                plan.wait.append(PlanEntry(slot=slot, desired=job, active=outdated, reason="replacement pending"))
+        elif stale:
+            reason = "unhealthy" if any(item.job_id in unhealthy for item in stale) else "spec changed"
+            plan.replace.append(PlanEntry(slot=slot, desired=job, active=stale, reason=reason))
+        else:
+            plan.start.append(PlanEntry(slot=slot, desired=job, reason="missing"))
+
+    for slot, jobs in active.items():
+        if slot not in desired:
+            plan.cancel.append(PlanEntry(slot=slot, active=jobs, reason="zombie"))
+    return plan
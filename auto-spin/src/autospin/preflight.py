@@ -0,0 +1,242 @@
+import json
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+import click
+import httpx
+from autospin.client import _cache_file, _read_cache, _write_cache
+from autospin.config import Config, ModelConfig, time_limit_seconds
+from autospin.executor import Action, execute
+from autospin.packing import GPUS_PER_NODE
+from autospin.scripts.jobctl import unknown_flags
+
+# longest time limit of a job per system, a longer time_limit is rejected by sbatch
+TIME_LIMITS: Dict[str, int] = {"bristen": 3600, "clariden": 24 * 3600}
+TP_FLAGS = re.compile(r"(?:--tp-size|--tp|--tensor-parallel-size)[ =](\d+)")
+# option docs of the engines, the same files `spin-model --sp-help/--vllm-help` shows, refetched weekly
+DOCS_URL = "https://raw.githubusercontent.com/swiss-ai/model-spinning/refs/heads/main"
+FLAG_DOCS: Dict[str, str] = {"sp": "sp-docs.txt", "vllm": "vllm-docs.txt"}
+DOCS_TTL: float = 7 * 24 * 3600
+
+
+def not_found(error: Exception) -> bool:
+    """Whether a Firecrest error says the path does not exist, any other error may go away on a retry."""
+    responses = getattr(error, "responses", None) or []
+    return (bool(responses) and responses[-1].status_code == 404) or "no such file" in str(error).lower()
+
+
+def docs_engine(sub_process: str) -> Optional[str]:
+    """Engine of a serving command whose option docs are known, None for the others (sglang)."""
+    words = sub_process.split()
+    if words[:2] == ["sp", "serve"]:
+        return "sp"
+    if any(word == "vllm" or word.startswith("vllm.") for word in words[:3]):
+        return "vllm"
+    return None
+
+
+def check_flags(model: ModelConfig, docs: Dict[str, Optional[str]]) -> List[Tuple[str, str]]:
+    """(level, message) of the options of `sub_process` and `model_args` the engine docs don't list.
+
+    Unknown sp options are errors, the vllm docs only cover its engine arguments so unknown vllm
+    options are warnings.
+    """
+    engine = docs_engine(model.sub_process)
+    if engine is None or not docs.get(engine):
+        return []
+    findings = []
+    for flag, close in unknown_flags(f"{model.sub_process} {model.model_args}", docs[engine], engine):
+        hint = f", did you mean {close}?" if close else ""
+        findings.append(("error" if engine == "sp" else "warning", f"{engine} has no option {flag}{hint}"))
+    return findings
+
+
+async def fetch_docs(config: Config, engines: List[str]) -> Dict[str, Optional[str]]:
+    """Option docs per engine, cached in `cache_dir` for DOCS_TTL seconds, a stale copy when GitHub can't be reached."""
+    docs: Dict[str, Optional[str]] = {}
+    for engine in engines:
+        path = _cache_file(config, "docs", FLAG_DOCS[engine])
+        cached = _read_cache(path) or {}
+        if time.time() - cached.get("fetched", 0) < DOCS_TTL:
+            docs[engine] = cached.get("text")
+            continue
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as http:
+                response = await http.get(f"{DOCS_URL}/{FLAG_DOCS[engine]}")
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            click.echo(f"⚠️ preflight: {FLAG_DOCS[engine]} could not be fetched, {engine} flags are checked against the cached copy if any ({e})")
+            docs[engine] = cached.get("text")
+            continue
+        docs[engine] = response.text
+        try:
+            _write_cache(path, {"text": response.text, "fetched": time.time()})
+        except OSError:
+            pass
+    return docs
+
+
+def tp_size(sub_process: str) -> int:
+    match = TP_FLAGS.search(sub_process)
+    return int(match.group(1)) if match else 1
+
+
+def environment_path(config: Config, environment: str) -> str:
+    return environment if environment.startswith("/") else f"/users/{config.user_id}/.edf/{environment}.toml"
+
+
+def parse_environment(text: str) -> dict:
+    """Image and mount sources of an EDF environment TOML, or the reason it can't be parsed."""
+    try:
+        import tomllib
+    except ImportError:
+        return {}
+    try:
+        environment = tomllib.loads(text)
+    except ValueError as e:
+        return {"error": str(e)}
+    image = environment.get("image")
+    return {"image": image if isinstance(image, str) else None,
+            "mounts": [mount.split(":")[0] for mount in environment.get("mounts", []) if isinstance(mount, str)]}
+
+
+def parse_model_config(text: str) -> dict:
+    try:
+        config = json.loads(text)
+        return {"heads": config.get("text_config", config).get("num_attention_heads")}
+    except (ValueError, AttributeError) as e:
+        return {"error": str(e)}
+
+
+def check_model(config: Config, model: ModelConfig, facts: Dict[str, dict], missing: Dict[str, str]) -> List[str]:
+    """Problems of one model that would make its jobs fail after waiting in the queue."""
+    errors = []
+    path = environment_path(config, model.environment)
+    if path in missing:
+        errors.append(f"environment {path} is not readable: {missing[path]}")
+    elif "error" in facts.get(path, {}):
+        errors.append(f"environment {path} can't be parsed: {facts[path]['error']}")
+    else:
+        image = facts.get(path, {}).get("image") or ""
+        sources = [image] if image.startswith("/") else []
+        sources += [source for source in facts.get(path, {}).get("mounts", []) if source.startswith("/")]
+        errors += [f"{source} of environment {path} is not readable: {missing[source]}" for source in sources if source in missing]
+
+    tp = tp_size(model.sub_process)
+    if model.model_path.startswith("/"):
+        path = f"{model.model_path}/config.json"
+        heads = facts.get(path, {}).get("heads")
+        if path in missing:
+            errors.append(f"checkpoint config {path} is not readable: {missing[path]}")
+        elif "error" in facts.get(path, {}):
+            errors.append(f"checkpoint config {path} can't be parsed: {facts[path]['error']}")
+        elif heads and heads % tp:
+            errors.append(f"tp size {tp} does not divide the {heads} attention heads of {model.model_path}")
+    gpus = model.gpus if model.packed() else GPUS_PER_NODE * model.nodes
+    if tp > gpus:
+        errors.append(f"tp size {tp} needs more than the {gpus} GPUs of an instance")
+
+    seconds, limit = time_limit_seconds(model.time_limit), TIME_LIMITS.get(config.system_name)
+    if seconds is None:
+        errors.append(f"time_limit {model.time_limit} can't be parsed")
+    elif limit is not None and seconds > limit:
+        errors.append(f"time_limit {model.time_limit} exceeds the {limit // 3600}h limit of {config.system_name}")
+    return errors
+
+
+async def preflight(client, config: Config) -> Dict[str, List[str]]:
+    """Errors per model id of the environments, checkpoints, tp sizes, engine flags and time limits of the `models:` map.
+
+    Only paths Firecrest reports as not found count as missing, other failures are retried like any
+    request and, once the retries are spent, the checks depending on the path are skipped for this run.
+    Existing paths are not stat'ed again for `preflight_ttl` seconds, and what is parsed from the
+    environment TOMLs and checkpoint config.json files is cached on disk per (path, mtime), so a run
+    within the TTL sends no request at all.
+    """
+    cache_path = _cache_file(config, "preflight", config.firecrest_uri, config.system_name)
+    cache = _read_cache(cache_path) or {}
+    now = time.time()
+
+    async def stat(action: Action):
+        return await client.stat(system_name=config.system_name, path=action.job_name)
+
+    async def view(action: Action):
+        return await client.view(system_name=config.system_name, path=action.job_name)
+
+    missing: Dict[str, str] = {}
+    unknown: Dict[str, str] = {}
+
+    async def lookup(paths: List[str], call) -> Dict[str, object]:
+        """Responses of `call` per found path, the others are recorded as missing or unknown."""
+        async def found(action: Action):
+            try:
+                return True, await call(action)
+            except Exception as e:
+                if not not_found(e):
+                    raise
+                return False, str(e)
+
+        found_paths = {}
+        for result in await execute([Action(kind=call.__name__, job_name=path) for path in paths], found,
+                                    max_concurrency=config.max_concurrency, max_retries=config.max_retries,
+                                    retry_backoff=config.retry_backoff):
+            path = result.action.job_name
+            if not result.ok:
+                unknown[path] = result.error
+            elif result.response[0]:
+                found_paths[path] = result.response[1]
+            else:
+                missing[path] = result.response[1]
+        return found_paths
+
+    # models without instances have no jobs to hold
+    models = {model_id: model for model_id, model in config.models.items() if max(model.instances, model.instance_bounds()[1]) > 0}
+    parsers = {}
+    for model in models.values():
+        parsers[environment_path(config, model.environment)] = parse_environment
+        if model.model_path.startswith("/"):
+            parsers[f"{model.model_path}/config.json"] = parse_model_config
+    # entries of paths no longer in the config and stats older than the TTL are dropped
+    files, stats = cache.get("files", {}), cache.get("stats", {})
+    fresh = {path: entry for path, entry in stats.items() if now - entry.get("checked", 0) < config.preflight_ttl}
+    changed = bool(files.keys() - parsers.keys()) or len(fresh) != len(stats)
+    files, stats = {path: entry for path, entry in files.items() if path in parsers}, fresh
+
+    for path, response in (await lookup([path for path in parsers if path not in stats], stat)).items():
+        stats[path] = {"mtime": response["mtime"], "checked": now}
+        changed = True
+    mtimes = {path: stats[path]["mtime"] for path in parsers if path in stats}
+
+    stale = [path for path, mtime in mtimes.items() if files.get(path, {}).get("mtime") != mtime]
+    for path, text in (await lookup(stale, view)).items():
+        files[path] = {"mtime": mtimes[path], "facts": parsers[path](text)}
+        changed = True
+
+    facts = {path: files[path]["facts"] for path in parsers if path in files and path not in missing and path not in unknown}
+    sources = set()
+    for path, parser in parsers.items():
+        if parser is parse_environment and path in facts:
+            image = facts[path].get("image") or ""
+            sources.update([image] if image.startswith("/") else [])
+            sources.update(source for source in facts[path].get("mounts", []) if source.startswith("/"))
+    for path, response in (await lookup([source for source in sorted(sources) if source not in stats], stat)).items():
+        stats[path] = {"mtime": response["mtime"], "checked": now}
+        changed = True
+
+    for path, error in unknown.items():
+        click.echo(f"⚠️ preflight: {path} could not be checked, the checks depending on it are skipped ({error})")
+    if changed:
+        try:
+            _write_cache(cache_path, {"files": files, "stats": stats})
+        except OSError:
+            pass
+
+    errors = {model_id: check_model(config, model, facts, missing) for model_id, model in models.items()}
+    docs = await fetch_docs(config, sorted({docs_engine(model.sub_process) for model in models.values()} - {None}))
+    for model_id, model in models.items():
+        for level, message in check_flags(model, docs):
+            if level == "error":
+                errors[model_id].append(message)
+            else:
+                click.echo(f"⚠️ model: {model_id} {message}")
+    return {model_id: model_errors for model_id, model_errors in errors.items() if model_errors}
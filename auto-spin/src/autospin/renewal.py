@@ -0,0 +1,111 @@
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from pydantic import BaseModel
+from autospin.health import HealthConfig, job_start_time, probe_jobs
+from autospin.planner import ActiveJob, DesiredJob
+from autospin.state import RenewalState, State
+
+
+class RenewalConfig(BaseModel):
+    # a successor is submitted when a job has less than lead_margin * the learned startup time left
+    lead_margin: float = 1.5
+    min_lead: float = 900.0
+    # startup time (submission to first healthy probe) assumed until one was observed for a model
+    default_startup: float = 1800.0
+    # weight of the newest observation in the exponential moving average of the startup time
+    smoothing: float = 0.3
+
+
+class RenewalPlan(BaseModel):
+    submit: List[DesiredJob] = []
+    # predecessors whose successor is healthy
+    cancel: List[ActiveJob] = []
+    # (job name, successor name, seconds left) of the renewals started this cycle
+    started: List[Tuple[str, str, float]] = []
+    # (job name, successor name, startup seconds) of the renewals completed this cycle
+    completed: List[Tuple[str, str, float]] = []
+
+
+def job_end_time(job: dict) -> Optional[float]:
+    """Time at which a running job hits its time limit, None when Slurm doesn't report it."""
+    times = job.get("time") or {}
+    start = job_start_time(job)
+    if times.get("end") and (start is None or float(times["end"]) > start):
+        return float(times["end"])
+    if start is not None and times.get("limit"):
+        # the time limit is reported in minutes
+        return start + float(times["limit"]) * 60
+    return None
+
+
+def lead_time(renewal: RenewalConfig, startup: Optional[float]) -> float:
+    return max(renewal.min_lead, renewal.lead_margin * (renewal.default_startup if startup is None else startup))
+
+
+def successor_job(job: DesiredJob, generation: int) -> DesiredJob:
+    successor = job.model_copy(update={"generation": generation})
+    # the name is the only part of the script that differs between generations
+    successor.script = job.script.replace(job.name, successor.name)
+    return successor
+
+
+def plan_renewals(desired: Dict[str, DesiredJob], active: Dict[str, List[ActiveJob]], jobs: List[dict],
+                  renewal: RenewalConfig, health: HealthConfig, state: State,
+                  unhealthy: Optional[Set[str]] = None, now: Optional[float] = None) -> RenewalPlan:
+    """Submits a successor for every job about to hit its time limit and retires the job once it is healthy.
+
+    `active` is updated in place so that the diff against the desired jobs sees a single job per
+    renewed slot: the predecessor while its successor starts, the successor afterwards.
+    Renewals are tracked in `state`, together with the learned startup time per model.
+    """
+    now = time.time() if now is None else now
+    unhealthy = unhealthy or set()
+    jobs_by_id = {str(item["jobId"]): item for item in jobs}
+    plan = RenewalPlan()
+
+    # successors of the renewals in progress, the ones that are running get probed in one batch
+    successors: Dict[str, ActiveJob] = {}
+    for slot, entry in list(state.renewals.items()):
+        job = desired.get(slot)
+        successor = next((item for item in active.get(slot, []) if item.name == entry.successor), None)
+        if job is None or successor is None or successor.spec_hash != job.spec_hash:
+            # the successor died or the spec changed, the slot is renewed again if needed
+            del state.renewals[slot]
+            continue
+        successors[slot] = successor
+    errors = probe_jobs([jobs_by_id[item.job_id] for item in successors.values() if item.state == "RUNNING"], health)
+
+    for slot, job in desired.items():
+        jobs_of_slot = active.get(slot, [])
+        if slot in successors:
+            entry, successor = state.renewals[slot], successors[slot]
+            predecessors = [item for item in jobs_of_slot if item.job_id == entry.predecessor]
+            if successor.job_id in errors and errors[successor.job_id] is None:
+                startup = now - entry.submitted
+                previous = state.startup.get(job.model_id)
+                state.startup[job.model_id] = startup if previous is None else \
+                    renewal.smoothing * startup + (1 - renewal.smoothing) * previous
+                plan.cancel += predecessors
+                plan.completed.append((predecessors[0].name if predecessors else entry.predecessor, successor.name, startup))
+                del state.renewals[slot]
+                active[slot] = [item for item in jobs_of_slot if item.job_id != entry.predecessor]
+            elif predecessors and predecessors[0].job_id in unhealthy:
+                # no point in keeping a failing predecessor, the successor takes over its slot
+                plan.cancel += predecessors
+                active[slot] = [item for item in jobs_of_slot if item.job_id != entry.predecessor]
+            elif predecessors:
+                active[slot] = [item for item in jobs_of_slot if item.job_id != successor.job_id]
+            continue
+
+        if len(jobs_of_slot) != 1 or jobs_of_slot[0].spec_hash != job.spec_hash or jobs_of_slot[0].state != "RUNNING" \
+                or jobs_of_slot[0].job_id in unhealthy:
+            continue
+        current = jobs_of_slot[0]
+        end = job_end_time(jobs_by_id[current.job_id])
+        if end is None or end - now > lead_time(renewal, state.startup.get(job.model_id)):
+            continue
+        successor = successor_job(job, current.generation + 1)
+        plan.submit.append(successor)
+        plan.started.append((current.name, successor.name, end - now))
+        state.renewals[slot] = RenewalState(predecessor=current.job_id, successor=successor.name, submitted=now)
+    return plan
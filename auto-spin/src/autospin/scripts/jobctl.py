@@ -0,0 +1,698 @@
+#!/usr/bin/env python3
+"""In-job helper of autospin and spin-model jobs.
+
+The autospin job template writes this file next to the job script, spin-model jobs run it
+from the repository checkout. It runs inside the allocation, so it must only depend on the
+standard library. spin-model and autospin also import it for the parsers and summaries of
+what their jobs record (timelines, telemetry), for the placement of packed models and for the
+engine flag check of their pre-flight checks.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 64 * 1024 * 1024
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth", ".gguf")
+GPU_QUERY = "nvidia-smi --query-gpu=index,utilization.gpu,memory.used,memory.total --format=csv,noheader,nounits"
+# Prometheus gauges of the engines, sglang only exports them with --enable-metrics
+ENGINE_GAUGES = {
+    "running": ("sglang:num_running_reqs", "vllm:num_requests_running"),
+    "queued": ("sglang:num_queue_reqs", "vllm:num_requests_waiting"),
+    "kv_usage": ("sglang:token_usage", "vllm:gpu_cache_usage_perc", "vllm:kv_cache_usage_perc"),
+    "gen_throughput": ("sglang:gen_throughput",),
+}
+# API server flags of `vllm serve`, vllm-docs.txt only lists the engine arguments
+VLLM_SERVER_FLAGS = {"--host", "--port", "--api-key", "--uvicorn-log-level", "--chat-template", "--response-role",
+                     "--enable-auto-tool-choice", "--tool-call-parser", "--reasoning-parser", "--root-path",
+                     "--ssl-keyfile", "--ssl-certfile", "--allowed-origins", "--middleware", "--lora-modules",
+                     "--disable-log-requests", "--disable-frontend-multiprocessing", "--enable-request-id-headers"}
+# seconds between the heartbeats of a router backend, and after which a backend without one is dropped
+BACKEND_HEARTBEAT = 15.0
+BACKEND_TTL = 60.0
+# p95 utilization below which a GPU counts as idle, and the whole job as over-provisioned
+IDLE_UTIL = 5.0
+LOW_UTIL = 30.0
+# peak fraction of the KV cache in use below which the model could run with less memory
+LOW_KV_USAGE = 0.25
+
+
+def log(msg):
+    print(f"[jobctl] {msg}", file=sys.stderr, flush=True)
+
+
+def _list_files(root):
+    files = []
+    for directory, _, names in os.walk(root):
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                files.append(path)
+    return files
+
+
+def _chunks(size, chunk_size):
+    return [(offset, min(chunk_size, size - offset)) for offset in range(0, size, chunk_size)]
+
+
+def _warm_chunk(path, offset, length):
+    buffer = bytearray(min(length, 8 * 1024 * 1024))
+    with open(path, "rb", buffering=0) as f:
+        fd = f.fileno()
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+        done = 0
+        while done < length:
+            view = memoryview(buffer)[:min(len(buffer), length - done)]
+            read = os.preadv(fd, [view], offset + done)
+            if read <= 0:
+                break
+            done += read
+    return done
+
+
+def _copy_chunk(src, dst, offset, length):
+    with open(src, "rb", buffering=0) as fin, open(dst, "r+b", buffering=0) as fout:
+        done = 0
+        while done < length:
+            data = os.pread(fin.fileno(), min(8 * 1024 * 1024, length - done), offset + done)
+            if not data:
+                break
+            os.pwrite(fout.fileno(), data, offset + done)
+            done += len(data)
+    return done
+
+
+def _copy_file(src, dst):
+    shutil.copyfile(src, dst)
+    return os.path.getsize(dst)
+
+
+def prestage(src, mode, dest, threads, chunk_size=CHUNK_SIZE):
+    """Warms the page cache with (mode "warm") or copies to `dest` (mode "copy") the files of `src`.
+
+    Large files are split in chunks read by a thread pool. Returns the path to serve from
+    and the number of bytes staged.
+    """
+    files = _list_files(src)
+    total = 0
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = []
+        if mode == "warm":
+            for path in files:
+                if path.endswith(WEIGHT_SUFFIXES):
+                    futures += [pool.submit(_warm_chunk, path, offset, length)
+                                for offset, length in _chunks(os.path.getsize(path), chunk_size)]
+            staged = src
+        else:
+            staged = os.path.join(dest, os.path.basename(os.path.normpath(src)))
+            if os.path.isdir(staged):
+                return staged, 0
+            # copy into a scratch directory that only becomes `staged` once complete
+            work = f"{staged}.partial"
+            shutil.rmtree(work, ignore_errors=True)
+            for path in files:
+                target = os.path.join(work, os.path.relpath(path, src))
+                size = os.path.getsize(path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if size < chunk_size:
+                    futures.append(pool.submit(_copy_file, path, target))
+                    continue
+                with open(target, "wb") as f:
+                    f.truncate(size)
+                futures += [pool.submit(_copy_chunk, path, target, offset, length)
+                            for offset, length in _chunks(size, chunk_size)]
+        for future in futures:
+            total += future.result()
+    if mode == "copy":
+        os.rename(work, staged)
+    return staged, total
+
+
+def cmd_prestage(args):
+    start = time.monotonic()
+    try:
+        staged, total = prestage(args.path, args.mode, args.dest, args.threads)
+    except OSError as e:
+        log(f"prestage of {args.path} failed, serving from the original path: {e}")
+        print(args.path)
+        return 0
+    elapsed = max(time.monotonic() - start, 1e-6)
+    log(f"prestage {args.mode}: {total / 1e9:.1f} GB in {elapsed:.1f}s ({total / elapsed / 1e9:.2f} GB/s) -> {staged}")
+    print(staged)
+    return 0
+
+
+def cmd_wait_ready(args):
+    deadline = time.monotonic() + args.timeout
+    while not _answers(args.url):
+        if time.monotonic() > deadline:
+            log(f"server did not answer on {args.url} within {args.timeout:.0f}s")
+            return 1
+        time.sleep(args.interval)
+    if args.timeline:
+        with open(args.timeline, "a") as f:
+            f.write(f"server_ready {time.time():.6f}\n")
+    log("server is ready")
+    # spin-model status reads the readiness of a job from this line of its log
+    print("[spin-phase] server_ready", flush=True)
+    return 0
+
+
+def _answers(url, timeout=5):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+def read_corpus(path):
+    """Prefixes of a warm-up corpus, one per line: JSON objects with "messages" or "prompt", JSON strings or plain text."""
+    prefixes = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = line
+            if isinstance(entry, str):
+                entry = {"prompt": entry}
+            if isinstance(entry, dict) and ("messages" in entry or "prompt" in entry):
+                prefixes.append(entry)
+    return prefixes
+
+
+def _replay(base_url, model, prefix, timeout):
+    """Seconds a single-token request for `prefix` takes, which is dominated by its prefill."""
+    if "messages" in prefix:
+        path, body = "/v1/chat/completions", {"messages": prefix["messages"]}
+    else:
+        path, body = "/v1/completions", {"prompt": prefix["prompt"]}
+    body.update(model=model, max_tokens=1, temperature=0)
+    request = urllib.request.Request(base_url.rstrip("/") + path, data=json.dumps(body).encode(),
+                                     headers={"Content-Type": "application/json"})
+    start = time.monotonic()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+    return time.monotonic() - start
+
+
+def cmd_warmup(args):
+    # a failed warm-up only costs the first users their prefill, it never keeps the server from serving
+    try:
+        prefixes = read_corpus(args.corpus)
+        with urllib.request.urlopen(args.url.rstrip("/") + "/v1/models", timeout=10) as response:
+            model = json.load(response)["data"][0]["id"]
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        log(f"warm-up skipped: {e}")
+        prefixes = []
+
+    def replay(prefix):
+        try:
+            cold = _replay(args.url, model, prefix, args.timeout)
+            return cold, _replay(args.url, model, prefix, args.timeout)
+        except OSError as e:
+            return e
+
+    start = time.monotonic()
+    saved = 0.0
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        for index, result in enumerate(pool.map(replay, prefixes)):
+            if isinstance(result, OSError):
+                log(f"warm-up prefix {index} failed: {result}")
+                continue
+            cold, warm = result
+            saved += cold - warm
+            log(f"warm-up prefix {index}: cold {cold:.2f}s, warm {warm:.2f}s, prefill saved {cold - warm:.2f}s")
+    if prefixes:
+        log(f"warm-up of {len(prefixes)} prefixes took {time.monotonic() - start:.1f}s, saves {saved:.2f}s of prefill per replay of the corpus")
+    if args.timeline:
+        with open(args.timeline, "a") as f:
+            f.write(f"warmup_done {time.time():.6f}\n")
+    return 0
+
+
+def _stop_process(process, grace=30):
+    """Terminates the process group of `process`, killed after `grace` seconds."""
+    if process is None or process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(grace)
+    except ProcessLookupError:
+        return
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def cmd_supervise(args):
+    """Starts the engine, registers it with OCF once it answers and restarts it inside the allocation when it
+    crashes or stops answering. OCF is stopped while the engine is down so that no traffic is routed to it.
+    SIGUSR1, sent ahead of the time limit, drains the engine: OCF is stopped, in-flight requests get up to
+    --drain-timeout seconds to finish and the engine is stopped without a restart."""
+    stopping, draining = [], []
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGUSR1, lambda signum, frame: draining.append(signum))
+
+    def sleep(seconds):
+        deadline = time.monotonic() + seconds
+        while not stopping and not draining and time.monotonic() < deadline:
+            time.sleep(min(1.0, deadline - time.monotonic()))
+
+    health_url = args.url.rstrip("/") + args.health_path if args.url else None
+    restarts, backoff, downtime, down_since, first_start = 0, args.backoff, 0.0, None, True
+    while not stopping and not draining:
+        # own session, so the engine and everything it spawns are stopped as a group
+        engine = subprocess.Popen(args.serve, shell=True, start_new_session=True)
+        log(f"engine started (pid {engine.pid})")
+        started = time.monotonic()
+        while not stopping and not draining and engine.poll() is None and health_url and not _answers(health_url):
+            if time.monotonic() - started > args.startup_timeout:
+                break
+            sleep(args.interval)
+
+        ocf, serving = None, False
+        if stopping or draining:
+            reason = None
+        elif engine.poll() is not None:
+            reason = f"exited with code {engine.returncode} while starting"
+        elif health_url and not _answers(health_url):
+            reason = f"not ready after {args.startup_timeout:.0f}s"
+        else:
+            serving = True
+            if first_start and args.timeline:
+                with open(args.timeline, "a") as f:
+                    f.write(f"server_ready {time.time():.6f}\n")
+            first_start = False
+            if down_since is not None:
+                downtime += time.time() - down_since
+                log(f"engine is back after restart {restarts}, down for {time.time() - down_since:.0f}s ({downtime:.0f}s in total)")
+                down_since = None
+            else:
+                log(f"engine is ready after {time.monotonic() - started:.0f}s")
+            if args.warmup_corpus and health_url:
+                # the prefix cache of a restarted engine is cold again
+                cmd_warmup(argparse.Namespace(url=args.url, corpus=args.warmup_corpus, concurrency=args.warmup_concurrency,
+                                              timeline=args.timeline if restarts == 0 else None, timeout=300))
+            if args.announce and args.url:
+                announce_backend(args.announce, args.url)
+            ocf = subprocess.Popen(args.ocf, shell=True, start_new_session=True) if args.ocf else None
+
+            healthy_since, failures, reason = time.monotonic(), 0, None
+            heartbeat = time.monotonic()
+            while not stopping and not draining:
+                if engine.poll() is not None:
+                    reason = f"exited with code {engine.returncode}"
+                    break
+                if health_url and not _answers(health_url):
+                    failures += 1
+                    if failures >= args.failure_threshold:
+                        reason = f"failed {failures} consecutive health probes"
+                        break
+                else:
+                    failures = 0
+                if ocf is not None and ocf.poll() is not None:
+                    log(f"OCF exited with code {ocf.returncode}, registering again")
+                    ocf = subprocess.Popen(args.ocf, shell=True, start_new_session=True)
+                if time.monotonic() - healthy_since > args.stable_after:
+                    backoff = args.backoff
+                if args.announce and args.url and time.monotonic() - heartbeat >= BACKEND_HEARTBEAT:
+                    announce_backend(args.announce, args.url)
+                    heartbeat = time.monotonic()
+                sleep(args.interval)
+
+        # unregister first, so that no traffic is routed to the engine while it is down
+        _stop_process(ocf)
+        if args.announce and args.url and serving:
+            withdraw_backend(args.announce, args.url)
+        # a drain signal during startup stops the engine right away, it has no requests to finish
+        if draining and serving and reason is None and not stopping:
+            _drain(engine, args.url, args.drain_timeout, stopping)
+        _stop_process(engine)
+        if stopping or draining:
+            break
+        if down_since is None:
+            down_since = time.time()
+        if restarts >= args.max_restarts:
+            log(f"engine {reason}, giving up after {restarts} restarts")
+            return 1
+        restarts += 1
+        log(f"engine {reason}, restart {restarts}/{args.max_restarts} in {backoff:.0f}s")
+        sleep(backoff)
+        backoff = min(backoff * 2, args.max_backoff)
+
+    log(f"stopping: {restarts} restarts, {downtime:.0f}s of downtime")
+    return 0
+
+
+def _drain(engine, url, timeout, stopping):
+    # without metrics in-flight requests get the whole window, ranks without a URL wait for their engine to exit
+    log(f"draining for at most {timeout:.0f}s")
+    started = time.monotonic()
+    in_flight = None
+    while not stopping and engine.poll() is None and time.monotonic() - started < timeout:
+        gauges = _metrics(url) if url else {}
+        if "running" in gauges:
+            in_flight = gauges["running"] + gauges.get("queued", 0)
+            if not in_flight:
+                break
+        time.sleep(2.0)
+    left = f", {in_flight:.0f} requests still in flight" if in_flight else ""
+    log(f"drained after {time.monotonic() - started:.0f}s{left}")
+
+
+def _backend(url):
+    # the URL other nodes reach a local server at
+    parsed = urllib.parse.urlsplit(url)
+    return f"{parsed.scheme}://{socket.gethostname()}:{parsed.port or 80}"
+
+
+def parse_backends(text):
+    """Heartbeat time per backend URL of a router backends file, None for URLs listed without one."""
+    backends = {}
+    for line in text.splitlines():
+        url, _, heartbeat = line.strip().partition(" ")
+        if url:
+            try:
+                backends[url] = float(heartbeat) if heartbeat.strip() else None
+            except ValueError:
+                backends[url] = None
+    return backends
+
+
+def live_backends(text, ttl=BACKEND_TTL, now=None):
+    """URLs of a router backends file whose heartbeat is at most `ttl` seconds old, or that have none."""
+    now = time.time() if now is None else now
+    return [url for url, heartbeat in parse_backends(text).items() if heartbeat is None or now - heartbeat <= ttl]
+
+
+def _update_backends(path, backend, heartbeat):
+    # replicas rewrite the file concurrently: a write may revert the heartbeat of another replica or lose a
+    # line it just added, both are repaired by that replica's next heartbeat long before the entry expires
+    try:
+        with open(path) as f:
+            text = f.read()
+    except OSError:
+        text = ""
+    now = time.time()
+    backends = {url: beat for url, beat in parse_backends(text).items() if beat is None or now - beat <= BACKEND_TTL}
+    backends.pop(backend, None)
+    if heartbeat is not None:
+        backends[backend] = heartbeat
+    tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        f.writelines(f"{url}\n" if beat is None else f"{url} {beat:.0f}\n" for url, beat in backends.items())
+    os.replace(tmp_path, path)
+
+
+def announce_backend(path, url):
+    """Adds a local server to the backends file of a `spin-model router`, or renews its heartbeat.
+
+    Entries expire BACKEND_TTL seconds after their last heartbeat, so the router stops sending requests
+    to replicas whose job crashed or was canceled. Expired entries are dropped from the file on every write.
+    """
+    _update_backends(path, _backend(url), time.time())
+
+
+def withdraw_backend(path, url):
+    """Removes a local server from a router backends file, so that the router sends it no new requests."""
+    _update_backends(path, _backend(url), None)
+
+
+def parse_gpu_query(text):
+    gpus = []
+    for line in text.splitlines():
+        fields = [field.strip() for field in line.split(",")]
+        if len(fields) != 4:
+            continue
+        try:
+            gpus.append((int(fields[0]), float(fields[1]), float(fields[2]), float(fields[3])))
+        except ValueError:
+            continue
+    return [gpu[1:] for gpu in sorted(gpus)]
+
+
+def parse_prometheus(text):
+    """Values of the Prometheus text format, samples of a metric with different labels are summed."""
+    values = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "{" in line:
+            name, rest = line[:line.index("{")], line[line.rindex("}") + 1:]
+        else:
+            name, _, rest = line.partition(" ")
+        try:
+            value = float(rest.split()[0])
+        except (ValueError, IndexError):
+            continue
+        if value == value:
+            values[name] = values.get(name, 0.0) + value
+    return values
+
+
+def engine_gauges(text):
+    values = parse_prometheus(text)
+    gauges = {}
+    for gauge, names in ENGINE_GAUGES.items():
+        for name in names:
+            if name in values:
+                gauges[gauge] = round(values[name], 4)
+                break
+    return gauges
+
+
+def _host_rss_mb():
+    uid = str(os.getuid())
+    total = 0
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                status = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        if status.get("Uid", "").split()[:1] == [uid] and "VmRSS" in status:
+            total += int(status["VmRSS"].split()[0])
+    return round(total / 1024)
+
+
+def _metrics(url, timeout=5):
+    try:
+        with urllib.request.urlopen(f"{url.rstrip('/')}/metrics", timeout=timeout) as response:
+            return engine_gauges(response.read().decode())
+    except (urllib.error.URLError, OSError, ValueError):
+        return {}
+
+
+def sample(gpu_source, urls, timeout=5):
+    try:
+        gpus = parse_gpu_query(subprocess.run(gpu_source, shell=True, capture_output=True, text=True, timeout=timeout).stdout)
+    except (OSError, subprocess.TimeoutExpired):
+        gpus = []
+    return {"t": round(time.time(), 1),
+            "util": [util for util, _, _ in gpus],
+            "mem": [used for _, used, _ in gpus],
+            "mem_total": [total for _, _, total in gpus],
+            "rss_mb": _host_rss_mb(),
+            "engine": [_metrics(url, timeout) for url in urls]}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize_telemetry(samples, resize_flag="try --tp-size {}"):
+    """Utilization, memory and KV cache peaks of the telemetry samples of one job, with right-sizing flags.
+
+    `resize_flag` formats the suggested GPU count of an over-provisioned job, None without samples.
+    """
+    samples = [sample for sample in samples if sample.get("util")]
+    if not samples:
+        return None
+    gpus = max(len(sample["util"]) for sample in samples)
+    per_gpu = [[sample["util"][i] for sample in samples if i < len(sample["util"])] for i in range(gpus)]
+    utils = [util for sample in samples for util in sample["util"]]
+    kv = [engine["kv_usage"] for sample in samples for engine in sample.get("engine", []) if "kv_usage" in engine]
+    summary = {
+        "samples": len(samples),
+        "duration": samples[-1]["t"] - samples[0]["t"],
+        "gpus": gpus,
+        "util_mean": sum(utils) / len(utils),
+        "util_p95": percentile(utils, 95),
+        "gpu_util_p95": [percentile(values, 95) for values in per_gpu],
+        "mem_peak": max(max(sample["mem"]) for sample in samples if sample.get("mem")),
+        "mem_total": max(max(sample["mem_total"]) for sample in samples if sample.get("mem_total")),
+        "kv_peak": max(kv) if kv else None,
+        "running_peak": max(sum(engine.get("running", 0) for engine in sample.get("engine", [])) for sample in samples),
+        "rss_peak": max(sample.get("rss_mb", 0) for sample in samples),
+    }
+    # engines preallocate the KV cache, so memory.used is always high and the KV usage gauge is the real demand
+    flags = []
+    idle = [str(i) for i, util in enumerate(summary["gpu_util_p95"]) if util < IDLE_UTIL]
+    if idle and len(idle) < gpus:
+        flags.append(f"GPUs {','.join(idle)} idle")
+    if summary["util_p95"] < LOW_UTIL:
+        flags.append(f"p95 GPU util {summary['util_p95']:.0f}%")
+    if summary["kv_peak"] is not None and summary["kv_peak"] < LOW_KV_USAGE:
+        flags.append(f"KV cache peak {summary['kv_peak']:.0%}")
+    if gpus > 1 and summary["util_p95"] < LOW_UTIL:
+        flags.append(resize_flag.format(gpus // 2))
+    summary["flags"] = flags
+    return summary
+
+
+def parse_timeline(text):
+    """Parses '<phase> <epoch>' lines, keeping the first occurrence of every phase."""
+    markers = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) != 2:
+            continue
+        try:
+            markers.setdefault(parts[0], float(parts[1]))
+        except ValueError:
+            continue
+    return markers
+
+
+def phase_durations(markers):
+    """Duration of every phase, measured from the previous marker in time."""
+    ordered = sorted(markers.items(), key=lambda item: item[1])
+    durations = {phase: t - ordered[i - 1][1] for i, (phase, t) in enumerate(ordered) if i > 0}
+    if "submitted" in markers and "server_ready" in markers:
+        durations["total"] = markers["server_ready"] - markers["submitted"]
+    return durations
+
+
+def place_items(items, gpus_per_node):
+    """First-fit-decreasing placement of (group, (model_id, instance), gpus) items on nodes of `gpus_per_node` GPUs.
+
+    A node only hosts items of the same group. The order of the result is deterministic for the same
+    input, so the content of a node only changes when the packed models change. Returns a list of
+    (group, [items]).
+    """
+    nodes = []
+    for item in sorted(items, key=lambda item: (-item[2], str(item[0]), item[1])):
+        group, (model_id, _), gpus = item
+        if gpus > gpus_per_node:
+            raise ValueError(f"{model_id} needs {gpus} GPUs, a node only has {gpus_per_node}")
+        for node in nodes:
+            if node["group"] == group and node["used"] + gpus <= gpus_per_node:
+                break
+        else:
+            node = {"group": group, "items": [], "used": 0}
+            nodes.append(node)
+        node["items"].append(item)
+        node["used"] += gpus
+    return [(node["group"], node["items"]) for node in nodes]
+
+
+def unknown_flags(command, docs, engine):
+    """(flag, closest known flag or None) of every option of `command` that the option docs of `engine` don't list."""
+    import difflib
+    known = set(re.findall(r"--[a-z0-9][a-z0-9-]*", docs))
+    if engine == "vllm":
+        known |= VLLM_SERVER_FLAGS
+    unknown = []
+    for flag in dict.fromkeys(re.findall(r"(?:^|\s)(--[a-z0-9][a-z0-9-]*)", command)):
+        if flag not in known:
+            close = difflib.get_close_matches(flag, known, n=1)
+            unknown.append((flag, close[0] if close else None))
+    return unknown
+
+
+def cmd_telemetry(args):
+    count = 0
+    while not args.samples or count < args.samples:
+        started = time.time()
+        record = sample(args.gpu_source, args.url)
+        with open(args.out, "a") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        count += 1
+        if not args.samples or count < args.samples:
+            time.sleep(max(0.0, args.interval - (time.time() - started)))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="autospin and spin-model in-job helper")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("prestage", help="Warm the page cache with or copy a checkpoint to node-local storage, prints the path to serve from")
+    p.add_argument("path")
+    p.add_argument("--mode", choices=["warm", "copy"], default="warm")
+    p.add_argument("--dest", default="/tmp/autospin-stage")
+    p.add_argument("--threads", type=int, default=16)
+    p.set_defaults(func=cmd_prestage)
+
+    p = subparsers.add_parser("wait-ready", help="Poll the server until it first answers and record the server_ready phase")
+    p.add_argument("--url", default="http://127.0.0.1:8080/v1/models")
+    p.add_argument("--timeline", help="timeline file the server_ready phase is appended to")
+    p.add_argument("--interval", type=float, default=2.0)
+    p.add_argument("--timeout", type=float, default=4 * 3600)
+    p.set_defaults(func=cmd_wait_ready)
+
+    p = subparsers.add_parser("warmup", help="Replay a corpus of common prefixes to warm the prefix cache of the server")
+    p.add_argument("--url", default="http://127.0.0.1:8080")
+    p.add_argument("--corpus", required=True)
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--timeline", help="timeline file the warmup_done phase is appended to")
+    p.add_argument("--timeout", type=float, default=300)
+    p.set_defaults(func=cmd_warmup)
+
+    p = subparsers.add_parser("supervise", help="Run the engine, register it with OCF once it answers and restart it when it crashes")
+    p.add_argument("--serve", required=True, help="serve command of the engine")
+    p.add_argument("--ocf", help="OCF command registering the server, empty for ranks that don't serve")
+    p.add_argument("--url", default="http://127.0.0.1:8080", help="base URL of the server, empty for ranks that don't serve HTTP")
+    p.add_argument("--health-path", default="/v1/models")
+    p.add_argument("--warmup-corpus")
+    p.add_argument("--warmup-concurrency", type=int, default=4)
+    p.add_argument("--timeline", help="timeline file the server_ready phase is appended to")
+    p.add_argument("--announce", help="backends file of a `spin-model router` the server is added to once it is ready and heartbeats in")
+    p.add_argument("--interval", type=float, default=5.0)
+    p.add_argument("--failure-threshold", type=int, default=3)
+    p.add_argument("--startup-timeout", type=float, default=4 * 3600)
+    p.add_argument("--max-restarts", type=int, default=5)
+    p.add_argument("--backoff", type=float, default=10.0)
+    p.add_argument("--max-backoff", type=float, default=300.0)
+    p.add_argument("--stable-after", type=float, default=600.0)
+    p.add_argument("--drain-timeout", type=float, default=120.0, help="seconds in-flight requests get to finish on SIGUSR1")
+    p.set_defaults(func=cmd_supervise)
+
+    p = subparsers.add_parser("telemetry", help="Sample GPU utilization and memory, host memory and engine gauges into a JSON lines file")
+    p.add_argument("--out", required=True)
+    p.add_argument("--interval", type=float, default=15.0)
+    p.add_argument("--url", action="append", default=[], help="base URL of a server whose /metrics are sampled, repeat for more")
+    p.add_argument("--gpu-source", default=GPU_QUERY, help="command printing index,utilization,memory.used,memory.total csv lines")
+    p.add_argument("--samples", type=int, default=0, help="stop after this many samples, 0 samples until killed")
+    p.set_defaults(func=cmd_telemetry)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+# Resolves the OCF binary through a shared content-addressed cache:
+#   <cache>/blobs/<sha256>               the binary, named by its checksum
+#   <cache>/<version>/ocf-<arch>.sha256  checksum of a released version/arch
+# A hit is verified against its checksum, a miss downloads the release once and publishes it atomically.
+resolve_ocf() {
+    local version=$1 arch=$2 expected=$3 cache=$4
+    local index="$cache/$version/ocf-$arch.sha256"
+    local digest tmp
+    if [ -f "$index" ]; then
+        digest=$(cat "$index")
+        if { [ -z "$expected" ] || [ "$digest" = "$expected" ]; } && [ -x "$cache/blobs/$digest" ] \
+            && echo "$digest  $cache/blobs/$digest" | sha256sum -c --status; then
+            echo "$cache/blobs/$digest"
+            return 0
+        fi
+        echo "OCF cache entry $index is stale or corrupt, downloading again" >&2
+    fi
+    mkdir -p "$cache/blobs" "$cache/$version" || return 1
+    tmp=$(mktemp "$cache/blobs/.download-XXXXXX") || return 1
+    if ! curl -fsSL --retry 3 "https://github.com/ResearchComputer/OpenComputeFramework/releases/download/$version/ocf-$arch" -o "$tmp"; then
+        rm -f "$tmp"
+        return 1
+    fi
+    digest=$(sha256sum "$tmp" | cut -d' ' -f1)
+    if [ -n "$expected" ] && [ "$digest" != "$expected" ]; then
+        echo "OCF $version/$arch checksum mismatch: expected $expected, got $digest" >&2
+        rm -f "$tmp"
+        return 1
+    fi
+    chmod 755 "$tmp"
+    mv -f "$tmp" "$cache/blobs/$digest"
+    echo "$digest" > "$index.$$" && mv -f "$index.$$" "$index"
+    echo "$cache/blobs/$digest"
+}
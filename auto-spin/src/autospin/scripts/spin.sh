@@ -2,12 +2,16 @@
 #SBATCH --job-name={{job_name}}
 #SBATCH --container-writable
 #SBATCH --time={{time_limit}}
+#SBATCH --nodes={{nodes}}
 #SBATCH --ntasks-per-node=1
 #SBATCH --dependency=singleton
 #SBATCH --partition=normal
 ### SBATCH --account= Account is defined in auto-spin/config.yaml 
 #SBATCH --output={{job_name}}-%j.out
 #SBATCH --error={{job_name}}-%j.err
+{%- if drain_signal %}
+#SBATCH --signal=B:USR1@{{drain_signal}}
+{%- endif %}
 
 unset HTTPS_PROXY HTTP_PROXY http_proxy https_proxy no_proxy
 
@@ -15,15 +19,95 @@ export NCCL_SOCKET_IFNAME=lo
 export GLOO_SOCKET_IFNAME=lo
 export PROMETHEUS_MULTIPROC_DIR=/ocfbin/scratch
 export SP_NCCL_SO_PATH=/usr/lib/x86_64-linux-gnu/
+{%- if nodes > 1 %}
 
-export MODEL_PATH={{model_path}}
-export PARSER_ARGS="{{model_args}}"
-export MODEL_NAME={{model_name}}
+# ranks talk over the network and rendezvous at the first node of the allocation
+unset NCCL_SOCKET_IFNAME GLOO_SOCKET_IFNAME
+export HEAD_NODE=$(scontrol show hostnames "${SLURM_JOB_NODELIST}" | head -n 1)
+{%- endif %}
 
+# cold-start phase markers, collected by `python -m autospin.timeline`
+export SPIN_TIMELINE=${SLURM_SUBMIT_DIR}/{{job_name}}-${SLURM_JOB_ID}.timeline
+spin_phase() {
+   echo "$1 ${EPOCHREALTIME:-$(date +%s)}" >> "${SPIN_TIMELINE}"
+}
+if SUBMIT_TIME=$(squeue -h -j ${SLURM_JOB_ID} -o %V) && [ -n "${SUBMIT_TIME}" ]; then
+   echo "submitted $(date -d "${SUBMIT_TIME}" +%s)" >> "${SPIN_TIMELINE}"
+fi
+spin_phase job_start
 
+{% include "ocf-cache.sh" %}
+
+if ! OCF_BIN=$(resolve_ocf {{ocf_version}} {{ocf_arch}} "{{ocf_sha256}}" {{ocf_cache_dir}}); then
+   echo "Unable to resolve OCF {{ocf_version}}/{{ocf_arch}}" >&2
+   exit 1
+fi
+export OCF_BIN
+spin_phase ocf_ready
+
+JOBCTL=${SLURM_SUBMIT_DIR}/.jobctl-${SLURM_JOB_ID}.py
+cat > "${JOBCTL}" <<'JOBCTL_EOF'
+{{ jobctl_source|safe }}
+JOBCTL_EOF
+trap 'rm -f "${JOBCTL}"' EXIT
+export JOBCTL
+
+# SIGUSR1 ahead of the time limit is passed on through srun to the supervisors, which drain their servers
+trap 'kill -USR1 $(jobs -p) 2>/dev/null' USR1
+
+# every server runs in its own subshell, jobs packing several models pin each one to a GPU slice
 srun -N ${SLURM_JOB_NUM_NODES} --environment={{environment}} --container-writable bash -c '\
    cd /tmp
-   curl -L "https://github.com/ResearchComputer/OpenComputeFramework/releases/download/{{ocf_version}}/ocf-amd64" > ocf-amd64
-   chmod +x ocf-amd64
-   ./ocf-amd64 start --bootstrap.addr {{bootstrap_addr}} --subprocess "{{sub_process}}" --service.name llm --service.port 8080
-   '
+   trap "kill -USR1 \$(jobs -p) 2>/dev/null" USR1
+   echo "container_start ${EPOCHREALTIME:-$(date +%s)}" >> "${SPIN_TIMELINE}"
+{%- if telemetry_interval %}
+   # resource samples for right-sizing, collected by `python -m autospin.telemetry`, disowned so that `wait` skips it
+   if [ "${SLURM_NODEID}" = 0 ]; then
+      python3 ${JOBCTL} telemetry --out "${SLURM_SUBMIT_DIR}/{{job_name}}-${SLURM_JOB_ID}.telemetry" --interval {{telemetry_interval}}
+{%- for server in servers %} --url http://127.0.0.1:{{server.port}}{% endfor %} & disown
+   fi
+{%- endif %}
+{%- for server in servers %}
+   (
+   export MODEL_PATH={{server.model_path}}
+   export PARSER_ARGS="{{server.model_args}}"
+   export MODEL_NAME={{server.model_name}}
+{%- if server.devices %}
+   export CUDA_VISIBLE_DEVICES={{server.devices}}
+   export PROMETHEUS_MULTIPROC_DIR=/ocfbin/scratch/{{server.position}}
+   mkdir -p ${PROMETHEUS_MULTIPROC_DIR}
+{%- endif %}
+{%- if server.prestage %}
+   # a prestage that crashes or prints nothing falls back to the original checkpoint
+   MODEL_PATH=$(python3 ${JOBCTL} prestage "${MODEL_PATH}" --mode {{server.prestage}} --dest {{server.prestage_dir}} --threads {{server.prestage_threads}}) || MODEL_PATH={{server.model_path}}
+   [ -n "${MODEL_PATH}" ] || MODEL_PATH={{server.model_path}}
+   echo "prestage_done ${EPOCHREALTIME:-$(date +%s)}" >> "${SPIN_TIMELINE}"
+{%- endif %}
+{%- set supervise_options %}--max-restarts {{server.max_restarts}} --drain-timeout {{server.drain_timeout}}{% if server.warmup_corpus %} --warmup-corpus {{server.warmup_corpus}} --warmup-concurrency {{server.warmup_concurrency}}{% endif %}{% endset %}
+{%- if nodes > 1 %}
+   # only rank 0 serves HTTP and registers with OCF, the workers exit when its engine dies and are restarted as well
+   if [ "${SLURM_NODEID}" != 0 ]; then
+{%- if server.engine == "vllm" %}
+      sleep 10
+      exec python3 ${JOBCTL} supervise --url "" {{supervise_options}} --serve "ray start --address=${HEAD_NODE}:{{ray_port}} --block"
+{%- else %}
+      exec python3 ${JOBCTL} supervise --url "" {{supervise_options}} --serve "{{server.sub_process}}"
+{%- endif %}
+   fi
+{%- if server.engine == "vllm" %}
+   ray start --head --port={{ray_port}}
+   until [ "$(ray status 2>/dev/null | grep -c " node_")" -ge {{nodes}} ]; do sleep 5; done
+{%- endif %}
+{%- endif %}
+   # registers with OCF once the server answers and restarts it inside the allocation, replacing the subshell
+   # so that the drain signal reaches it
+   exec python3 ${JOBCTL} supervise --url http://127.0.0.1:{{server.port}} --timeline "${SPIN_TIMELINE}" {{supervise_options}} \
+      --serve "{{server.sub_process}}" \
+      --ocf "${OCF_BIN} start --bootstrap.addr {{bootstrap_addr}} --service.name llm --service.port {{server.port}}
+{%- if server.position > 0 %} --tcpport {{server.ocf_tcp_port}} --udpport {{server.ocf_udp_port}}{% endif %}"
+   ) &
+{%- endfor %}
+   wait; wait
+   ' &
+# the trapped signal ends the first wait, the second one waits for the drained servers
+wait; wait
@@ -1,136 +1,361 @@
+import asyncio
 import click
 import yaml
-from pydantic import BaseModel, ValidationError
-from typing import Dict
-import firecrest as f7t
+from pydantic import ValidationError
+from typing import Dict, Hashable, List, Tuple
 from importlib import resources as imp_resources
 from jinja2 import Environment, FileSystemLoader
 from autospin import scripts
+from functools import lru_cache
+from autospin.autoscale import ScaleState, desired_instances, scrape_replicas
+from autospin.client import connect, fetch_active_jobs
+from autospin.config import AS_JOB_PREFIX, DRAIN_MARGIN, Config, ModelConfig, load_config, resolve_env
+from autospin.executor import Action, execute
+from autospin.health import check_health
+from autospin.packing import PackItem, gpu_slices, place_models, server_ports, with_port
+from autospin.planner import DesiredJob, Plan, build_plan, index_active_jobs, parse_job_name, spec_hash
+from autospin.preflight import preflight
+from autospin.renewal import RenewalPlan, plan_renewals
+from autospin.state import State, load_state, save_state
 import os
+import time
 
-AS_JOB_PREFIX:str="+as-"
+# model id of the jobs hosting several packed models
+PACK_MODEL_ID: str = "pack"
+# rendezvous ports on the head node of multi-node jobs
+DIST_INIT_PORT: int = 29500
+RAY_PORT: int = 6379
 
 
+def generate_jobs(config:Config) -> Dict[str, DesiredJob]:
+    jobs: Dict[str, DesiredJob] = {}
+    packed: List[Tuple[Hashable, PackItem]] = []
+    for model_id,model in config.models.items():
+        # autoscaled models get a job for every instance they may scale up to
+        instances = max(model.instances, model.instance_bounds()[1]) if model.autoscale else model.instances
+        for instance in range(instances):
+            if model.packed():
+                group = (model.environment, model.time_limit, model.ocf_version, model.ocf_arch)
+                packed.append((group, PackItem(model_id=model_id, instance=instance, gpus=model.gpus)))
+                continue
+            slot=f"{AS_JOB_PREFIX}{model_id}-{instance}"
+            parameters = _job_parameters(config, model)
+            parameters["servers"] = [_server_parameters(model, 0, "")]
+            jobs[slot] = _desired_job(slot, model_id, instance, parameters, [model_id])
 
-class ModelConfig(BaseModel):
-    instances: int = 0
-    model_name: str
-    model_path: str
-    model_args: str
-    sub_process:str
-    environment:str
-    serving_engine:str
-    time_limit:str
-    ocf_version:str
+    # models that need less than a node share nodes, one pack job per node
+    for index, node in enumerate(place_models(packed)):
+        slot=f"{AS_JOB_PREFIX}{PACK_MODEL_ID}-{index}"
+        parameters = _job_parameters(config, config.models[node.items[0].model_id])
+        intervals = [config.models[item.model_id].telemetry_interval for item in node.items]
+        parameters["telemetry_interval"] = min((interval for interval in intervals if interval), default=None)
+        parameters["drain_signal"] = _drain_signal(max(config.models[item.model_id].drain_timeout for item in node.items))
+        parameters["servers"] = [_server_parameters(config.models[item.model_id], position, devices)
+                                 for position, (item, devices) in enumerate(zip(node.items, gpu_slices(node)))]
+        jobs[slot] = _desired_job(slot, PACK_MODEL_ID, index, parameters, sorted({item.model_id for item in node.items}))
 
+    return jobs
 
-class Config(BaseModel):
-    models: Dict[str, ModelConfig]
-    client_id: str
-    client_secret: str
-    user_id:str
-    token_uri:str
-    firecrest_uri:str
-    system_name:str
-    account:str
-    bootstrap_addr:str
 
+def _job_parameters(config: Config, model: ModelConfig) -> dict:
+    return {
+        "time_limit": model.time_limit,
+        "nodes": model.nodes,
+        "dist_init_port": DIST_INIT_PORT,
+        "ray_port": RAY_PORT,
+        "environment": model.environment,
+        "ocf_version": model.ocf_version,
+        "ocf_arch": model.ocf_arch,
+        "bootstrap_addr": config.bootstrap_addr,
+        "ocf_cache_dir": config.ocf_cache_dir,
+        "ocf_sha256": config.ocf_checksums.get(f"{model.ocf_version}/{model.ocf_arch}", ""),
+        "jobctl_source": _jobctl_source(),
+        "telemetry_interval": model.telemetry_interval,
+        "drain_signal": _drain_signal(model.drain_timeout),
+    }
 
-def load_config(file_path: str) -> Config:
-    with open(file_path, 'r') as f:
-        raw_data = yaml.safe_load(f)
-    return Config.model_validate(raw_data)
 
+def _drain_signal(drain_timeout: float) -> int:
+    # seconds before the time limit SLURM sends SIGUSR1 to the job, 0 without a drain window
+    return int(drain_timeout) + DRAIN_MARGIN if drain_timeout else 0
 
-def generate_jobs(config:Config):
-    ids: Dict[str, str] = {}
-    for model_id,model in config.models.items():
-        for instance in range(model.instances):
-            job_name=f"{AS_JOB_PREFIX}{model_id}-{instance}"
-            parameters = model.model_dump()
-            parameters["job_name"]=job_name
-            parameters["bootstrap_addr"]=config.bootstrap_addr
-            job_script = _build_script("spin.sh", parameters)
-            ids[job_name]=job_script
 
-    return ids
+def _server_parameters(model: ModelConfig, position: int, devices: str) -> dict:
+    parameters = model.model_dump(include={"model_name", "model_path", "model_args", "sub_process",
+                                           "prestage", "prestage_dir", "prestage_threads",
+                                           "warmup_corpus", "warmup_concurrency", "max_restarts", "drain_timeout"})
+    parameters.update(server_ports(position))
+    parameters["position"] = position
+    parameters["devices"] = devices
+    if position > 0:
+        parameters["sub_process"] = with_port(model.sub_process, parameters["port"])
+    parameters["engine"] = "vllm" if "vllm" in model.sub_process else "sglang"
+    if model.nodes > 1:
+        parameters["sub_process"] = _multi_node_process(parameters["sub_process"], parameters["engine"], model.nodes)
+    return parameters
+
+
+def _multi_node_process(sub_process: str, engine: str, nodes: int) -> str:
+    """Adds the rendezvous flags of a multi-node launch, flags already in `sub_process` win.
+
+    sp/sglang shard --tp-size over the GPUs of all nodes, vllm pipelines over the nodes of a Ray cluster.
+    """
+    if engine == "vllm":
+        flags = {"--pipeline-parallel-size": str(nodes), "--distributed-executor-backend": "ray"}
+    else:
+        flags = {"--nnodes": str(nodes), "--node-rank": "${SLURM_NODEID}",
+                 "--dist-init-addr": f"${{HEAD_NODE}}:{DIST_INIT_PORT}"}
+    missing = " ".join(f"{flag} {value}" for flag, value in flags.items() if flag not in sub_process)
+    return f"{sub_process} {missing}" if missing else sub_process
 
-def _build_script(filename: str, parameters):
 
-    script_environment = Environment(
+def _desired_job(slot: str, model_id: str, instance: int, parameters: dict, models: List[str]) -> DesiredJob:
+    # the hash covers everything rendered into the script except the name it is stored in
+    parameters["job_name"]=slot
+    job_hash = spec_hash(_build_script("spin.sh", parameters))
+    job = DesiredJob(slot=slot, model_id=model_id, instance=instance, spec_hash=job_hash, script="", models=models)
+    parameters["job_name"]=job.name
+    job.script = _build_script("spin.sh", parameters)
+    return job
+
+def print_plan(plan: Plan, renewals: RenewalPlan):
+    for entry in plan.keep:
+        click.echo(f"✅ job: {entry.active[0].name} is {entry.active[0].state.lower()}")
+    for entry in plan.start:
+        click.echo(f"❗ job: {entry.desired.name} is missing")
+    for entry in plan.replace:
+        click.echo(f"🔄 job: {', '.join(job.name for job in entry.active)} will be replaced by {entry.desired.name} ({entry.reason})")
+    for entry in plan.wait:
+        click.echo(f"⏳ job: {', '.join(job.name for job in entry.active)} kept until {entry.desired.name} is running")
+    for entry in plan.cancel:
+        for job in entry.active:
+            click.echo(f"💀 job: {job.name} is a {entry.reason}")
+    for name, successor, remaining in renewals.started:
+        click.echo(f"♻️ job: {name} has {remaining / 60:.0f} min left, renewing it as {successor}")
+    for name, successor, startup in renewals.completed:
+        click.echo(f"♻️ job: {successor} is healthy after {startup / 60:.0f} min, retiring {name}")
+    if plan.is_noop() and not (renewals.submit or renewals.cancel):
+        click.echo("Nothing to do.")
+
+
+def plan_actions(plan: Plan, renewals: RenewalPlan) -> List[Action]:
+    actions = [Action(kind="submit", job_name=entry.desired.name, script=entry.desired.script)
+               for entry in plan.start + plan.replace]
+    actions += [Action(kind="submit", job_name=job.name, script=job.script) for job in renewals.submit]
+    # outdated jobs are cancelled by a later cycle, once their successor is running, failing ones right away
+    actions += [Action(kind="cancel", job_name=job.name, job_id=job.job_id) for entry in plan.cancel for job in entry.active]
+    actions += [Action(kind="cancel", job_name=job.name, job_id=job.job_id) for job in renewals.cancel]
+    return actions
+
+@lru_cache(maxsize=None)
+def _script_environment() -> Environment:
+    return Environment(
         loader=FileSystemLoader(imp_resources.files(scripts)), autoescape=True
     )
-    script_template = script_environment.get_template(filename)
+
+@lru_cache(maxsize=None)
+def _jobctl_source() -> str:
+    return imp_resources.files(scripts).joinpath("jobctl.py").read_text()
+
+def _build_script(filename: str, parameters):
+
+    script_template = _script_environment().get_template(filename)
 
     script_code = script_template.render(parameters)
 
     return script_code
 
 
-@click.command()
-@click.argument('config_path', type=click.Path(exists=True))
-def main(config_path):
-    """Loads and validates a YAML config file."""
+def apply_autoscaling(config: Config, model_jobs: Dict[str, DesiredJob], active_jobs: List[dict], state: State) -> Dict[str, int]:
+    """Returns the number of instances to keep alive per model, scaling the autoscaled ones from their metrics."""
+    counts = {model_id: model.instances for model_id, model in config.models.items()}
+    replicas: Dict[str, List[dict]] = {}
+    for item in active_jobs:
+        job = model_jobs.get(parse_job_name(item["name"])[0])
+        if job is not None:
+            replicas.setdefault(job.model_id, []).append(item)
 
-    config = load_config(config_path)
-    click.echo("Configuration loaded and validated successfully.")
+    for model_id, model in config.models.items():
+        if model.autoscale is None:
+            continue
+        low, high = model.instance_bounds()
+        previous = state.scaling.get(model_id, ScaleState(instances=model.instances))
+        sample = scrape_replicas(replicas.get(model_id, []), model.autoscale)
+        scaled = desired_instances(previous, sample, model.autoscale, low, high)
+        if scaled.instances != previous.instances:
+            # a count clamped into [min_instances, max_instances] changes before any sample was scraped
+            smoothed = "n/a" if scaled.smoothed is None else f"{scaled.smoothed:.1f}"
+            click.echo(f"📈 model: {model_id} scaled {previous.instances} → {scaled.instances} ({model.autoscale.metric}={smoothed}, target {model.autoscale.target}/replica)")
+        state.scaling[model_id] = scaled
+        counts[model_id] = scaled.instances
+    return counts
 
-    if config.client_secret.startswith("env:"):
-        config.client_secret=os.getenv(config.client_secret.removeprefix("env:"))
 
-    if config.client_id.startswith("env:"):
-        config.client_id=os.getenv(config.client_id.removeprefix("env:"))
+async def reconcile(client, config: Config, model_jobs: Dict[str, DesiredJob], active_jobs: List[dict], dry_run: bool = False):
+    state = load_state(config.state_file)
+    unhealthy = set()
+    # probes and scrapes run their own event loop, in a worker thread to keep the Firecrest session's loop free
+    if config.health is not None:
+        autospin_jobs = [item for item in active_jobs if item["name"].startswith(AS_JOB_PREFIX)]
+        unhealthy = await asyncio.to_thread(check_health, autospin_jobs, config.health, state.probes)
+        for job_id, probe in state.probes.items():
+            if probe.consecutive_failures > 0:
+                click.echo(f"🩺 job: {job_id} failed {probe.consecutive_failures}/{config.health.failure_threshold} health probes ({probe.last_error})")
 
-    if config.user_id.startswith("env:"):
-        config.user_id=os.getenv(config.user_id.removeprefix("env:"))
-        
-    # Create an authorization object with Client Credentials authorization grant
-    keycloak = f7t.ClientCredentialsAuth(
-        config.client_id, config.client_secret, config.token_uri
-    )
+    # jobs of models failing the pre-flight checks are held: not submitted, and running ones are left alone
+    invalid = await preflight(client, config)
+    for model_id, errors in invalid.items():
+        for error in errors:
+            click.echo(f"⛔ model: {model_id} {error}")
+    held = {slot for slot, job in model_jobs.items() if invalid.keys() & set(job.models)}
 
-    # Setup the client for the specific account
-    client: f7t.v2.Firecrest = f7t.v2.Firecrest(
-        firecrest_url=config.firecrest_uri, authorization=keycloak
-    )
-    
-    if config.system_name not in [item["name"] for item in client.systems()]:
-            click.echo("❌ Unable to find the required cluster/system")
-            return
-
-    click.echo("Scanning for active jobs...")
-    jobs = client.job_info(system_name=config.system_name, allusers=False)
-    
-    model_jobs = generate_jobs(config)
-
-    active_jobs = [item for item in jobs if item["status"]["state"] in ["PENDING","RUNNING" ] ]
-    autospin_active_jobs = [item for item in active_jobs if item["name"].startswith(AS_JOB_PREFIX)]
-    
-    running_models_name = [item["name"] for item in autospin_active_jobs if item["name"] in model_jobs.keys()]
-    zombie_models  = [{"name":item["name"],"id":item["jobId"]} for item in autospin_active_jobs if item["name"] not in model_jobs.keys()]
-    
-    for job in running_models_name:
-        click.echo(f"✅ job: {job} is running")
-
-    missing_jobs_ids = [name for name in model_jobs.keys() if name not in running_models_name]
-
-    for job in missing_jobs_ids:
-        click.echo(f"❗ job: {job} is missing")
-
-    for job in zombie_models:
-        click.echo(f"💀 job: {job["name"]} is a zombie")
-    
-    if len(missing_jobs_ids) > 0:
-        click.echo("Starting missing jobs...")
-        for job_id in missing_jobs_ids: 
-            client.submit(system_name=config.system_name, script_str=model_jobs[job_id],account=config.account,working_dir=f"/users/{config.user_id}/dispatcher")
-            click.echo(f"🚀 job: {job_id} scheduled")
-    
-    if len(zombie_models) > 0:
-        click.echo("Killing zombie jobs...")
-        for job in zombie_models: 
-            client.cancel_job(system_name=config.system_name, jobid=job["id"])
-            click.echo(f"🔚 job: {job["name"]} canceled")
+    counts = await asyncio.to_thread(apply_autoscaling, config, model_jobs, active_jobs, state)
+    desired_jobs = {slot: job for slot, job in model_jobs.items()
+                    if slot not in held and (job.model_id not in counts or job.instance < counts[job.model_id])}
+
+    active_by_slot = {slot: jobs for slot, jobs in index_active_jobs(active_jobs, AS_JOB_PREFIX).items() if slot not in held}
+    renewals = RenewalPlan()
+    if config.renewal is not None:
+        renewals = await asyncio.to_thread(plan_renewals, desired_jobs, active_by_slot, active_jobs, config.renewal,
+                                           config.health, state, unhealthy)
+    if not dry_run:
+        save_state(config.state_file, state)
+
+    plan = build_plan(desired_jobs, active_by_slot, unhealthy)
+    print_plan(plan, renewals)
+
+    if dry_run:
+        click.echo("Dry run, no jobs were submitted or canceled.")
+        return
+
+    actions = plan_actions(plan, renewals)
+
+    attempted = set()
+
+    async def run_action(action: Action):
+        if action.kind == "submit":
+            # a submit that failed on the way back may still have queued the job, a retry resubmits only if it didn't
+            if action.job_name in attempted:
+                queued = [item for item in await fetch_active_jobs(client, config) if item["name"] == action.job_name]
+                if queued:
+                    return {"jobId": queued[0]["jobId"]}
+            attempted.add(action.job_name)
+            return await client.submit(system_name=config.system_name, script_str=action.script,account=config.account,working_dir=config.working_dir)
+        return await client.cancel_job(system_name=config.system_name, jobid=action.job_id)
+
+    if len(actions) > 0:
+        click.echo(f"Starting {len(plan.start)} missing jobs, replacing {len(plan.replace)} outdated jobs, renewing {len(renewals.submit)} expiring jobs and killing {len([action for action in actions if action.kind == 'cancel'])} jobs...")
+    results = await execute(actions, run_action, max_concurrency=config.max_concurrency,
+                      max_retries=config.max_retries, retry_backoff=config.retry_backoff)
+
+    for result in results:
+        retries = f" after {result.attempts} attempts" if result.attempts > 1 else ""
+        if not result.ok:
+            click.echo(f"⚠️ job: {result.action.job_name} {result.action.kind} failed{retries}: {result.error}")
+        elif result.action.kind == "submit":
+            click.echo(f"🚀 job: {result.action.job_name} scheduled{retries} ({result.duration:.1f}s)")
+        else:
+            click.echo(f"🔚 job: {result.action.job_name} canceled{retries} ({result.duration:.1f}s)")
+
+    if len(results) > 0:
+        failed = len([result for result in results if not result.ok])
+        click.echo(f"Summary: {len(results) - failed}/{len(results)} actions succeeded, {failed} failed")
+
+
+async def run_daemon(config_path: str, interval: float, watch_interval: float, dry_run: bool):
+    """Keeps one authenticated client on a pooled session and reconciles every `interval` seconds.
+
+    The job list is polled every `watch_interval` seconds, a job leaving the active
+    states or a change of the config file mtime triggers an immediate reconcile.
+    """
+    config_mtime = os.path.getmtime(config_path)
+    config = resolve_env(load_config(config_path))
+    client = await connect(config)
+    if client is None:
+        return
+    try:
+        model_jobs = generate_jobs(config)
+        known_job_ids: set = set()
+        last_reconcile = 0.0
+
+        while True:
+            cycle_start = time.monotonic()
+            try:
+                reason = None
+                mtime = os.path.getmtime(config_path)
+                if mtime != config_mtime:
+                    new_config = resolve_env(load_config(config_path))
+                    if (new_config.firecrest_uri, new_config.token_uri, new_config.client_id, new_config.system_name) != \
+                            (config.firecrest_uri, config.token_uri, config.client_id, config.system_name):
+                        new_client = await connect(new_config)
+                        if new_client is None:
+                            raise RuntimeError("unable to connect with the reloaded configuration")
+                        await client.close_session()
+                        client = new_client
+                    config, config_mtime = new_config, mtime
+                    model_jobs = generate_jobs(config)
+                    reason = "configuration changed"
+
+                active_jobs = await fetch_active_jobs(client, config)
+                job_ids = {str(item["jobId"]) for item in active_jobs if item["name"].startswith(AS_JOB_PREFIX)}
+                exited = known_job_ids - job_ids
+                if reason is None and exited:
+                    reason = f"{len(exited)} job(s) exited"
+                if reason is None and cycle_start - last_reconcile >= interval:
+                    reason = "scheduled"
+
+                if reason is not None:
+                    click.echo(f"🔁 Reconciling ({reason})...")
+                    await reconcile(client, config, model_jobs, active_jobs, dry_run)
+                    last_reconcile = cycle_start
+                    active_jobs = await fetch_active_jobs(client, config)
+                    job_ids = {str(item["jobId"]) for item in active_jobs if item["name"].startswith(AS_JOB_PREFIX)}
+                known_job_ids = job_ids
+            except (ValidationError, yaml.YAMLError) as e:
+                click.echo(f"❌ Invalid configuration, keeping the previous one: {e}")
+                config_mtime = mtime
+            except Exception as e:
+                click.echo(f"⚠️ Reconciliation cycle failed: {e}")
+
+            await asyncio.sleep(max(0.0, watch_interval - (time.monotonic() - cycle_start)))
+    finally:
+        await client.close_session()
+
+
+async def run_once(config: Config, dry_run: bool):
+    client = await connect(config)
+    if client is None:
+        return
+    try:
+        click.echo("Scanning for active jobs...")
+        active_jobs = await fetch_active_jobs(client, config)
+
+        model_jobs = generate_jobs(config)
+        await reconcile(client, config, model_jobs, active_jobs, dry_run)
+    finally:
+        await client.close_session()
+
+
+@click.command()
+@click.argument('config_path', type=click.Path(exists=True))
+@click.option('--dry-run', is_flag=True, help="Print the reconciliation plan without submitting or canceling jobs.")
+@click.option('--daemon', is_flag=True, help="Keep running and reconcile continuously instead of once.")
+@click.option('--interval', default=300.0, show_default=True, help="Daemon mode: seconds between scheduled reconciliations.")
+@click.option('--watch-interval', default=30.0, show_default=True, help="Daemon mode: seconds between job state polls, an exited job or config change triggers a reconcile.")
+def main(config_path, dry_run, daemon, interval, watch_interval):
+    """Loads and validates a YAML config file."""
+
+    if daemon:
+        click.echo("Starting autospin controller daemon...")
+        try:
+            asyncio.run(run_daemon(config_path, interval, watch_interval, dry_run))
+        except KeyboardInterrupt:
+            click.echo("Stopping autospin controller daemon.")
+        return
+
+    config = resolve_env(load_config(config_path))
+    click.echo("Configuration loaded and validated successfully.")
+    asyncio.run(run_once(config, dry_run))
 
 
 if __name__ == '__main__':
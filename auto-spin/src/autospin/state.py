@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+from typing import Dict, Optional
+from pydantic import BaseModel, ValidationError
+from autospin.autoscale import ScaleState
+
+
+class ProbeState(BaseModel):
+    consecutive_failures: int = 0
+    last_error: str = ""
+    last_probe: float = 0.0
+    # first time the job was seen RUNNING, the grace period of a job without a reported start time counts from it
+    running_since: Optional[float] = None
+
+
+class RenewalState(BaseModel):
+    # job id of the job being renewed and name of its successor
+    predecessor: str
+    successor: str
+    submitted: float
+
+
+class State(BaseModel):
+    """Controller state that has to survive between reconciliation cycles."""
+    probes: Dict[str, ProbeState] = {}
+    scaling: Dict[str, ScaleState] = {}
+    # renewals in progress per slot
+    renewals: Dict[str, RenewalState] = {}
+    # smoothed seconds from submission to the first healthy probe per model
+    startup: Dict[str, float] = {}
+
+
+def load_state(path: str) -> State:
+    if not os.path.exists(path):
+        return State()
+    try:
+        with open(path, 'r') as f:
+            return State.model_validate(json.load(f))
+    except (OSError, ValueError, ValidationError):
+        # a corrupt state file only costs us the history, never the reconciliation
+        return State()
+
+
+def save_state(path: str, state: State):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".autospin-state-")
+    with os.fdopen(fd, 'w') as f:
+        f.write(state.model_dump_json(indent=2))
+    os.replace(tmp_path, path)
@@ -0,0 +1,82 @@
+import asyncio
+import json
+from typing import List, Optional
+import click
+from autospin.client import connect
+from autospin.config import AS_JOB_PREFIX, Config, load_config, resolve_env
+from autospin.executor import Action, execute
+from autospin.scripts.jobctl import summarize_telemetry
+from autospin.timeline import model_id_of
+
+
+def parse_samples(text: str) -> List[dict]:
+    samples = []
+    for line in text.splitlines():
+        try:
+            samples.append(json.loads(line))
+        except ValueError:
+            continue
+    return samples
+
+
+def summarize(samples: List[dict]) -> Optional[dict]:
+    """Utilization, memory and KV cache peaks of the samples of one job, with right-sizing flags."""
+    return summarize_telemetry(samples, resize_flag="try gpus: {}")
+
+
+async def collect(client, config: Config, time_window: str) -> List[dict]:
+    """Reads and summarizes the telemetry files of the autospin jobs of the time window."""
+    jobs = await client.job_info(system_name=config.system_name, allusers=False, account=config.account,
+                                 time_window=time_window)
+    actions = [Action(kind="view", job_name=item["name"], job_id=str(item["jobId"]))
+               for item in jobs if item["name"].startswith(AS_JOB_PREFIX)]
+
+    async def view(action: Action):
+        path = f"{config.working_dir}/{action.job_name}-{action.job_id}.telemetry"
+        return await client.view(system_name=config.system_name, path=path)
+
+    results = await execute(actions, view, max_concurrency=config.max_concurrency, max_retries=0)
+    rows = []
+    for result in results:
+        if not result.ok:
+            continue
+        summary = summarize(parse_samples(result.response))
+        if summary is not None:
+            rows.append({"job_id": result.action.job_id, "model": model_id_of(result.action.job_name), **summary})
+    return sorted(rows, key=lambda row: (row["model"], row["job_id"]))
+
+
+async def collect_once(config: Config, time_window: str) -> Optional[List[dict]]:
+    client = await connect(config)
+    if client is None:
+        return None
+    try:
+        return await collect(client, config, time_window)
+    finally:
+        await client.close_session()
+
+
+@click.command()
+@click.argument('config_path', type=click.Path(exists=True))
+@click.option('--time-window', default="24h", show_default=True, help="How far back to look for jobs (1h, 8h, 24h, 3d, 7d).")
+@click.option('--json', 'as_json', is_flag=True, help="Print the summaries as JSON.")
+def main(config_path, time_window, as_json):
+    """Summarizes the resource telemetry of autospin jobs and flags over-provisioned models."""
+    config = resolve_env(load_config(config_path))
+    rows = asyncio.run(collect_once(config, time_window))
+    if rows is None:
+        return
+    if as_json:
+        click.echo(json.dumps(rows, indent=2))
+        return
+    click.echo(f"{'MODEL':30} {'JOB':>9} {'GPUS':>4} {'HOURS':>6} {'UTIL':>5} {'P95':>5} {'MEM PEAK':>12} {'KV PEAK':>7} {'RSS':>7}  FLAGS")
+    for row in rows:
+        kv = f"{row['kv_peak']:.0%}" if row["kv_peak"] is not None else "-"
+        memory = f"{row['mem_peak'] / 1024:.0f}/{row['mem_total'] / 1024:.0f}G"
+        click.echo(f"{row['model'][-30:]:30} {row['job_id']:>9} {row['gpus']:>4} {row['duration'] / 3600:>6.1f} "
+                   f"{row['util_mean']:>4.0f}% {row['util_p95']:>4.0f}% {memory:>12} {kv:>7} {row['rss_peak'] / 1024:>6.1f}G  "
+                   f"{'; '.join(row['flags']) or 'ok'}")
+
+
+if __name__ == '__main__':
+    main()
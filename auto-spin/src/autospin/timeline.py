@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+import click
+from autospin.client import connect
+from autospin.config import AS_JOB_PREFIX, Config, load_config, resolve_env
+from autospin.executor import Action, execute
+from autospin.planner import parse_job_name
+from autospin.scripts.jobctl import parse_timeline, percentile, phase_durations
+
+PHASE_LABELS: Dict[str, str] = {
+    "job_start": "queue wait",
+    "ocf_ready": "ocf download",
+    "container_start": "container start",
+    "prestage_done": "prestage",
+    "server_ready": "weight load + first response",
+    "warmup_done": "prefix warm-up",
+}
+PHASE_ORDER: List[str] = list(PHASE_LABELS) + ["total"]
+
+
+def load_store(path: str) -> Dict[str, dict]:
+    records: Dict[str, dict] = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record["job_id"]] = record
+    return records
+
+
+def save_store(path: str, records: Dict[str, dict]):
+    with open(path, 'w') as f:
+        f.writelines(json.dumps(record) + "\n" for record in records.values())
+
+
+def model_id_of(job_name: str) -> str:
+    slot, _ = parse_job_name(job_name)
+    return slot.removeprefix(AS_JOB_PREFIX).rpartition("-")[0]
+
+
+async def collect(client, config: Config, records: Dict[str, dict], time_window: str) -> int:
+    """Reads the timeline files of the autospin jobs that are not complete in `records` yet."""
+    jobs = await client.job_info(system_name=config.system_name, allusers=False, account=config.account,
+                                 time_window=time_window)
+    pending = [item for item in jobs if item["name"].startswith(AS_JOB_PREFIX)
+               and "server_ready" not in records.get(str(item["jobId"]), {}).get("markers", {})]
+    actions = [Action(kind="view", job_name=item["name"], job_id=str(item["jobId"])) for item in pending]
+
+    async def view(action: Action):
+        path = f"{config.working_dir}/{action.job_name}-{action.job_id}.timeline"
+        return await client.view(system_name=config.system_name, path=path)
+
+    results = await execute(actions, view, max_concurrency=config.max_concurrency, max_retries=0)
+    collected = 0
+    for result in results:
+        if not result.ok:
+            continue
+        model_id = model_id_of(result.action.job_name)
+        model = config.models.get(model_id)
+        records[result.action.job_id] = {
+            "job_id": result.action.job_id,
+            "job_name": result.action.job_name,
+            "model": model_id,
+            "engine": model.serving_engine if model else "",
+            "cluster": config.system_name,
+            "markers": parse_timeline(result.response),
+        }
+        collected += 1
+    return collected
+
+
+async def collect_once(config: Config, records: Dict[str, dict], time_window: str) -> Optional[int]:
+    client = await connect(config)
+    if client is None:
+        return None
+    try:
+        return await collect(client, config, records, time_window)
+    finally:
+        await client.close_session()
+
+
+def report(records: Dict[str, dict]) -> List[dict]:
+    groups: Dict[Tuple[str, str, str], Dict[str, List[float]]] = {}
+    for record in records.values():
+        key = (record["model"], record["engine"], record["cluster"])
+        for phase, duration in phase_durations(record["markers"]).items():
+            groups.setdefault(key, {}).setdefault(phase, []).append(duration)
+    return [{"model": model, "engine": engine, "cluster": cluster, "phase": phase,
+             "count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95)}
+            for (model, engine, cluster), phases in sorted(groups.items())
+            for phase, values in sorted(phases.items(),
+                                        key=lambda item: PHASE_ORDER.index(item[0]) if item[0] in PHASE_ORDER else len(PHASE_ORDER))]
+
+
+@click.command()
+@click.argument('config_path', type=click.Path(exists=True))
+@click.option('--store', default="autospin-timeline.jsonl", show_default=True, help="Local JSONL store of the collected timelines.")
+@click.option('--time-window', default="24h", show_default=True, help="How far back to look for finished jobs (1h, 8h, 24h, 3d, 7d).")
+@click.option('--report-only', is_flag=True, help="Only report the timelines already in the store.")
+@click.option('--json', 'as_json', is_flag=True, help="Print the report as JSON.")
+def main(config_path, store, time_window, report_only, as_json):
+    """Collects the cold-start phase markers of autospin jobs and reports per-phase p50/p95."""
+    config = resolve_env(load_config(config_path))
+    records = load_store(store)
+
+    if not report_only:
+        collected = asyncio.run(collect_once(config, records, time_window))
+        if collected is None:
+            return
+        save_store(store, records)
+        click.echo(f"Collected {collected} job timelines, {len(records)} in {store}", err=True)
+
+    rows = report(records)
+    if as_json:
+        click.echo(json.dumps(rows, indent=2))
+        return
+    click.echo(f"{'MODEL':30} {'ENGINE':8} {'CLUSTER':9} {'PHASE':30} {'N':>4} {'P50':>9} {'P95':>9}")
+    for row in rows:
+        phase = PHASE_LABELS.get(row["phase"], row["phase"])
+        click.echo(f"{row['model'][-30:]:30} {row['engine']:8} {row['cluster']:9} {phase:30} {row['count']:>4} {row['p50']:>8.1f}s {row['p95']:>8.1f}s")
+
+
+if __name__ == '__main__':
+    main()
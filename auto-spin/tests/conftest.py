@@ -0,0 +1,16 @@
+import importlib.util
+import os
+import sys
+import pytest
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+sys.path.insert(0, SRC)
+
+
+@pytest.fixture(scope="session")
+def spawn_model():
+    """The spawn-model.py entry point, its name isn't importable."""
+    spec = importlib.util.spec_from_file_location("spawn_model", os.path.join(SRC, "autospin", "spawn-model.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,24 @@
+from autospin.autoscale import AutoscaleConfig, ScaleState, desired_instances
+from autospin.config import Config
+from autospin.state import State
+
+MODEL = {"model_name": "m", "model_path": "/m", "model_args": "", "sub_process": "python3 -m sglang.launch_server",
+         "environment": "env", "serving_engine": "sglang", "time_limit": "01:00:00", "ocf_version": "v0.1.8"}
+CONFIG = {"client_id": "c", "client_secret": "s", "user_id": "u", "token_uri": "t", "firecrest_uri": "f",
+          "system_name": "clariden", "account": "a", "bootstrap_addr": "b"}
+
+
+def test_clamp_without_sample_keeps_smoothed_unset():
+    scaled = desired_instances(ScaleState(instances=0), None, AutoscaleConfig(target=4), 1, 4)
+    assert scaled.instances == 1
+    assert scaled.smoothed is None
+
+
+def test_apply_autoscaling_clamps_before_the_first_sample(spawn_model, capsys):
+    config = Config.model_validate({**CONFIG, "models": {
+        "m": {**MODEL, "min_instances": 1, "max_instances": 4, "autoscale": {"target": 4}}}})
+    state = State()
+    counts = spawn_model.apply_autoscaling(config, spawn_model.generate_jobs(config), [], state)
+    assert counts == {"m": 1}
+    assert state.scaling["m"].instances == 1
+    assert "running_requests=n/a" in capsys.readouterr().out
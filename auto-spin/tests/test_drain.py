@@ -0,0 +1,33 @@
+import os
+import signal
+import threading
+import time
+import pytest
+from pydantic import ValidationError
+from autospin.config import ModelConfig
+from autospin.scripts import jobctl
+from test_autoscale import MODEL
+
+
+def test_drain_must_start_after_the_job():
+    with pytest.raises(ValidationError, match="drain_timeout 3600s plus the 60s margin"):
+        ModelConfig.model_validate({**MODEL, "time_limit": "01:00:00", "drain_timeout": 3600})
+    assert ModelConfig.model_validate({**MODEL, "time_limit": "01:00:00", "drain_timeout": 0}).drain_timeout == 0
+
+
+def test_usr1_during_startup_stops_without_draining(capsys):
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGUSR1)}
+    # nothing listens on the URL, the engine never becomes ready
+    timer = threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGUSR1))
+    timer.start()
+    started = time.monotonic()
+    try:
+        code = jobctl.main(["supervise", "--serve", "sleep 60", "--url", "http://127.0.0.1:9", "--interval", "0.1",
+                            "--drain-timeout", "30"])
+    finally:
+        timer.cancel()
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    assert code == 0
+    assert time.monotonic() - started < 15
+    assert "draining" not in capsys.readouterr().err
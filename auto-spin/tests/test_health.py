@@ -0,0 +1,13 @@
+from autospin import health
+from autospin.health import HealthConfig, check_health
+
+
+def test_running_job_without_start_time_gets_the_startup_grace(monkeypatch):
+    probed = []
+    monkeypatch.setattr(health, "probe_jobs", lambda jobs, config: probed.append([job["jobId"] for job in jobs]) or {})
+    job = {"jobId": 7, "name": "+as-m-0@abc", "status": {"state": "RUNNING"}, "time": {"start": None}}
+    config, probes = HealthConfig(url="http://{node}:8080/health", startup_grace=600), {}
+    check_health([job], config, probes, now=1000.0)
+    check_health([job], config, probes, now=1500.0)
+    check_health([job], config, probes, now=1600.0)
+    assert probed == [[], [], [7]]
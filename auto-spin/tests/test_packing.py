@@ -0,0 +1,20 @@
+import pytest
+from autospin.packing import PackItem, place_models
+
+
+def test_place_models_fills_nodes_per_group():
+    items = [("a", PackItem(model_id="small", instance=i, gpus=1)) for i in range(3)]
+    items += [("a", PackItem(model_id="large", instance=0, gpus=2)), ("b", PackItem(model_id="other", instance=0, gpus=1))]
+    bins = place_models(items)
+    assert [(node.group, [(item.model_id, item.instance) for item in node.items], node.used) for node in bins] == [
+        ("a", [("large", 0), ("small", 0), ("small", 1)], 4),
+        ("a", [("small", 2)], 1),
+        ("b", [("other", 0)], 1),
+    ]
+    # the same models land on the same nodes whatever their order in the config
+    assert place_models(list(reversed(items))) == bins
+
+
+def test_place_models_rejects_items_larger_than_a_node():
+    with pytest.raises(ValueError, match="big needs 8 GPUs"):
+        place_models([("a", PackItem(model_id="big", instance=0, gpus=8))])
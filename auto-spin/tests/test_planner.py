@@ -0,0 +1,49 @@
+from autospin.planner import ActiveJob, DesiredJob, build_plan
+
+SLOT = "+as-m-0"
+
+
+def desired(spec_hash: str) -> DesiredJob:
+    return DesiredJob(slot=SLOT, model_id="m", instance=0, spec_hash=spec_hash, script="")
+
+
+def active(job_id: str, spec_hash: str, state: str = "RUNNING") -> ActiveJob:
+    return ActiveJob(name=f"{SLOT}@{spec_hash}", job_id=job_id, state=state, slot=SLOT, spec_hash=spec_hash)
+
+
+def test_replace_submits_without_cancelling_the_stale_job(spawn_model):
+    plan = build_plan({SLOT: desired("new")}, {SLOT: [active("1", "old")]})
+    assert [entry.desired.name for entry in plan.replace] == [f"{SLOT}@new"]
+    assert [action.kind for action in spawn_model.plan_actions(plan, spawn_model.RenewalPlan())] == ["submit"]
+
+
+def test_stale_job_waits_for_a_pending_replacement():
+    plan = build_plan({SLOT: desired("new")}, {SLOT: [active("1", "old"), active("2", "new", "PENDING")]})
+    assert not plan.cancel
+    assert [job.job_id for entry in plan.wait for job in entry.active] == ["1"]
+
+
+def test_stale_job_is_cancelled_once_the_replacement_runs():
+    plan = build_plan({SLOT: desired("new")}, {SLOT: [active("1", "old"), active("2", "new")]})
+    assert [job.job_id for entry in plan.keep for job in entry.active] == ["2"]
+    assert [job.job_id for entry in plan.cancel for job in entry.active] == ["1"]
+
+
+def test_running_duplicate_is_kept_over_a_pending_one():
+    plan = build_plan({SLOT: desired("h")}, {SLOT: [active("1", "h", "PENDING"), active("2", "h")]})
+    assert [job.job_id for entry in plan.keep for job in entry.active] == ["2"]
+    assert [job.job_id for entry in plan.cancel for job in entry.active] == ["1"]
+
+
+def test_unhealthy_job_is_cancelled_with_its_replacement_submitted(spawn_model):
+    plan = build_plan({SLOT: desired("h")}, {SLOT: [active("1", "h")]}, unhealthy={"1"})
+    actions = spawn_model.plan_actions(plan, spawn_model.RenewalPlan())
+    # the replacement has the same name, singleton would hold it until the unhealthy job ends
+    assert [(action.kind, action.job_name) for action in actions] == [("submit", f"{SLOT}@h"), ("cancel", f"{SLOT}@h")]
+
+
+def test_unhealthy_job_does_not_wait_for_its_pending_replacement():
+    plan = build_plan({SLOT: desired("h")}, {SLOT: [active("1", "h"), active("2", "h", "PENDING")]}, unhealthy={"1"})
+    assert not plan.wait
+    assert [job.job_id for entry in plan.keep for job in entry.active] == ["2"]
+    assert [job.job_id for entry in plan.cancel for job in entry.active] == ["1"]
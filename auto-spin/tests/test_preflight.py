@@ -0,0 +1,72 @@
+import asyncio
+import time
+from autospin.client import _cache_file, _write_cache
+from autospin.config import Config
+from autospin.preflight import preflight
+from test_autoscale import CONFIG, MODEL
+
+
+class NoSuchFile(Exception):
+    pass
+
+
+class FakeClient:
+    """Firecrest stat/view of an in-memory file tree, failing `flaky` paths a number of times."""
+
+    def __init__(self, files, flaky=None):
+        self.files, self.flaky, self.calls = files, dict(flaky or {}), []
+
+    async def stat(self, system_name, path):
+        self.calls.append(("stat", path))
+        if self.flaky.get(path, 0) > 0:
+            self.flaky[path] -= 1
+            raise RuntimeError("last request: 502 Bad Gateway")
+        if path not in self.files:
+            raise NoSuchFile(f"stat: cannot statx '{path}': No such file or directory")
+        return {"mtime": 1}
+
+    async def view(self, system_name, path):
+        self.calls.append(("view", path))
+        return self.files[path]
+
+
+def config(tmp_path, **overrides):
+    return Config.model_validate({**CONFIG, "cache_dir": str(tmp_path), "retry_backoff": 0, "models": {
+        "m": {**MODEL, "environment": "/env.toml", "instances": 1}}, **overrides})
+
+
+def test_only_not_found_paths_are_missing(tmp_path):
+    client = FakeClient({"/m/config.json": '{"num_attention_heads": 8}'}, flaky={"/m/config.json": 2})
+    errors = asyncio.run(preflight(client, config(tmp_path)))
+    assert errors == {"m": ["environment /env.toml is not readable: stat: cannot statx '/env.toml': No such file or directory"]}
+    # the transient failures were retried, the missing file was not
+    assert client.calls.count(("stat", "/m/config.json")) == 3
+    assert client.calls.count(("stat", "/env.toml")) == 1
+
+
+def test_unreachable_paths_skip_their_checks(tmp_path, capsys):
+    client = FakeClient({"/env.toml": "", "/m/config.json": "{}"}, flaky={"/env.toml": 10})
+    assert asyncio.run(preflight(client, config(tmp_path, max_retries=1))) == {}
+    assert "/env.toml could not be checked" in capsys.readouterr().out
+
+
+def test_existing_paths_are_not_stated_again_within_the_ttl(tmp_path):
+    files = {"/env.toml": 'image = "/images/server.sqsh"', "/images/server.sqsh": "", "/m/config.json": "{}"}
+    client = FakeClient(files)
+    assert asyncio.run(preflight(client, config(tmp_path))) == {}
+    assert len(client.calls) == 5
+    client.calls.clear()
+    assert asyncio.run(preflight(client, config(tmp_path))) == {}
+    assert client.calls == []
+    assert asyncio.run(preflight(client, config(tmp_path, preflight_ttl=0))) == {}
+    assert sorted(client.calls) == [("stat", path) for path in sorted(files)]
+
+
+def test_unknown_sp_flags_hold_the_model(tmp_path):
+    cfg = config(tmp_path)
+    cfg.models["m"].sub_process = "sp serve ${MODEL_PATH} --tp-size 4 --max-batchsize 8"
+    cfg.models["m"].model_args = "--reasoning-parser qwen3"
+    _write_cache(_cache_file(cfg, "docs", "sp-docs.txt"), {"text": "--tp-size N\n--max-batch-size N\n--reasoning-parser P",
+                                                           "fetched": time.time()})
+    client = FakeClient({"/env.toml": "", "/m/config.json": "{}"})
+    assert asyncio.run(preflight(client, cfg)) == {"m": ["sp has no option --max-batchsize, did you mean --max-batch-size?"]}
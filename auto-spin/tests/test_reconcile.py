@@ -0,0 +1,51 @@
+import asyncio
+from autospin.config import Config
+from test_autoscale import CONFIG, MODEL
+
+
+class FakeClient:
+    """Firecrest double whose submits fail `lost` times, after queuing the job when `queued_anyway` is set."""
+
+    def __init__(self, lost=1, queued_anyway=True):
+        self.lost, self.queued_anyway, self.queue, self.submits = lost, queued_anyway, [], 0
+
+    async def stat(self, system_name, path):
+        return {"mtime": 1}
+
+    async def view(self, system_name, path):
+        return "{}" if path.endswith(".json") else ""
+
+    async def job_info(self, system_name, allusers, account):
+        return self.queue
+
+    async def submit(self, system_name, script_str, account, working_dir):
+        self.submits += 1
+        name = script_str.split("#SBATCH --job-name=", 1)[1].split("\n", 1)[0]
+        if self.lost > 0:
+            self.lost -= 1
+            if self.queued_anyway:
+                self.queue.append({"name": name, "jobId": 1, "status": {"state": "PENDING"}})
+            raise TimeoutError("read timed out")
+        self.queue.append({"name": name, "jobId": 2, "status": {"state": "PENDING"}})
+        return {"jobId": 2}
+
+
+def reconcile(spawn_model, client, tmp_path):
+    config = Config.model_validate({**CONFIG, "cache_dir": str(tmp_path), "state_file": str(tmp_path / "state.json"),
+                                    "retry_backoff": 0, "models": {"m": {**MODEL, "instances": 1}}})
+    asyncio.run(spawn_model.reconcile(client, config, spawn_model.generate_jobs(config), []))
+
+
+def test_submit_that_queued_the_job_is_not_resubmitted(spawn_model, tmp_path, capsys):
+    client = FakeClient(queued_anyway=True)
+    reconcile(spawn_model, client, tmp_path)
+    assert client.submits == 1
+    assert len(client.queue) == 1
+    assert "scheduled after 2 attempts" in capsys.readouterr().out
+
+
+def test_submit_that_never_reached_slurm_is_retried(spawn_model, tmp_path):
+    client = FakeClient(queued_anyway=False)
+    reconcile(spawn_model, client, tmp_path)
+    assert client.submits == 2
+    assert [item["jobId"] for item in client.queue] == [2]
@@ -2,12 +2,17 @@
 # Interactive usage: spin-model *
 
 import argparse
+import json
 import os
 import random
 import re
+import socket
 import subprocess
 import sys
-import requests
+import time
+
+# Absolute path of this script, jobs call it back for the router and benchmarks
+SPIN_MODEL_PATH = os.path.realpath(__file__)
 
 # ANSI color codes
 RED = '\033[91m'
@@ -23,6 +28,195 @@ def print_success(msg):
     print(f"{GREEN}{msg}{RESET}")
 
 
+# On-disk cache for slow lookups (bootstrap address, SLURM accounts, help docs).
+# Entries older than their TTL are still served while a detached `spin-model cache-refresh`
+# fetches a new value; entries older than their max age are refetched in the foreground.
+CACHE_DIR = os.environ.get("SPIN_MODEL_CACHE", os.path.expanduser("~/.cache/spin-model"))
+NETWORK_TIMEOUT = 3
+BOOTSTRAP_URL = "http://148.187.108.172:8092/v1/dnt/bootstraps"
+FALLBACK_BOOTSTRAP_ADDR = "/ip4/148.187.108.172/tcp/43905/p2p/QmcMpnf39qfJcXssHrFFw7nvAioLd4SXKhzBZ4XMcLDoSU"
+DOCS_URL = "https://raw.githubusercontent.com/swiss-ai/model-spinning/refs/heads/main"
+JOBCTL_URL = f"{DOCS_URL}/auto-spin/src/autospin/scripts/jobctl.py"
+
+
+def fetch_url(url, timeout=NETWORK_TIMEOUT):
+    """GET `url` with a hard timeout, returns the body or None"""
+    # imported lazily, most invocations never touch the network
+    import urllib.request
+    import urllib.error
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.read().decode()
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+
+def fetch_bootstrap_addr():
+    body = fetch_url(BOOTSTRAP_URL)
+    try:
+        return json.loads(body)['bootstraps'][0] if body else None
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def fetch_user_accounts():
+    """Available SLURM accounts of the current user, None when sacctmgr fails"""
+    try:
+        result = subprocess.run(["sacctmgr", "show", "associations", f"user={os.environ.get('USER', '')}",
+                                 "format=account%20", "-n", "-P"],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    # Remove duplicates while preserving order
+    return list(dict.fromkeys(line.strip() for line in result.stdout.splitlines() if line.strip())) or None
+
+
+# key: (fetch function, ttl, max age) in seconds
+CACHE_ENTRIES = {
+    "bootstrap": (fetch_bootstrap_addr, 10 * 60, 7 * 24 * 3600),
+    "accounts": (fetch_user_accounts, 24 * 3600, 30 * 24 * 3600),
+    "sp-docs.txt": (lambda: fetch_url(f"{DOCS_URL}/sp-docs.txt", timeout=10), 7 * 24 * 3600, 365 * 24 * 3600),
+    "vllm-docs.txt": (lambda: fetch_url(f"{DOCS_URL}/vllm-docs.txt", timeout=10), 7 * 24 * 3600, 365 * 24 * 3600),
+}
+
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def cache_load(key):
+    """Returns (value, age in seconds) of a cache entry, (None, None) when missing"""
+    try:
+        with open(_cache_path(key), 'r') as f:
+            entry = json.load(f)
+        return entry["value"], time.time() - entry["fetched"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, None
+
+
+def cache_store(key, value):
+    import tempfile
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{key}-")
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"value": value, "fetched": time.time()}, f)
+        os.replace(tmp_path, _cache_path(key))
+    except OSError as e:
+        print_warning(f"Warning: Could not write cache entry {key}: {e}")
+
+
+# In-job helpers (prestage, wait-ready, warm-up, supervisor, telemetry sampler) shared with autospin jobs,
+# standard library only so that jobs run them in any container. spin-model loads them on first use only.
+_jobctl = None
+
+
+def jobctl_source_path():
+    """jobctl.py next to this script, in its repository checkout, or downloaded once to the cache directory"""
+    here = os.path.dirname(SPIN_MODEL_PATH)
+    for path in (os.path.join(here, "jobctl.py"), os.path.join(here, "auto-spin", "src", "autospin", "scripts", "jobctl.py")):
+        if os.path.isfile(path):
+            return path
+    path = os.path.join(CACHE_DIR, "jobctl.py")
+    if not os.path.isfile(path):
+        source = fetch_url(JOBCTL_URL, timeout=30)
+        if not source:
+            print_warning(f"Error: jobctl.py is not next to {SPIN_MODEL_PATH} and could not be downloaded from {JOBCTL_URL}")
+            sys.exit(1)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(f"{path}.{os.getpid()}", "w") as f:
+            f.write(source)
+        os.replace(f"{path}.{os.getpid()}", path)
+    return path
+
+
+def load_jobctl():
+    """The jobctl module, loaded by the commands that use it"""
+    global _jobctl
+    if _jobctl is None:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location("jobctl", jobctl_source_path())
+        _jobctl = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_jobctl)
+    return _jobctl
+
+
+def job_jobctl(logs_dir):
+    """Copy of jobctl.py next to the job scripts, named after its content so that queued jobs keep their version"""
+    import hashlib
+    with open(jobctl_source_path()) as f:
+        source = f.read()
+    path = os.path.join(logs_dir, "slurm_scripts", f"jobctl-{hashlib.sha256(source.encode()).hexdigest()[:12]}.py")
+    if not os.path.isfile(path):
+        with open(f"{path}.{os.getpid()}", "w") as f:
+            f.write(source)
+        os.replace(f"{path}.{os.getpid()}", path)
+    return path
+
+
+def cache_refresh(key):
+    """Fetch `key` in the foreground and store it, returns the new value or None"""
+    fetch = CACHE_ENTRIES[key][0]
+    value = fetch()
+    if value is not None:
+        cache_store(key, value)
+    return value
+
+
+def _refresh_in_background(key):
+    lock = os.path.join(CACHE_DIR, f".{key}.refreshing")
+    try:
+        # a refresh started in the last minute is still running or has failed, don't pile up
+        if time.time() - os.path.getmtime(lock) < 60:
+            return
+    except OSError:
+        pass
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(lock, 'w'):
+            pass
+        subprocess.Popen([sys.executable, SPIN_MODEL_PATH, "cache-refresh", key],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         start_new_session=True)
+    except OSError:
+        pass
+
+
+def cached(key):
+    """Value of a cache entry with stale-while-revalidate, None when it can't be fetched"""
+    _, ttl, max_age = CACHE_ENTRIES[key]
+    value, age = cache_load(key)
+    if value is not None and age < ttl:
+        return value
+    if value is not None and age < max_age:
+        _refresh_in_background(key)
+        return value
+    return cache_refresh(key) or value
+
+
+def cache_refresh_command(argv):
+    """Entry point of `spin-model cache-refresh [KEY ...]`, refreshes all entries by default"""
+    parser = argparse.ArgumentParser(prog="spin-model cache-refresh", description="Refresh the spin-model lookup cache")
+    parser.add_argument("keys", nargs="*", metavar="KEY", help=f"cache entries to refresh: {', '.join(CACHE_ENTRIES)}")
+    args = parser.parse_args(argv)
+    unknown = [key for key in args.keys if key not in CACHE_ENTRIES]
+    if unknown:
+        parser.error(f"unknown cache entries: {', '.join(unknown)}")
+    failed = 0
+    for key in args.keys or list(CACHE_ENTRIES):
+        if cache_refresh(key) is None:
+            # the lock is kept so that background refreshes of an unreachable source are throttled
+            failed += 1
+            continue
+        try:
+            os.remove(os.path.join(CACHE_DIR, f".{key}.refreshing"))
+        except OSError:
+            pass
+    return 1 if failed else 0
+
+
 def get_saved_account():
     """Load saved account from config file"""
     config_file = os.path.expanduser("~/.spin-model-config")
@@ -59,25 +253,11 @@ def save_account(account):
 
 def get_user_accounts():
     """Get list of available SLURM accounts for current user"""
-    try:
-        cmd = "sacctmgr show associations user=$USER format=account%20 -n -P"
-        result = run_cmd(cmd, shell=True)
-        if result.returncode == 0:
-            accounts = [line.strip() for line in result.stdout.strip().split('\n') if line.strip()]
-            # Remove duplicates while preserving order
-            seen = set()
-            unique_accounts = []
-            for account in accounts:
-                if account not in seen:
-                    seen.add(account)
-                    unique_accounts.append(account)
-            return unique_accounts
-        else:
-            print_warning("Could not retrieve accounts using sacctmgr")
-            return []
-    except Exception as e:
-        print_warning(f"Error getting accounts: {e}")
+    accounts = cached("accounts")
+    if not accounts:
+        print_warning("Could not retrieve accounts using sacctmgr")
         return []
+    return accounts
 
 
 def interactive_account_selection():
@@ -114,6 +294,252 @@ def interactive_account_selection():
             return None
 
 
+# Shared cache of OCF release binaries on cluster storage, see resolve_ocf below
+OCF_VERSION = "v0.1.8"
+OCF_CACHE_DIR = os.environ.get("SPIN_MODEL_OCF_CACHE", "/capstor/store/cscs/swissai/infra01/ocf-cache")
+
+# Bash function of the job script that resolves the OCF binary through the cache:
+#   <cache>/blobs/<sha256>               the binary, named by its checksum
+#   <cache>/<version>/ocf-<arch>.sha256  checksum of a released version/arch
+# A hit is verified against its checksum, a miss downloads the release once and publishes it atomically.
+OCF_CACHE_FUNCTION = r"""resolve_ocf() {
+    local version=$1 arch=$2 expected=$3 cache=$4
+    local index="$cache/$version/ocf-$arch.sha256"
+    local digest tmp
+    if [ -f "$index" ]; then
+        digest=$(cat "$index")
+        if { [ -z "$expected" ] || [ "$digest" = "$expected" ]; } && [ -x "$cache/blobs/$digest" ] \
+            && echo "$digest  $cache/blobs/$digest" | sha256sum -c --status; then
+            echo "$cache/blobs/$digest"
+            return 0
+        fi
+        echo "OCF cache entry $index is stale or corrupt, downloading again" >&2
+    fi
+    mkdir -p "$cache/blobs" "$cache/$version" || return 1
+    tmp=$(mktemp "$cache/blobs/.download-XXXXXX") || return 1
+    if ! curl -fsSL --retry 3 "https://github.com/ResearchComputer/OpenComputeFramework/releases/download/$version/ocf-$arch" -o "$tmp"; then
+        rm -f "$tmp"
+        return 1
+    fi
+    digest=$(sha256sum "$tmp" | cut -d' ' -f1)
+    if [ -n "$expected" ] && [ "$digest" != "$expected" ]; then
+        echo "OCF $version/$arch checksum mismatch: expected $expected, got $digest" >&2
+        rm -f "$tmp"
+        return 1
+    fi
+    chmod 755 "$tmp"
+    mv -f "$tmp" "$cache/blobs/$digest"
+    echo "$digest" > "$index.$$" && mv -f "$index.$$" "$index"
+    echo "$cache/blobs/$digest"
+}"""
+
+
+# Replaced by the instance index when -n instances are submitted as separate jobs
+INSTANCE_PLACEHOLDER = "@SPIN_MODEL_INSTANCE@"
+
+# Cold-start phase markers: the job appends "<phase> <epoch>" lines to $SPIN_TIMELINE,
+# `spin-model timeline` collects them into TIMELINE_STORE and reports per-phase percentiles
+TIMELINE_FUNCTION = r"""spin_phase() {
+    echo "$1 ${EPOCHREALTIME:-$(date +%s)}" >> "$SPIN_TIMELINE"
+    echo "[spin-phase] $1"
+}"""
+PHASE_LABELS = {
+    "job_start": "queue wait",
+    "container_start": "container start",
+    "ocf_ready": "ocf download",
+    "prestage_done": "prestage",
+    "server_ready": "weight load + first response",
+    "warmup_done": "prefix warm-up",
+}
+PHASE_ORDER = list(PHASE_LABELS) + ["total"]
+
+# Graceful drain: SLURM sends USR1 to the job shell DRAIN_SECONDS + DRAIN_MARGIN before the time limit.
+# The shell passes it on to the supervisors, which deregister from OCF, give in-flight requests up to the
+# drain window (registry "drain" or --drain) and stop the engine within the margin.
+DRAIN_SECONDS = 120
+DRAIN_MARGIN = 60
+DRAIN_TRAP = "trap 'kill -USR1 $(jobs -p) 2>/dev/null' USR1"
+# the trapped signal ends the first wait, the second one waits for the drained servers
+DRAIN_WAIT = "wait; wait"
+
+
+# Rendezvous ports on the head node of multi-node launches
+DIST_INIT_PORT = 29500
+RAY_PORT = 6379
+
+# Clusters spin-model submits to, detected from the login node hostname
+CLUSTERS = {
+    "bristen": {
+        "hostname_prefix": "nid",
+        "message": "It's bristen so be aware that the time is limited and you can run a model up to 1 hour. While on clariden up to 24",
+        "partition": "",
+        # partitions --placement considers, "" is the cluster default partition
+        "partitions": [""],
+        "max_time": 3600,
+        "ocf_command": "/ocfbin/ocf-v2",
+        "ocf_arch": "amd64",
+        "nccl_so_path": "/usr/lib/x86_64-linux-gnu/",
+        "environment": "/capstor/store/cscs/swissai/a09/xyao/llm_service/sp.toml",
+        # registry environments are built for x86 and only used here
+        "registry_environment": True,
+    },
+    "clariden": {
+        "hostname_prefix": "clariden",
+        "message": "Clariden node is used",
+        "partition": "#SBATCH --partition=normal",
+        "partitions": ["normal"],
+        "max_time": 24 * 3600,
+        "ocf_command": "/ocfbin/ocf-arm",
+        "ocf_arch": "arm64",
+        "nccl_so_path": "/usr/lib/aarch64-linux-gnu/",
+        "environment": "/capstor/store/cscs/swissai/a09/xyao/llm_service/clariden/sp-arm.toml",
+        "registry_environment": False,
+    },
+}
+
+
+def detect_cluster():
+    """Name of the cluster of the current login node, None when unknown"""
+    hostname = socket.gethostname()
+    return next((name for name, cluster in CLUSTERS.items() if hostname.startswith(cluster["hostname_prefix"])), None)
+
+
+def parse_sinfo_idle(text):
+    """Idle node count per partition from `sinfo -h -o %R|%T|%D` output, the default partition is also counted under """""
+    idle = {}
+    for row in text.splitlines():
+        fields = row.strip().split("|")
+        # `sinfo -M` prefixes its output with a CLUSTER: line
+        if len(fields) != 3 or not fields[2].isdigit():
+            continue
+        partition, state, count = fields
+        if state.rstrip("*~#") != "idle":
+            continue
+        idle[partition] = idle.get(partition, 0) + int(count)
+    return idle
+
+
+def parse_slurm_time(value):
+    """Epoch of a Slurm timestamp like 2025-06-01T10:00:00, None for N/A and unknown values"""
+    try:
+        return time.mktime(time.strptime(value.strip(), "%Y-%m-%dT%H:%M:%S"))
+    except ValueError:
+        return None
+
+
+def parse_test_only(text):
+    """Estimated start of `sbatch --test-only` output, None when it wasn't reported"""
+    match = re.search(r"to start at (\S+)", text)
+    return parse_slurm_time(match.group(1)) if match else None
+
+
+def parse_squeue_start(text):
+    """Latest estimated start of the pending jobs in `squeue --start -h -o %S` output, None without estimates"""
+    starts = [start for start in map(parse_slurm_time, text.splitlines()) if start is not None]
+    return max(starts) if starts else None
+
+
+def _slurm_output(cmd):
+    """stdout and stderr of a Slurm query, "" when it failed"""
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return ""
+    return result.stdout + result.stderr if result.returncode == 0 else ""
+
+
+def estimate_start(name, partition, nodes, slurm_time, account, local):
+    """Estimated start of a job on a cluster partition: now when enough nodes are idle, otherwise the
+    scheduler's estimate from `sbatch --test-only`, falling back to the pending jobs of `squeue --start`"""
+    cluster_flags = [] if name == local else [f"--clusters={name}"]
+    partition_flags = [f"--partition={partition}"] if partition else []
+    idle = parse_sinfo_idle(_slurm_output(["sinfo", "-h", "-o", "%R|%T|%D"] + cluster_flags + partition_flags))
+    if sum(idle.values()) >= nodes:
+        return time.time()
+    start = parse_test_only(_slurm_output(["sbatch", "--test-only", f"--nodes={nodes}", f"--time={slurm_time}",
+                                           f"--account={account}", "--wrap=true"] + cluster_flags + partition_flags))
+    if start is None:
+        start = parse_squeue_start(_slurm_output(["squeue", "--start", "-h", "-t", "PD", "-o", "%S"]
+                                                 + cluster_flags + partition_flags))
+    return start
+
+
+def place_job(model_names, nodes, slurm_time, account):
+    """(cluster, partition) with the earliest estimated start among the eligible ones, None when none is.
+    Bristen only takes jobs up to its time limit and Apertus only runs on bristen."""
+    local = detect_cluster()
+    hours, minutes, seconds = (int(part) for part in slurm_time.split(":"))
+    seconds += hours * 3600 + minutes * 60
+    candidates = []
+    for name, cluster in CLUSTERS.items():
+        if seconds > cluster["max_time"]:
+            print(f"Placement: {name} skipped, {slurm_time} exceeds its time limit")
+            continue
+        if name == "clariden" and any("apertus" in model_name.lower() for model_name in model_names):
+            print(f"Placement: {name} skipped, Apertus only runs on bristen")
+            continue
+        for partition in cluster["partitions"]:
+            start = estimate_start(name, partition, nodes, slurm_time, account, local)
+            label = f"{name}/{partition or 'default'}"
+            if start is None:
+                print(f"Placement: {label} has no start estimate")
+                continue
+            wait = max(0, start - time.time())
+            print(f"Placement: {label} estimated to start in {wait / 60:.0f} min")
+            candidates.append((wait, name != local, name, partition))
+    if not candidates:
+        return None
+    # the local cluster wins ties
+    _, _, name, partition = min(candidates)
+    return name, partition
+
+
+def select_cluster(args, model_names, nodes, slurm_time):
+    """Cluster, #SBATCH partition/cluster header lines and the cluster description to submit to:
+    the login node's cluster, or with --placement the one expected to start the job first"""
+    if not args.placement:
+        node = detect_cluster()
+        if node is None:
+            print("It's neither clariden nor bristen node. Aborting")
+            return None, None, None
+        cluster = CLUSTERS[node]
+        print(cluster["message"])
+        return node, cluster["partition"], cluster
+    placed = place_job(model_names, nodes, slurm_time, args.account)
+    if placed is None:
+        print_warning("Error: No cluster can take this job, check the time limit and the model constraints")
+        return None, None, None
+    node, partition = placed
+    cluster = CLUSTERS[node]
+    header = [f"#SBATCH --partition={partition}"] if partition else []
+    if node != detect_cluster():
+        header.append(f"#SBATCH --clusters={node}")
+    print_success(f"Placement: submitting to {node}/{partition or 'default'}")
+    print(cluster["message"])
+    return node, "\n".join(header), cluster
+
+
+def get_logs_dir():
+    """~/spinning-logs with its slurm_scripts directory, created if needed"""
+    home_dir = os.environ.get('HOME')
+    if not home_dir:
+        print_warning("Warning: HOME environment variable not set")
+        random_bytes = random.randbytes(8).hex()
+        home_dir = f"/tmp/{random_bytes}"
+        try:
+            os.makedirs(home_dir, exist_ok=True)
+            print_success(f"Created temporary directory at: {home_dir}")
+        except Exception as e:
+            print_warning(f"Failed to create temporary directory: {e}")
+            sys.exit(1)
+    logs_dir = os.path.join(home_dir, 'spinning-logs')
+    
+    # Create logs directory if it doesn't exist
+    os.makedirs(logs_dir, exist_ok=True)
+    os.makedirs(os.path.join(logs_dir, 'slurm_scripts'), exist_ok=True)
+    return logs_dir
+
+
 # General default configuration
 GENERAL_CONFIG = {
     "--host": "0.0.0.0",
@@ -146,6 +572,8 @@ MODEL_REGISTRY = {
         "engine": "python3 -m sglang.launch_server",
         "node": "bristen",
         "environment": "/capstor/store/cscs/swissai/a09/xyao/llm_service/sgl.toml",
+        # reasoning traces take minutes to stream
+        "drain": 300,
         "kwargs": {
             "--model-path": "Qwen/Qwen3-32B",
             "--max-prefill-tokens": 32768,
@@ -198,6 +626,19 @@ MODEL_REGISTRY = {
 }
 
 
+def serve_args(model_kwargs):
+    """Command line arguments of serving kwargs, True keeps the flag bare and False drops it"""
+    return " ".join(flag if value is True else f"{flag} {value}" for flag, value in model_kwargs.items() if value is not False)
+
+
+def registry_command(model_config, model_kwargs, model_path=None):
+    """Serve command of a registry entry with `model_kwargs`, sp serve takes the checkpoint as its first argument"""
+    engine_cmd = model_config["engine"]
+    if engine_cmd.startswith("sp serve"):
+        return f"{engine_cmd} {model_path or model_config['path']} {serve_args(model_kwargs)}"
+    return f"{engine_cmd} {serve_args(model_kwargs)}"
+
+
 def list_models():
     """Display available models in the registry"""
     print_success("Available models:")
@@ -270,22 +711,20 @@ def run_cmd(cmd, shell=False):
 
 
 def get_help_content(filename):
-    repo = "https://raw.githubusercontent.com/swiss-ai/model-spinning/refs/heads/main"
-    url = f"{repo}/{filename}"
-    
-    try:
-        # Try to fetch from GitHub first
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.text
-        
-        print(f"Failed to fetch {url}, status: {response.status_code}")
-    except Exception as e:
-        print(f"Failed to fetch from GitHub: {e}")
+    # Docs shipped next to the script (repository checkout) win over the cached GitHub copy
+    local_path = os.path.join(os.path.dirname(SPIN_MODEL_PATH), filename)
+    if os.path.exists(local_path):
+        with open(local_path, 'r') as f:
+            return f.read()
+    content = cached(filename)
+    if content is None:
+        print(f"Failed to fetch {DOCS_URL}/{filename}")
+    return content
 
 
 def submit_job(job_script, logs_dir):
-    """Saves the job script, submits it with sbatch, and returns the job ID."""
+    """Saves the job script, submits it with sbatch, and returns the job ID.
+    For array scripts this is the array job ID, tasks are <jobid>_<index>."""
     rand_suffix = ''.join(random.choices('0123456789abcdef', k=10))
     script_path = os.path.join(logs_dir, 'slurm_scripts', f'run_{rand_suffix}.sh')
     
@@ -305,210 +744,2104 @@ def submit_job(job_script, logs_dir):
         return None
 
 
-def main():
-    # Parse arguments
-    parser = argparse.ArgumentParser(description="Launch a model on SLURM")
-    parser.add_argument("--model", help="Name of the model to launch (deprecated, use -m)")
-    parser.add_argument("-m", "--model-id", type=int, help="Model ID from registry (use -l to list available models)")
-    parser.add_argument("-l", "--list", action="store_true", help="List available models in registry")
-    parser.add_argument("--login", action="store_true", help="Interactive account selection and save for future use")
-    parser.add_argument("-t", "--time", default="1h", help="Time duration for the job. Examples: 2h, 1h30m, 90m, 1:30:00")
-    parser.add_argument("-n", "--num-instances", type=int, default=1, help="Number of model instances to launch.")
-    parser.add_argument("--vllm", action="store_true", help="Use vllm instead of sp to serve the model (overrides registry)")
-    parser.add_argument("--sgl", action="store_true", help="Use sglang instead of sp to serve the model (overrides registry)")
-    parser.add_argument("--vllm-help", action="store_true", help="Show available options for **vllm** model server")
-    parser.add_argument("--sp-help", action="store_true", help="Show available options for **sp** model server")
-    parser.add_argument("-a", "--account", help="Slurm account to use for job submission")
-    parser.add_argument("-v", "--var", action="append", help="Specify environment variables in format KEY=VALUE", default=[])
-    parser.add_argument("-e", "--environment", help="Specify a custom environment file path")
-    # Parse only known arguments, leaving the rest for the sp command
-    args, extra_args = parser.parse_known_args()
-    served_model_name = next((extra_args[i+1] for i, arg in enumerate(extra_args) if arg == '--served-model-name'), None)
-    if served_model_name and '--' in served_model_name:
-        print_warning("[Warning] The served model name contains dashes (--). This may cause issues.")
-    
-    if args.vllm_help:
-        print(get_help_content("vllm-docs.txt"))
-        sys.exit(0)
+# Memory planner: derives tp size, context length and memory fraction from the checkpoint
+GPUS_PER_NODE = 4
+GPU_MEMORY_GB = {"bristen": 80, "clariden": 96}
+# GPU memory left outside of weights and KV cache (activations, CUDA graphs, NCCL buffers)
+PLAN_RESERVE_GB = 8
+DTYPE_BYTES = {"F64": 8, "F32": 4, "F16": 2, "BF16": 2, "F8_E4M3": 1, "F8_E5M2": 1, "I64": 8, "I32": 4,
+               "I16": 2, "I8": 1, "U8": 1, "BOOL": 1,
+               "float32": 4, "float16": 2, "bfloat16": 2, "float8_e4m3fn": 1}
+# engine: (tp flag, context flag, memory fraction flag)
+PLAN_FLAGS = {
+    "sp": ("--tp-size", "--context-length", "--mem-fraction-static"),
+    "sglang": ("--tp-size", "--context-length", "--mem-fraction-static"),
+    "vllm": ("--tensor-parallel-size", "--max-model-len", "--gpu-memory-utilization"),
+}
+HF_ENDPOINT = os.environ.get("HF_ENDPOINT", "https://huggingface.co")
 
-    if args.sp_help:
-        print(get_help_content("sp-docs.txt"))
-        sys.exit(0)
 
-    if args.list:
-        list_models()
-        sys.exit(0)
-    
-    if args.login:
-        account = interactive_account_selection()
-        if account:
-            print_success(f"Account '{account}' has been saved and will be used by default in future runs.")
-        sys.exit(0)
-    
-    # Check for interactive mode (spin-model *)
-    if len(sys.argv) == 2 and sys.argv[1] == '*':
-        print_success("Interactive mode activated!")
-        account = interactive_account_selection()
-        if not account:
-            sys.exit(1)
-        
-        # Show model list and get selection
-        list_models()
-        while True:
-            try:
-                model_choice = input(f"\nSelect model (1-{len(MODEL_REGISTRY)}): ").strip()
-                if model_choice.isdigit():
-                    model_id = int(model_choice)
-                    if model_id in MODEL_REGISTRY:
-                        # Set args as if they were passed via command line
-                        args.model_id = model_id
-                        args.account = account
-                        break
-                    else:
-                        print_warning(f"Please enter a number between 1 and {len(MODEL_REGISTRY)}")
-                else:
-                    print_warning("Please enter a valid number")
-            except KeyboardInterrupt:
-                print("\nExiting...")
-                sys.exit(0)
-            except EOFError:
-                print("\nExiting...")
-                sys.exit(0)
+def _hf_headers():
+    token = os.environ.get("HF_TOKEN") or os.environ.get("HUGGING_FACE_HUB_TOKEN")
+    return {"Authorization": f"Bearer {token}"} if token else {}
 
-    # Require either --model or -m
-    if not args.model and not args.model_id:
-        print_warning("Error: Either --model or -m (model ID) is required. Use -l to list available models.\n")
-        parser.print_help()
-        sys.exit(1)
-    
-    if args.model_id and args.model_id not in MODEL_REGISTRY:
-        print_warning(f"Error: Model ID {args.model_id} not found in registry. Use -l to list available models.")
-        sys.exit(1)
-    
-    # Handle account
-    if not args.account:
-        # Try to load saved account
-        saved_account = get_saved_account()
-        if saved_account:
-            args.account = saved_account
-            print_success(f"Using saved account: {saved_account}")
-        else:
-            print_warning("No account specified. Use --login to set up an account, or specify with -a/--account")
-            accounts = get_user_accounts()
-            if accounts:
-                print("Available accounts:")
-                for account in accounts:
-                    print(f"  - {account}")
-            print_warning("Please specify an account with -a/--account or use --login for interactive setup")
-            sys.exit(1)
 
-    # Store model information
-    if args.model_id:
-        model_config = MODEL_REGISTRY[args.model_id]
-        model = model_config["path"]
-        model_name = model_config["name"]
-        default_engine = model_config["engine"]
-        
-        # Union: general | model
-        model_kwargs = GENERAL_CONFIG | model_config["kwargs"]
-        tp_size = model_kwargs.get("--tp-size", 4)
-        
-        # Handle engine-specific argument mapping
-        extra_args_str = ' '.join(extra_args)
-        engine_name = default_engine.split()[0] if default_engine else "sp"
-        
-        if engine_name == "vllm" and "--tp-size" in extra_args_str:
-            extra_args_str = extra_args_str.replace("--tp-size", "--tensor-parallel-size")
-        
-        extra_args = extra_args_str.split() if extra_args_str else []
-    else:
-        # Legacy mode using --model
-        model = args.model
-        model_name = args.model
-        default_engine = "sp"
-        tp_size = 1
-        model_kwargs = {}
+def _fetch_hf(repo, filename, headers=None, timeout=10):
+    """Raw bytes of a file of a Hugging Face repo, None when unavailable"""
+    import urllib.request
+    import urllib.error
+    request = urllib.request.Request(f"{HF_ENDPOINT}/{repo}/resolve/main/{filename}", headers={**_hf_headers(), **(headers or {})})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.read()
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
 
-    print(f"Served model name: {served_model_name if served_model_name else (model_name if args.model_id else model)}")
 
-    # if not served_model_name:
-    #     save_model_logo(model)
+def _safetensors_bytes(header):
+    """Tensor bytes per dtype described by a safetensors header"""
+    by_dtype = {}
+    for name, tensor in header.items():
+        if name == "__metadata__":
+            continue
+        start, end = tensor["data_offsets"]
+        by_dtype[tensor["dtype"]] = by_dtype.get(tensor["dtype"], 0) + end - start
+    return by_dtype
 
-    # Get hostname to identify node type
-    hostname = run_cmd("hostname", shell=True).stdout.strip()
-
-    # Set partition and show message based on hostname
-    if hostname.startswith("nid"):
-        node = "bristen"
-        print("It's bristen so be aware that the time is limited and you can run a model up to 1 hour. While on clariden up to 24")
-        # partition = "debug"
-        # PARTITION = "#SBATCH --partition=debug"
-        PARTITION = ""
-        ocf_command = "/ocfbin/ocf-v2"
-        NCCL_SO_PATH = "export SP_NCCL_SO_PATH=/usr/lib/x86_64-linux-gnu/" 
-        if args.model_id and "environment" in model_config:
-            ENV_TOML = args.environment if args.environment else model_config["environment"]
-        else:
-            ENV_TOML = args.environment if args.environment else "/capstor/store/cscs/swissai/a09/xyao/llm_service/sp.toml"
-    elif hostname.startswith("clariden"):
-        node = "clariden"
-        print("Clariden node is used")
-        # partition = "normal"
-        PARTITION = "#SBATCH --partition=normal"
-        ocf_command = '/ocfbin/ocf-arm'
-        NCCL_SO_PATH = "export SP_NCCL_SO_PATH=/usr/lib/aarch64-linux-gnu/" 
-        ENV_TOML = args.environment if args.environment else "/capstor/store/cscs/swissai/a09/xyao/llm_service/clariden/sp-arm.toml"
-        if "apertus" in model.lower() or any("apertus" in arg.lower() for arg in extra_args):
-            print_warning("[Warning] It seems like you're trying to launch Apertus on Clariden. Please note that we can run Apertus only on Bristen.")
-    else:
-        print("It's neither clariden nor bristen node. Aborting")
-        sys.exit(1)
-    
-    # Default values
-    home_dir = os.environ.get('HOME')
-    if not home_dir:
-        print_warning("Warning: HOME environment variable not set")
-        random_bytes = random.randbytes(8).hex()
-        home_dir = f"/tmp/{random_bytes}"
-        try:
-            os.makedirs(home_dir, exist_ok=True)
-            print_success(f"Created temporary directory at: {home_dir}")
-        except Exception as e:
-            print_warning(f"Failed to create temporary directory: {e}")
-            sys.exit(1)
-    logs_dir = os.path.join(home_dir, 'spinning-logs')
-    
-    # Create logs directory if it doesn't exist
-    os.makedirs(logs_dir, exist_ok=True)
-    os.makedirs(os.path.join(logs_dir, 'slurm_scripts'), exist_ok=True)
+
+def _read_safetensors_header(path):
+    with open(path, 'rb') as f:
+        size = int.from_bytes(f.read(8), "little")
+        return json.loads(f.read(size))
+
+
+def _local_checkpoint_dir(model):
+    """Directory holding the checkpoint files of a local path or of the Hugging Face cache"""
+    if os.path.isdir(model):
+        return model
+    hub = os.path.join(os.environ.get("HF_HOME", os.path.expanduser("~/.cache/huggingface")), "hub")
+    snapshots = os.path.join(hub, f"models--{model.replace('/', '--')}", "snapshots")
+    if os.path.isdir(snapshots):
+        for revision in sorted(os.listdir(snapshots)):
+            if os.path.exists(os.path.join(snapshots, revision, "config.json")):
+                return os.path.join(snapshots, revision)
+    return None
+
+
+def read_checkpoint(model):
+    """Returns (config.json, weight bytes per dtype) of a local or Hugging Face checkpoint, (None, None) if unreadable"""
+    directory = _local_checkpoint_dir(model)
+    try:
+        if directory:
+            with open(os.path.join(directory, "config.json"), 'r') as f:
+                config = json.load(f)
+            weights = {}
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(".safetensors"):
+                    for dtype, size in _safetensors_bytes(_read_safetensors_header(os.path.join(directory, name))).items():
+                        weights[dtype] = weights.get(dtype, 0) + size
+            return config, weights
+        if os.path.isabs(model):
+            return None, None
+
+        config = json.loads(_fetch_hf(model, "config.json") or b"null")
+        if config is None:
+            return None, None
+        index = json.loads(_fetch_hf(model, "model.safetensors.index.json") or b"null")
+        if index and "total_size" in index.get("metadata", {}):
+            dtype = config.get("torch_dtype", "bfloat16")
+            return config, {dtype: int(index["metadata"]["total_size"])}
+        # single file checkpoint: read only its header with range requests
+        prefix = _fetch_hf(model, "model.safetensors", headers={"Range": "bytes=0-7"})
+        if not prefix or len(prefix) < 8:
+            return config, {}
+        size = int.from_bytes(prefix[:8], "little")
+        header = _fetch_hf(model, "model.safetensors", headers={"Range": f"bytes=8-{7 + size}"})
+        return config, _safetensors_bytes(json.loads(header)) if header else {}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print_warning(f"Warning: Could not read the checkpoint of {model}: {e}")
+        return None, None
+
+
+def kv_bytes_per_token(config, tp):
+    """KV-cache bytes of one token on one GPU at tensor parallelism `tp`"""
+    text = config.get("text_config", config)
+    layers = text["num_hidden_layers"]
+    dtype_bytes = DTYPE_BYTES.get(text.get("torch_dtype", config.get("torch_dtype", "bfloat16")), 2)
+    if text.get("kv_lora_rank"):
+        # multi-head latent attention caches one compressed vector per layer, replicated on every rank
+        return layers * (text["kv_lora_rank"] + text.get("qk_rope_head_dim", 0)) * dtype_bytes
+    heads = text["num_attention_heads"]
+    kv_heads = text.get("num_key_value_heads") or heads
+    head_dim = text.get("head_dim") or text["hidden_size"] // heads
+    # ranks beyond the number of KV heads hold a replica of a head
+    kv_heads_per_gpu = -(-kv_heads // tp)
+    return 2 * layers * kv_heads_per_gpu * head_dim * dtype_bytes
+
+
+def plan_memory(config, weights, gpu_memory_gb, context=None, nodes=1):
+    """Smallest valid tp size whose KV budget holds one full context, with the context length
+    and memory fraction to serve with. Returns None when even a full node can't hold the weights.
+    Multi-node launches shard over all GPUs of all nodes (vllm's tp x pp is treated as one tp)."""
+    text = config.get("text_config", config)
+    heads = text["num_attention_heads"]
+    max_context = text.get("max_position_embeddings") or config.get("max_position_embeddings") or 4096
+    context = min(context or max_context, max_context)
+    weight_bytes = sum(weights.values())
+    gpu_bytes = gpu_memory_gb * 1024 ** 3
+    mem_fraction = round(1 - PLAN_RESERVE_GB / gpu_memory_gb, 2)
+
+    fallback = None
+    candidates = [GPUS_PER_NODE * nodes] if nodes > 1 else [tp for tp in range(1, GPUS_PER_NODE + 1) if GPUS_PER_NODE % tp == 0]
+    for tp in [tp for tp in candidates if heads % tp == 0]:
+        kv_budget = gpu_bytes * mem_fraction - weight_bytes / tp
+        if kv_budget <= 0:
+            continue
+        kv_tokens = int(kv_budget // kv_bytes_per_token(config, tp))
+        plan = {"tp": tp, "context": context, "mem_fraction": mem_fraction, "weight_gb": weight_bytes / 1024 ** 3,
+                "dtypes": {dtype: size / 1024 ** 3 for dtype, size in weights.items()},
+                "weights_per_gpu_gb": weight_bytes / tp / 1024 ** 3, "kv_budget_gb": kv_budget / 1024 ** 3,
+                "kv_tokens": kv_tokens, "max_context": max_context}
+        if kv_tokens >= context:
+            return plan
+        fallback = plan
+    if fallback:
+        # the largest valid tp still can't hold a full context, shrink the context to what fits
+        fallback["context"] = fallback["kv_tokens"] // 1024 * 1024
+        if fallback["context"] > 0:
+            return fallback
+    return None
+
+
+def print_plan(model, plan, gpu_memory_gb):
+    dtypes = ", ".join(f"{dtype} {size:.1f} GB" for dtype, size in plan["dtypes"].items())
+    print_success(f"Memory plan for {model} on {gpu_memory_gb} GB GPUs:")
+    print(f"  weights:        {plan['weight_gb']:.1f} GB total, {plan['weights_per_gpu_gb']:.1f} GB per GPU ({dtypes})")
+    print(f"  tp size:        {plan['tp']}")
+    print(f"  mem fraction:   {plan['mem_fraction']}")
+    print(f"  KV cache:       {plan['kv_budget_gb']:.1f} GB per GPU = {plan['kv_tokens']} tokens")
+    print(f"  context length: {plan['context']} (model maximum {plan['max_context']}), "
+          f"{plan['kv_tokens'] // max(plan['context'], 1)} full-context sequences fit")
+
+
+def plan_flags(plan, engine):
+    tp_flag, context_flag, fraction_flag = PLAN_FLAGS[engine]
+    return {tp_flag: plan["tp"], context_flag: plan["context"], fraction_flag: plan["mem_fraction"]}
+
+
+def plan_command(argv):
+    """Entry point of `spin-model plan`: print the memory plan of a checkpoint without launching it"""
+    parser = argparse.ArgumentParser(prog="spin-model plan", description="Derive tp size, context length and memory fraction from a checkpoint")
+    parser.add_argument("model", help="Local checkpoint directory or Hugging Face model id")
+    parser.add_argument("--cluster", choices=list(GPU_MEMORY_GB), default="bristen")
+    parser.add_argument("--gpu-memory", type=float, help="GPU memory in GB (default: from --cluster)")
+    parser.add_argument("--context", type=int, help="Desired context length (default: the model maximum)")
+    parser.add_argument("--engine", choices=list(PLAN_FLAGS), default="sp")
+    args = parser.parse_args(argv)
+
+    gpu_memory = args.gpu_memory or GPU_MEMORY_GB[args.cluster]
+    config, weights = read_checkpoint(args.model)
+    if not config or not weights:
+        print_warning(f"Could not read config.json and weights of {args.model}")
+        return 1
+    plan = plan_memory(config, weights, gpu_memory, args.context)
+    if not plan:
+        print_warning(f"The weights of {args.model} don't fit on one node of {GPUS_PER_NODE}x{gpu_memory} GB")
+        return 1
+    print_plan(args.model, plan, gpu_memory)
+    print(serve_args(plan_flags(plan, args.engine)))
+    return 0
+
+
+def drain_signal(args, slurm_time):
+    """#SBATCH line asking for SIGUSR1 in time to drain before the time limit, empty without a drain window"""
+    if not args.drain:
+        return ""
+    hours, minutes, seconds = (int(part) for part in slurm_time.split(":"))
+    lead = int(args.drain) + DRAIN_MARGIN
+    if lead >= hours * 3600 + minutes * 60 + seconds:
+        print_warning(f"Warning: --time {slurm_time} is shorter than the {lead}s drain, the job won't drain")
+        return ""
+    return f"#SBATCH --signal=B:USR1@{lead}"
+
+
+def supervise_options(args):
+    """Options of the launch passed on to `spin-model supervise`"""
+    options = f"--max-restarts {args.max_restarts} --drain-timeout {args.drain:g} "
+    if args.warmup_corpus:
+        options += f"--warmup-corpus {os.path.abspath(args.warmup_corpus)} --warmup-concurrency {args.warmup_concurrency} "
+    return options
+
+
+def engine_label(serve_command):
+    """Short name of the serving engine of a serve command"""
+    if "sglang" in serve_command:
+        return "sglang"
+    if "vllm" in serve_command:
+        return "vllm"
+    return "sp"
+
+
+def record_submission(logs_dir, entry):
+    """Append a submitted launch to the submission ledger"""
+    try:
+        with open(os.path.join(logs_dir, "jobs.jsonl"), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print_warning(f"Warning: Could not record submission: {e}")
+
+
+def read_jsonl(path):
+    """Read a JSON lines file, skipping malformed lines"""
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def timeline_command(argv):
+    """Collect the cold-start timelines of submitted jobs and report per-phase p50/p95"""
+    parser = argparse.ArgumentParser(prog="spin-model timeline", description="Report where replica startup time goes")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    logs_dir = os.path.join(os.environ.get("HOME", "/tmp"), "spinning-logs")
+    store_path = os.path.join(logs_dir, "timeline.jsonl")
+    store = {record["task_id"]: record for record in read_jsonl(store_path)}
+
+    changed = False
+    for entry in read_jsonl(os.path.join(logs_dir, "jobs.jsonl")):
+        for task_id in entry.get("task_ids", []):
+            if "server_ready" in store.get(task_id, {}).get("markers", {}):
+                continue
+            path = os.path.join(logs_dir, f"model-logs-{task_id}.timeline")
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                markers = {"submitted": entry["submitted"], **load_jobctl().parse_timeline(f.read())}
+            store[task_id] = {"task_id": task_id, "model": entry["model"], "engine": entry["engine"],
+                              "cluster": entry["cluster"], "markers": markers}
+            changed = True
+
+    if changed:
+        with open(store_path, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in store.values())
+
+    groups = {}
+    jobctl = load_jobctl()
+    for record in store.values():
+        key = (record["model"], record["engine"], record["cluster"])
+        for phase, duration in jobctl.phase_durations(record["markers"]).items():
+            groups.setdefault(key, {}).setdefault(phase, []).append(duration)
+
+    report = [{"model": model, "engine": engine, "cluster": cluster, "phase": phase,
+               "count": len(values), "p50": jobctl.percentile(values, 50), "p95": jobctl.percentile(values, 95)}
+              for (model, engine, cluster), phases in sorted(groups.items())
+              for phase, values in sorted(phases.items(), key=lambda item: PHASE_ORDER.index(item[0]) if item[0] in PHASE_ORDER else len(PHASE_ORDER))]
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    if not report:
+        print_warning(f"No timelines found yet, they are collected from {logs_dir}")
+        return 0
+    print(f"{'MODEL':40} {'ENGINE':8} {'CLUSTER':9} {'PHASE':30} {'N':>4} {'P50':>9} {'P95':>9}")
+    for row in report:
+        phase = PHASE_LABELS.get(row["phase"], row["phase"])
+        print(f"{row['model'][-40:]:40} {row['engine']:8} {row['cluster']:9} {phase:30} {row['count']:>4} {row['p50']:>8.1f}s {row['p95']:>8.1f}s")
+    return 0
+
+
+# Fleet status: batched squeue/sacct and incremental log parsing
+SPIN_JOB_PREFIXES = ("sp-", "vllm-", "sgl-", "pack-", "sweep-")
+LOG_PATTERNS = {
+    "ready": re.compile(r"\[spin-phase\] server_ready|The server is fired up and ready to roll|Application startup complete"),
+    "load": re.compile(r"Loading weights took ([\d.]+) s|Model loading took .* and ([\d.]+) seconds|Load weight end\..*?elapsed=([\d.]+)"),
+    "throughput": re.compile(r"gen(?:eration)? throughput(?: \(token/s\))?: ([\d.]+)"),
+    "error": re.compile(r"Traceback|\bError\b|\bERROR\b|\w+Error:|CUDA out of memory|srun: error|Killed|FAILED"),
+}
+
+
+def _expand_job_ids(job_id):
+    """Task ids of a squeue/sacct job id, pending array ranges like 123_[1-4%2] are expanded"""
+    match = re.fullmatch(r"(\d+)_\[([\d,\-]+)(?:%\d+)?\]", job_id)
+    if not match:
+        return [job_id]
+    task_ids = []
+    for part in match.group(2).split(","):
+        low, _, high = part.partition("-")
+        task_ids += [f"{match.group(1)}_{index}" for index in range(int(low), int(high or low) + 1)]
+    return task_ids
+
+
+def query_jobs(job_ids):
+    """State of the current user's spin-model jobs from one squeue call, plus one sacct call for the
+    ledger jobs that already left the queue. Returns {task id: {name, state, elapsed, node}}"""
+    jobs = {}
+    try:
+        result = subprocess.run(["squeue", "--me", "-h", "-o", "%i|%j|%T|%M|%N"], capture_output=True, text=True, timeout=30)
+        rows = result.stdout.splitlines() if result.returncode == 0 else []
+    except (OSError, subprocess.TimeoutExpired):
+        rows = []
+    for row in rows:
+        fields = row.split("|")
+        if len(fields) != 5:
+            continue
+        job_id, name, state, elapsed, node = fields
+        for task_id in _expand_job_ids(job_id):
+            if task_id in job_ids or task_id.split("_")[0] in job_ids or name.startswith(SPIN_JOB_PREFIXES):
+                jobs[task_id] = {"name": name, "state": state, "elapsed": elapsed, "node": node}
+
+    finished = sorted({job_id.split("_")[0] for job_id in job_ids if job_id not in jobs})
+    if finished:
+        try:
+            result = subprocess.run(["sacct", "-X", "-n", "-P", "-j", ",".join(finished),
+                                     "--format=JobID,JobName,State,Elapsed,NodeList"], capture_output=True, text=True, timeout=30)
+            rows = result.stdout.splitlines() if result.returncode == 0 else []
+        except (OSError, subprocess.TimeoutExpired):
+            rows = []
+        for row in rows:
+            fields = row.split("|")
+            if len(fields) != 5:
+                continue
+            job_id, name, state, elapsed, node = fields
+            for task_id in _expand_job_ids(job_id):
+                # sacct reports "CANCELLED by <uid>"
+                jobs.setdefault(task_id, {"name": name, "state": state.split()[0], "elapsed": elapsed, "node": node})
+    return jobs
+
+
+def _read_new_lines(path, offset):
+    """Complete lines appended to `path` since `offset`, and the offset to continue from"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return [], offset
+    if size < offset:
+        # the log was truncated or replaced, start over
+        offset = 0
+    if size == offset:
+        return [], offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(size - offset)
+    end = data.rfind(b"\n") + 1
+    return data[:end].decode(errors="replace").splitlines(), offset + end
+
+
+def scan_logs(logs_dir, task_id, facts):
+    """Update the facts of a job from the lines appended to its .out/.err logs since the last scan"""
+    offsets = facts.setdefault("offsets", {})
+    for stream in ("out", "err"):
+        lines, offsets[stream] = _read_new_lines(os.path.join(logs_dir, f"model-logs-{task_id}.{stream}"), offsets.get(stream, 0))
+        for line in lines:
+            if LOG_PATTERNS["ready"].search(line):
+                facts["ready"] = True
+            match = LOG_PATTERNS["load"].search(line)
+            if match:
+                facts["load"] = float(next(group for group in match.groups() if group))
+            match = LOG_PATTERNS["throughput"].search(line)
+            if match:
+                facts["throughput"] = float(match.group(1))
+            elif LOG_PATTERNS["error"].search(line):
+                facts["errors"] = facts.get("errors", 0) + 1
+                facts["last_error"] = line.strip()
+    timeline = os.path.join(logs_dir, f"model-logs-{task_id}.timeline")
+    if "startup" not in facts and os.path.exists(timeline):
+        with open(timeline) as f:
+            markers = load_jobctl().parse_timeline(f.read())
+        if "job_start" in markers and "server_ready" in markers:
+            facts["startup"] = markers["server_ready"] - markers["job_start"]
+            facts["ready"] = True
+    return facts
+
+
+def fleet_status(logs_dir, since):
+    """One row per spin-model job of the ledger submitted within `since` seconds or still queued"""
+    ledger = {}
+    for entry in read_jsonl(os.path.join(logs_dir, "jobs.jsonl")):
+        if entry.get("submitted", 0) >= time.time() - since:
+            for task_id in entry.get("task_ids", []):
+                ledger[str(task_id)] = entry
+    jobs = query_jobs(set(ledger))
+
+    state_path = os.path.join(logs_dir, "status.json")
+    try:
+        with open(state_path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+    rows, facts_by_task = [], {}
+    for task_id in sorted(set(ledger) | set(jobs), key=lambda task_id: [int(part) for part in re.findall(r"\d+", task_id)]):
+        job = jobs[task_id] if task_id in jobs else {"name": ledger[task_id]["name"], "state": "UNKNOWN", "elapsed": "", "node": ""}
+        facts = facts_by_task[task_id] = scan_logs(logs_dir, task_id, saved.get(task_id, {}))
+        rows.append({"task_id": task_id, "model": ledger.get(task_id, {}).get("model", job["name"]), **job,
+                     **{key: value for key, value in facts.items() if key != "offsets"}})
+
+    # only the jobs still listed are kept, their offsets make the next scan incremental
+    tmp_path = f"{state_path}.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(facts_by_task, f)
+    os.replace(tmp_path, state_path)
+    return rows
+
+
+def print_status(rows):
+    print(f"{'JOBID':14} {'MODEL':36} {'STATE':11} {'ELAPSED':>11} {'NODE':12} {'READY':5} {'STARTUP':>8} {'LOAD':>7} {'TOK/S':>8} {'ERR':>4}  LAST ERROR")
+    for row in rows:
+        startup = f"{row['startup']:.0f}s" if "startup" in row else "-"
+        load = f"{row['load']:.0f}s" if "load" in row else "-"
+        throughput = f"{row['throughput']:.1f}" if "throughput" in row else "-"
+        line = (f"{row['task_id']:14} {row['model'][-36:]:36} {row['state'][:11]:11} {row['elapsed']:>11} {row['node'][:12]:12} "
+                f"{'yes' if row.get('ready') else 'no':5} {startup:>8} {load:>7} {throughput:>8} {row.get('errors', 0):>4}  {row.get('last_error', '')[:60]}")
+        print(f"{RED}{line}{RESET}" if row.get("errors") and not row.get("ready") else line)
+
+
+def status_command(argv):
+    """Show the state, readiness, load time, throughput and errors of submitted spin-model jobs"""
+    parser = argparse.ArgumentParser(prog="spin-model status", description="Status of your spin-model jobs")
+    parser.add_argument("--since", default="24h", help="Include ledger jobs submitted within this duration (default: 24h)")
+    parser.add_argument("--watch", type=float, nargs="?", const=10.0, metavar="SECONDS", help="Refresh every SECONDS (default: 10) until interrupted")
+    parser.add_argument("--json", action="store_true", help="Print the rows as JSON")
+    args = parser.parse_args(argv)
+
+    hours, minutes, seconds = (int(part) for part in parse_duration(args.since).split(":"))
+    since = hours * 3600 + minutes * 60 + seconds
+    logs_dir = os.path.join(os.environ.get("HOME", "/tmp"), "spinning-logs")
+    try:
+        while True:
+            rows = fleet_status(logs_dir, since)
+            if args.json:
+                print(json.dumps(rows, indent=2))
+            else:
+                if args.watch:
+                    print("\033[H\033[J", end="")
+                    print(time.strftime("%H:%M:%S"), f"refreshing every {args.watch:g}s, Ctrl-C to stop")
+                if rows:
+                    print_status(rows)
+                else:
+                    print_warning(f"No spin-model jobs found in the queue or in {logs_dir}/jobs.jsonl")
+            if not args.watch:
+                return 0
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        return 0
+
+
+BENCH_WORDS = ("the", "model", "token", "swiss", "alps", "cluster", "node", "serving", "query", "answer",
+               "language", "compute", "memory", "network", "latency", "throughput", "prompt", "reply")
+
+
+def parse_length_dist(spec):
+    """Parse a length distribution: "N" (fixed), "A:B" (uniform) or "exp:MEAN" (exponential)"""
+    try:
+        if spec.startswith("exp:"):
+            mean = float(spec[4:])
+            if mean <= 0:
+                raise ValueError
+            return lambda rng: max(1, int(rng.expovariate(1 / mean)))
+        if ":" in spec:
+            low, high = (int(value) for value in spec.split(":", 1))
+            if not 0 < low <= high:
+                raise ValueError
+            return lambda rng: rng.randint(low, high)
+        length = int(spec)
+        if length <= 0:
+            raise ValueError
+        return lambda rng: length
+    except ValueError:
+        raise ValueError(f"invalid length distribution '{spec}', use N, A:B or exp:MEAN")
+
+
+def bench_prompt(rng, length):
+    """Random prompt of roughly `length` tokens (one word is about one token)"""
+    return " ".join(rng.choice(BENCH_WORDS) for _ in range(length))
+
+
+async def _http_stream(url, body, headers, timeout):
+    """POST `body` as JSON to `url` and yield the response body lines as they arrive.
+    Plain asyncio streams, so the benchmark needs nothing outside the standard library."""
+    import asyncio
+    import ssl
+    import urllib.parse
+
+    parsed = urllib.parse.urlsplit(url)
+    https = parsed.scheme == "https"
+    port = parsed.port or (443 if https else 80)
+    payload = json.dumps(body).encode()
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parsed.hostname, port, ssl=ssl.create_default_context() if https else None), timeout)
+    try:
+        request_headers = {"Host": parsed.netloc, "Content-Type": "application/json", "Accept": "text/event-stream",
+                           "Content-Length": str(len(payload)), "Connection": "close", **headers}
+        head = f"POST {parsed.path or '/'} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in request_headers.items())
+        writer.write(head.encode() + b"\r\n" + payload)
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        status = int(status_line.split()[1]) if len(status_line.split()) > 1 else 0
+        response_headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode().partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}: {(await reader.read(500)).decode(errors='replace')}")
+
+        chunked = response_headers.get("transfer-encoding", "").lower() == "chunked"
+        buffer = b""
+        while True:
+            if chunked:
+                size = int((await asyncio.wait_for(reader.readline(), timeout)).split(b";")[0] or b"0", 16)
+                data = await asyncio.wait_for(reader.readexactly(size + 2), timeout) if size else b""
+                data = data[:-2]
+            else:
+                data = await asyncio.wait_for(reader.read(65536), timeout)
+            if not data:
+                break
+            *lines, buffer = (buffer + data).split(b"\n")
+            for line in lines:
+                yield line.decode().rstrip("\r")
+        if buffer:
+            yield buffer.decode().rstrip("\r")
+    finally:
+        writer.close()
+
+
+async def _bench_request(args, rng, index, scheduled=None):
+    """Send one completion request, returns its timings measured from `scheduled` (default: now)"""
+    prompt_len = args.input_sampler(rng)
+    output_len = args.output_sampler(rng)
+    body = {"model": args.model, "max_tokens": output_len, "stream": not args.no_stream,
+            "ignore_eos": True, "temperature": 0}
+    if args.chat:
+        body["messages"] = [{"role": "user", "content": bench_prompt(rng, prompt_len)}]
+    else:
+        body["prompt"] = bench_prompt(rng, prompt_len)
+    if not args.no_stream:
+        body["stream_options"] = {"include_usage": True}
+    headers = {"Authorization": f"Bearer {args.api_key}"} if args.api_key else {}
+    url = args.url.rstrip("/") + ("/v1/chat/completions" if args.chat else "/v1/completions")
+
+    result = {"index": index, "prompt_tokens": prompt_len, "output_tokens": 0, "ok": False}
+    # open-loop requests count from their scheduled arrival, so time spent waiting on the client is latency too
+    start = time.perf_counter() if scheduled is None else scheduled
+    chunk_times = []
+    usage = None
+    try:
+        lines = []
+        async for line in _http_stream(url, body, headers, args.timeout):
+            if args.no_stream:
+                lines.append(line)
+                continue
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                continue
+            event = json.loads(data)
+            usage = event.get("usage") or usage
+            choices = event.get("choices") or []
+            if choices and (choices[0].get("text") or (choices[0].get("delta") or {}).get("content")):
+                chunk_times.append(time.perf_counter())
+        if args.no_stream:
+            response = json.loads("".join(lines))
+            usage = response.get("usage")
+            chunk_times.append(time.perf_counter())
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["latency"] = time.perf_counter() - start
+        return result
+
+    end = time.perf_counter()
+    result["ok"] = bool(chunk_times)
+    if not chunk_times:
+        result["error"] = "empty response"
+    result["latency"] = end - start
+    if usage:
+        result["prompt_tokens"] = usage.get("prompt_tokens", prompt_len)
+        result["output_tokens"] = usage.get("completion_tokens", len(chunk_times))
+    else:
+        result["output_tokens"] = len(chunk_times)
+    if chunk_times:
+        result["ttft"] = chunk_times[0] - start
+        result["itl"] = [b - a for a, b in zip(chunk_times, chunk_times[1:])]
+    return result
+
+
+async def _bench_run(args):
+    import asyncio
+
+    rng = random.Random(args.seed)
+    arrivals = random.Random(args.seed + 1)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(index):
+        async with semaphore:
+            return await _bench_request(args, rng, index)
+
+    tasks = []
+    start = time.perf_counter()
+    arrival = start
+    for index in range(args.num_requests):
+        if not args.rate:
+            tasks.append(asyncio.create_task(limited(index)))
+            continue
+        # open loop: Poisson arrivals on a fixed schedule, independent of how fast the server answers.
+        # They aren't capped by --concurrency, a slow server shows up as latency instead of a lower rate
+        await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+        tasks.append(asyncio.create_task(_bench_request(args, rng, index, scheduled=arrival)))
+        arrival += arrivals.expovariate(args.rate)
+    results = await asyncio.gather(*tasks)
+    return results, time.perf_counter() - start
+
+
+def _distribution(values):
+    if not values:
+        return None
+    percentile = load_jobctl().percentile
+    return {"mean": sum(values) / len(values), "p50": percentile(values, 50),
+            "p95": percentile(values, 95), "p99": percentile(values, 99)}
+
+
+def bench_summary(results, duration):
+    """Aggregate per-request results into throughput and latency percentiles (seconds)"""
+    done = [result for result in results if result["ok"]]
+    output_tokens = sum(result["output_tokens"] for result in done)
+    prompt_tokens = sum(result["prompt_tokens"] for result in done)
+    return {
+        "requests": len(results),
+        "completed": len(done),
+        "failed": len(results) - len(done),
+        "duration": duration,
+        "request_throughput": len(done) / duration if duration else 0.0,
+        "output_token_throughput": output_tokens / duration if duration else 0.0,
+        "total_token_throughput": (prompt_tokens + output_tokens) / duration if duration else 0.0,
+        "ttft": _distribution([result["ttft"] for result in done if "ttft" in result]),
+        "itl": _distribution([itl for result in done for itl in result.get("itl", [])]),
+        "latency": _distribution([result["latency"] for result in done]),
+        "errors": sorted({result["error"] for result in results if "error" in result})[:10],
+    }
+
+
+BENCH_COMPARE_METRICS = [
+    ("request_throughput", "req/s", 1),
+    ("output_token_throughput", "out tok/s", 1),
+    ("ttft.p50", "TTFT p50 ms", 1000),
+    ("ttft.p99", "TTFT p99 ms", 1000),
+    ("itl.p50", "ITL p50 ms", 1000),
+    ("itl.p99", "ITL p99 ms", 1000),
+    ("latency.p95", "latency p95 s", 1),
+]
+
+
+def _metric(summary, path):
+    value = summary
+    for part in path.split("."):
+        value = (value or {}).get(part)
+    return value
+
+
+def bench_compare(paths):
+    """Print the key metrics of several bench reports side by side, relative to the first one"""
+    reports = []
+    for path in paths:
+        with open(path, 'r') as f:
+            reports.append(json.load(f))
+    print(f"{'METRIC':15}" + "".join(f" {os.path.basename(path)[-22:]:>22}" for path in paths))
+    for key, label, scale in BENCH_COMPARE_METRICS:
+        baseline = _metric(reports[0]["summary"], key)
+        cells = []
+        for report in reports:
+            value = _metric(report["summary"], key)
+            if value is None:
+                cells.append(f"{'-':>22}")
+                continue
+            delta = f" ({(value - baseline) / baseline:+.0%})" if baseline and report is not reports[0] else ""
+            cells.append(f"{f'{value * scale:.1f}{delta}':>22}")
+        print(f"{label:15}" + "".join(f" {cell}" for cell in cells))
+    return 0
+
+
+def bench_command(argv):
+    """Entry point of `spin-model bench`: load-test an OpenAI-compatible endpoint"""
+    parser = argparse.ArgumentParser(prog="spin-model bench", description="Benchmark an OpenAI-compatible endpoint")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="Base URL of the endpoint")
+    parser.add_argument("--model", help="Model name to request (default: first model listed by the endpoint)")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY", ""), help="Bearer token (default: $OPENAI_API_KEY)")
+    parser.add_argument("--chat", action="store_true", help="Use /v1/chat/completions instead of /v1/completions")
+    parser.add_argument("--no-stream", action="store_true", help="Disable streaming (TTFT then equals the latency)")
+    parser.add_argument("-n", "--num-requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="Maximum requests in flight in closed loop, open-loop --rate arrivals are not capped")
+    parser.add_argument("--rate", type=float, default=0, help="Open-loop Poisson arrival rate in requests/s (default: closed loop)")
+    parser.add_argument("--input-len", default="512", help="Prompt length in tokens: N, A:B (uniform) or exp:MEAN")
+    parser.add_argument("--output-len", default="128", help="Output length in tokens: N, A:B (uniform) or exp:MEAN")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-read timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", nargs="+", metavar="REPORT", help="Compare saved JSON reports instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return bench_compare(args.compare)
+    try:
+        args.input_sampler = parse_length_dist(args.input_len)
+        args.output_sampler = parse_length_dist(args.output_len)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not args.model:
+        body = fetch_url(args.url.rstrip("/") + "/v1/models", timeout=10)
+        try:
+            args.model = json.loads(body)["data"][0]["id"]
+        except (TypeError, ValueError, KeyError, IndexError):
+            print_warning(f"Could not list the models of {args.url}, pass --model")
+            return 1
+
+    import asyncio
+    results, duration = asyncio.run(_bench_run(args))
+    report = {
+        "config": {"url": args.url, "model": args.model, "chat": args.chat, "stream": not args.no_stream,
+                   "num_requests": args.num_requests, "concurrency": args.concurrency, "rate": args.rate,
+                   "input_len": args.input_len, "output_len": args.output_len,
+                   "seed": args.seed, "started": time.time() - duration},
+        "summary": bench_summary(results, duration),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    print(text)
+    return 0 if report["summary"]["completed"] else 1
+
+
+async def _stub_handle(reader, writer, tokens_per_second, ttft):
+    import asyncio
+    try:
+        request_line = await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode().partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        body = json.loads(await reader.readexactly(length)) if length else {}
+        path = request_line.split()[1].decode() if len(request_line.split()) > 1 else "/"
+
+        if path.startswith("/v1/models"):
+            payload = json.dumps({"object": "list", "data": [{"id": "stub", "object": "model"}]}).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+            return
+        tokens = int(body.get("max_tokens", 16))
+        prompt = body.get("prompt") or " ".join(message.get("content", "") for message in body.get("messages", []))
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": tokens,
+                 "total_tokens": len(prompt.split()) + tokens}
+        chat = path.startswith("/v1/chat")
+        await asyncio.sleep(ttft)
+        if not body.get("stream"):
+            choice = {"index": 0, "message": {"role": "assistant", "content": "tok " * tokens}} if chat else {"index": 0, "text": "tok " * tokens}
+            await asyncio.sleep(tokens / tokens_per_second)
+            payload = json.dumps({"choices": [choice], "usage": usage}).encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+        async def send(data):
+            event = f"data: {data}\n\n".encode()
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            await writer.drain()
+
+        for i in range(tokens):
+            if i:
+                await asyncio.sleep(1 / tokens_per_second)
+            choice = {"index": 0, "delta": {"content": "tok "}} if chat else {"index": 0, "text": "tok "}
+            await send(json.dumps({"choices": [choice]}))
+        await send(json.dumps({"choices": [], "usage": usage}))
+        await send("[DONE]")
+        writer.write(b"0\r\n\r\n")
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        await writer.drain()
+        writer.close()
+
+
+def bench_stub_command(argv):
+    """Entry point of `spin-model bench-stub`: a fake OpenAI-compatible server to test bench against"""
+    parser = argparse.ArgumentParser(prog="spin-model bench-stub", description="Serve fake completions for spin-model bench")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="Decode speed of every request")
+    parser.add_argument("--ttft", type=float, default=0.05, help="Delay before the first token in seconds")
+    args = parser.parse_args(argv)
+    import asyncio
+
+    async def serve():
+        server = await asyncio.start_server(
+            lambda reader, writer: _stub_handle(reader, writer, args.tokens_per_second, args.ttft), args.host, args.port)
+        print(f"[spin-model] bench stub listening on http://{args.host}:{args.port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# Pre-flight validation: the checks of every launch run concurrently before anything is submitted, so a
+# wrong path or flag fails in seconds instead of after the queue wait. What is parsed from the environment
+# TOMLs and config.json files is kept in the lookup cache per (path, mtime).
+PREFLIGHT_DOCS = {"sp": "sp-docs.txt", "vllm": "vllm-docs.txt"}
+PREFLIGHT_WORKERS = 8
+
+
+def _file_facts(cache, path, parse):
+    """`parse(path)` of a file, reused while its mtime is unchanged. Raises OSError when it's missing"""
+    mtime = os.path.getmtime(path)
+    entry = cache.get(path)
+    if entry and entry["mtime"] == mtime:
+        return entry["facts"]
+    facts = parse(path)
+    cache[path] = {"mtime": mtime, "facts": facts}
+    return facts
+
+
+def _parse_environment(path):
+    """Image and mount sources of an EDF environment TOML, or the reason it can't be parsed"""
+    try:
+        import tomllib
+    except ImportError:
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            environment = tomllib.load(f)
+    except (OSError, ValueError) as e:
+        return {"error": str(e)}
+    image = environment.get("image")
+    return {"image": image if isinstance(image, str) else None,
+            "mounts": [mount.split(":")[0] for mount in environment.get("mounts", []) if isinstance(mount, str)]}
+
+
+def check_environment(cache, environment):
+    """The environment TOML exists and its image and mounts are there, names resolve to ~/.edf/<name>.toml"""
+    path = environment if os.path.isabs(environment) else os.path.expanduser(f"~/.edf/{environment}.toml")
+    try:
+        facts = _file_facts(cache, path, _parse_environment)
+    except OSError:
+        return [("error", f"environment {path} does not exist")]
+    if "error" in facts:
+        return [("error", f"environment {path} can't be parsed: {facts['error']}")]
+    # the image and mounts may appear without the TOML changing, their existence isn't cached
+    findings = []
+    image = facts.get("image") or ""
+    if image.startswith("/") and not os.path.exists(image):
+        findings.append(("error", f"container image {image} of {path} does not exist"))
+    for source in facts.get("mounts", []):
+        if source.startswith("/") and not os.path.exists(source):
+            findings.append(("error", f"mount {source} of {path} does not exist"))
+    return findings
+
+
+def _parse_model_config(path):
+    """Attention heads of a config.json, or the reason it can't be parsed"""
+    try:
+        with open(path, 'r') as f:
+            config = json.load(f)
+        return {"heads": config.get("text_config", config).get("num_attention_heads")}
+    except (OSError, ValueError, AttributeError) as e:
+        return {"error": str(e)}
+
+
+def check_checkpoint(cache, model, tp):
+    """The checkpoint and its config.json exist, and the tp size divides its attention heads"""
+    directory = _local_checkpoint_dir(model)
+    if directory is None and os.path.isabs(model):
+        return [("error", f"checkpoint {model} does not exist")]
+    if directory is None:
+        # a hub model that isn't cached locally, the server downloads it
+        key = f"hf:{model}"
+        if key not in cache:
+            # an error page or a gated repository answers with something else than the JSON config
+            try:
+                config = json.loads(_fetch_hf(model, "config.json", timeout=NETWORK_TIMEOUT) or b"null")
+                heads = config.get("text_config", config).get("num_attention_heads")
+            except (ValueError, AttributeError):
+                return [("warning", f"config.json of {model} could not be fetched or parsed, tp size not checked")]
+            cache[key] = {"mtime": None, "facts": {"heads": heads}}
+        facts = cache[key]["facts"]
+    else:
+        path = os.path.join(directory, "config.json")
+        try:
+            facts = _file_facts(cache, path, _parse_model_config)
+        except OSError:
+            return [("error", f"{path} does not exist")]
+        if "error" in facts:
+            return [("error", f"{path} can't be parsed: {facts['error']}")]
+    heads = facts.get("heads")
+    if heads and heads % tp:
+        return [("error", f"tp size {tp} does not divide the {heads} attention heads of {model}")]
+    return []
+
+
+def serve_tp_size(serve_command):
+    match = re.search(r"--(?:tp-size|tensor-parallel-size)[ =](\d+)", serve_command)
+    return int(match.group(1)) if match else 1
+
+
+def check_flags(cache, serve_command, engine_kind):
+    """Flags of the serve command that the engine doesn't know, against the shipped option docs"""
+    if engine_kind not in PREFLIGHT_DOCS:
+        return []
+    docs = get_help_content(PREFLIGHT_DOCS[engine_kind])
+    if not docs:
+        return [("warning", f"{PREFLIGHT_DOCS[engine_kind]} is not available, {engine_kind} flags not checked")]
+    findings = []
+    for flag, close in load_jobctl().unknown_flags(serve_command, docs, engine_kind):
+        hint = f", did you mean {close}?" if close else ""
+        # the docs cover the engine arguments of vllm, not every option of its API server
+        findings.append(("error" if engine_kind == "sp" else "warning", f"{engine_kind} has no option {flag}{hint}"))
+    return findings
+
+
+def check_cluster(cache, node, cluster, slurm_time, model_names):
+    """The time limit fits the cluster and the models can run on it"""
+    findings = []
+    hours, minutes, seconds = (int(part) for part in slurm_time.split(":"))
+    if hours * 3600 + minutes * 60 + seconds > cluster["max_time"]:
+        findings.append(("error", f"{slurm_time} exceeds the {cluster['max_time'] // 3600}h time limit of {node}"))
+    if node == "clariden" and any("apertus" in name.lower() for name in model_names):
+        findings.append(("error", "Apertus only runs on bristen, not on clariden (--no-preflight submits anyway)"))
+    return findings
+
+
+def preflight(checks):
+    """Run (label, check, *arguments) checks concurrently and print their findings, False on errors.
+    Every check is called with the file result cache first and returns (level, message) findings."""
+    from concurrent.futures import ThreadPoolExecutor
+    cache, _ = cache_load("preflight")
+    cache = cache or {}
+    before = json.dumps(cache, sort_keys=True)
+    with ThreadPoolExecutor(max_workers=PREFLIGHT_WORKERS) as pool:
+        futures = [(label, pool.submit(check, cache, *arguments)) for label, check, *arguments in checks]
+        results = [(label, future.result()) for label, future in futures]
+    if json.dumps(cache, sort_keys=True) != before:
+        cache_store("preflight", cache)
+    errors = 0
+    for label, findings in results:
+        for level, message in findings:
+            if level == "error":
+                errors += 1
+                print_warning(f"Pre-flight: {label}: {message}")
+            elif level == "warning":
+                print(f"Pre-flight: {label}: {message}")
+    if errors:
+        print_warning(f"Error: {errors} pre-flight check(s) failed, nothing was submitted (--no-preflight skips the checks)")
+    return not errors
+
+
+PACK_BASE_PORT = 8080
+# libp2p ports of OCF, every additional server on a node listens on the next ones
+OCF_TCP_PORT = 43905
+OCF_UDP_PORT = 59820
+
+
+def registry_server(model_id, port, overrides=None):
+    """Serve command and tp size of a registry model listening on `port`"""
+    model_config = MODEL_REGISTRY[model_id]
+    model_kwargs = GENERAL_CONFIG | model_config["kwargs"] | (overrides or {}) | {"--port": port}
+    tp_size = int(model_kwargs.get("--tensor-parallel-size", model_kwargs.get("--tp-size", 4)))
+    return registry_command(model_config, model_kwargs), tp_size
+
+
+def registry_plan(model_id, node, gpu_memory=None, plan_context=None):
+    """Memory plan flags of a registry model, empty when the checkpoint can't be planned"""
+    model_config = MODEL_REGISTRY[model_id]
+    engine = {"python3": "sglang", "vllm": "vllm"}.get(model_config["engine"].split()[0], "sp")
+    gpu_memory = gpu_memory or GPU_MEMORY_GB[node]
+    config, weights = read_checkpoint(model_config["path"])
+    plan = plan_memory(config, weights, gpu_memory, plan_context) if config and weights else None
+    if not plan:
+        print_warning(f"Warning: No memory plan for {model_config['path']}, using its registry tp size")
+        return {}
+    print_plan(model_config["path"], plan, gpu_memory)
+    return plan_flags(plan, engine)
+
+
+def launch_pack(args, extra_args):
+    """Pack the registry models of --pack onto as few nodes as their tp sizes allow, one job per node"""
+    unknown = [model_id for model_id in args.pack if model_id not in MODEL_REGISTRY]
+    if unknown:
+        print_warning(f"Error: Model IDs {unknown} not found in registry. Use -l to list available models.")
+        return 1
+    slurm_time = parse_duration(args.time)
+    node, partition, cluster = select_cluster(args, [MODEL_REGISTRY[model_id]["name"] for model_id in args.pack], 1, slurm_time)
+    if node is None:
+        return 1
+    if extra_args:
+        print_warning(f"Warning: Extra server arguments are not supported with --pack, ignoring {' '.join(extra_args)}")
+    if args.prestage:
+        print_warning("Warning: --prestage is not supported with --pack, ignoring it")
+    if args.nodes > 1:
+        print_warning("Warning: --nodes is not supported with --pack, every packed server runs on one node")
+    if args.router:
+        print_warning("Warning: --router is not supported with --pack, ignoring it")
+
+    items = []
+    overrides = {model_id: registry_plan(model_id, node, args.gpu_memory, args.plan_context) if args.auto_plan else {}
+                 for model_id in dict.fromkeys(args.pack)}
+    tp_sizes = {model_id: registry_server(model_id, PACK_BASE_PORT, overrides[model_id])[1] for model_id in overrides}
+    for index, model_id in enumerate(args.pack):
+        model_config = MODEL_REGISTRY[model_id]
+        if args.environment or not cluster["registry_environment"]:
+            environment = args.environment or cluster["environment"]
+        else:
+            environment = model_config.get("environment", cluster["environment"])
+        items.append((environment, (model_id, index), tp_sizes[model_id]))
+    try:
+        placement = load_jobctl().place_items(items, GPUS_PER_NODE)
+    except ValueError as e:
+        print_warning(f"Error: {e}")
+        return 1
+
+    logs_dir = get_logs_dir()
+    print_success(f"Time allocated for model: {slurm_time}")
+    bootstrap_addr = cached("bootstrap")
+    if not bootstrap_addr:
+        print_warning("Failed to fetch or parse bootstrap address. Using fallback.")
+        bootstrap_addr = FALLBACK_BOOTSTRAP_ADDR
+    env_vars = "".join(f"export {env_var}\n" for env_var in args.var if "=" in env_var)
+
+    jobs = []
+    checks = [("cluster", check_cluster, node, cluster, slurm_time, [MODEL_REGISTRY[model_id]["name"] for model_id in args.pack])]
+    checked = set()
+    for pack_index, (environment, packed) in enumerate(placement):
+        names = [MODEL_REGISTRY[model_id]["name"] for _, (model_id, _), _ in packed]
+        # the node index keeps nodes of the same composition apart, --dependency=singleton would serialize them
+        job_name = f"pack-{pack_index}-{'+'.join(names)}"
+        if environment not in checked:
+            checks.append((job_name, check_environment, environment))
+            checked.add(environment)
+        servers = []
+        gpu = 0
+        for position, (_, (model_id, _), gpus) in enumerate(packed):
+            port = PACK_BASE_PORT + position
+            serve_command, tp_size = registry_server(model_id, port, overrides[model_id])
+            if model_id not in checked:
+                engine_kind = {"python3": "sglang", "vllm": "vllm"}.get(MODEL_REGISTRY[model_id]["engine"].split()[0], "sp")
+                checks += [(MODEL_REGISTRY[model_id]["name"], check_checkpoint, MODEL_REGISTRY[model_id]["path"], tp_size),
+                           (MODEL_REGISTRY[model_id]["name"], check_flags, serve_command, engine_kind)]
+                checked.add(model_id)
+            devices = ",".join(str(index) for index in range(gpu, gpu + gpus))
+            gpu += gpus
+            ocf_ports = f" --tcpport {OCF_TCP_PORT + position} --udpport {OCF_UDP_PORT + position}" if position else ""
+            prometheus = f"export PROMETHEUS_MULTIPROC_DIR=/ocfbin/scratch/{position} && mkdir -p $PROMETHEUS_MULTIPROC_DIR\n" \
+                if "sglang" in serve_command else ""
+            print_success(f"GPUs {devices}, port {port}: {MODEL_REGISTRY[model_id]['name']}")
+            print(serve_command)
+            servers.append(f"""(
+export CUDA_VISIBLE_DEVICES={devices}
+{prometheus}exec python3 {job_jobctl(logs_dir)} supervise --url http://127.0.0.1:{port} --timeline "$SPIN_TIMELINE" {supervise_options(args)}\\
+    --serve "{serve_command}" \\
+    --ocf "$OCF_BIN start --bootstrap.addr {bootstrap_addr} --service.name llm --service.port {port}{ocf_ports}"
+) &
+""")
+
+        job_script = f"""#!/bin/bash
+#SBATCH --job-name={job_name}
+#SBATCH --output={logs_dir}/model-logs-%j.out
+#SBATCH --error={logs_dir}/model-logs-%j.err
+#SBATCH --container-writable
+#SBATCH --time={slurm_time}
+#SBATCH --ntasks-per-node=1
+#SBATCH --dependency=singleton
+#SBATCH --account={args.account}
+#SBATCH --environment={environment}
+{drain_signal(args, slurm_time)}
+{partition}
+
+export NCCL_SOCKET_IFNAME=lo
+export GLOO_SOCKET_IFNAME=lo
+export SP_NCCL_SO_PATH={cluster["nccl_so_path"]}
+{env_vars}
+export SPIN_TIMELINE={logs_dir}/model-logs-${{SLURM_JOB_ID}}.timeline
+{TIMELINE_FUNCTION}
+spin_phase job_start
+
+{OCF_CACHE_FUNCTION}
+
+if ! OCF_BIN=$(resolve_ocf {args.ocf_version} {cluster["ocf_arch"]} "{args.ocf_sha256}" {OCF_CACHE_DIR}); then
+    echo "Unable to resolve OCF {args.ocf_version}/{cluster["ocf_arch"]} through the cache, using {cluster["ocf_command"]}" >&2
+    OCF_BIN={cluster["ocf_command"]}
+fi
+spin_phase ocf_ready
+{telemetry_step(args, logs_dir, "${SLURM_JOB_ID}", [PACK_BASE_PORT + position for position in range(len(packed))])}
+# every server drains on its own
+{DRAIN_TRAP}
+{"".join(servers)}{DRAIN_WAIT}
+"""
+        jobs.append((job_name, names, job_script))
+
+    # every job of the pack is checked before the first one is submitted
+    if not args.no_preflight and not preflight(checks):
+        return 1
+    jobids = []
+    submit_time = time.time()
+    for job_name, names, job_script in jobs:
+        jobid = submit_job(job_script, logs_dir)
+        jobids.append(jobid)
+        record_submission(logs_dir, {
+            "job_ids": [jobid] if jobid else [],
+            "task_ids": [jobid] if jobid else [],
+            "name": job_name,
+            "model": "+".join(names),
+            "engine": "pack",
+            "cluster": node,
+            "submitted": submit_time,
+        })
+
+    # jobs placed on another cluster are only visible with its name
+    cluster_flag = f" -M {node}" if node != detect_cluster() else ""
+    print_success(f"""
+{len(args.pack)} servers packed onto {len(placement)} node(s) instead of {len(args.pack)}.
+Your job IDs are: {' '.join(map(str, jobids))}
+
+To follow the packed models:
+  spin-model status --watch
+
+To cancel the packed models, run:
+  scancel{cluster_flag} {' '.join(map(str, jobids))}
+
+To view logs for these jobs:
+  cat {logs_dir}/model-logs-<jobid>.out  # For stdout
+  cat {logs_dir}/model-logs-<jobid>.err  # For stderr
+
+Chat with model when it's ready: https://serving.swissai.cscs.ch/
+""")
+    return 0
+
+
+# Parameter sweeps: every variant is a job without OCF that serves the model, benchmarks it and exits
+SWEEP_LEVELS = "1,4,16,64"
+SWEEP_ACTIVE_STATES = ("PENDING", "CONFIGURING", "RUNNING", "COMPLETING", "REQUEUED", "RESIZING", "SUSPENDED")
+
+
+def _grid_value(value):
+    """Grid value as the registry would write it: numbers as numbers, true/false as a flag switch"""
+    if value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_grid(specs):
+    """[(flag, [values])] of --grid FLAG=V1,V2 specs, "true"/"false" switch a bare flag on and off"""
+    grid = []
+    for spec in specs:
+        flag, sep, values = spec.partition("=")
+        if not sep or not flag.strip("-") or not values:
+            raise ValueError(f"invalid grid axis {spec!r}, expected flag=value1,value2")
+        flag = "--" + flag.lstrip("-")
+        grid.append((flag, [_grid_value(value) for value in values.split(",")]))
+    return grid
+
+
+def expand_grid(grid):
+    """Every combination of the grid axes as {flag: value}"""
+    import itertools
+    return [dict(zip([flag for flag, _ in grid], values)) for values in itertools.product(*[values for _, values in grid])]
+
+
+def variant_label(flags):
+    return " ".join(f"{flag.lstrip('-')}={'on' if value is True else 'off' if value is False else value}"
+                    for flag, value in flags.items())
+
+
+def sweep_serve_command(model_id, serve, flags):
+    """Serve command of a variant: the registry command of `model_id` with the flags overridden, or `serve` with them appended"""
+    if serve:
+        return f"{serve} {serve_args(flags)}".strip()
+    model_config = MODEL_REGISTRY[model_id]
+    return registry_command(model_config, GENERAL_CONFIG | model_config["kwargs"] | flags)
+
+
+def sweep_score(reports, slo_ttft, slo_itl):
+    """Best output throughput over the load levels whose p99 TTFT and ITL meet the SLO, and that level's report.
+    Returns (None, None) when no level met it."""
+    best = (None, None)
+    for report in reports:
+        summary = report["summary"]
+        ttft, itl = _metric(summary, "ttft.p99"), _metric(summary, "itl.p99")
+        if not summary["completed"] or summary["failed"] or ttft is None or ttft > slo_ttft or (itl or 0) > slo_itl:
+            continue
+        if best[0] is None or summary["output_token_throughput"] > best[0]:
+            best = (summary["output_token_throughput"], report)
+    return best
+
+
+def collect_sweep(sweep_dir):
+    """Manifest of a sweep with the score of every variant, ranked by throughput at the SLO"""
+    with open(os.path.join(sweep_dir, "sweep.json"), 'r') as f:
+        manifest = json.load(f)
+    for variant in manifest["variants"]:
+        reports = []
+        for level in manifest["levels"]:
+            try:
+                with open(os.path.join(sweep_dir, f"{variant['id']}-c{level}.json"), 'r') as f:
+                    reports.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        score, report = sweep_score(reports, manifest["slo_ttft"], manifest["slo_itl"])
+        variant["measured_levels"] = len(reports)
+        variant["score"] = score
+        variant["best"] = None if report is None else {
+            "concurrency": report["config"]["concurrency"],
+            "request_throughput": report["summary"]["request_throughput"],
+            "ttft_p99": _metric(report["summary"], "ttft.p99"),
+            "itl_p99": _metric(report["summary"], "itl.p99"),
+        }
+    manifest["variants"].sort(key=lambda variant: (variant["score"] is None, -(variant["score"] or 0)))
+    return manifest
+
+
+def print_sweep(manifest):
+    print(f"Sweep of {manifest['model']}: output tokens/s at p99 TTFT <= {manifest['slo_ttft']}s and p99 ITL <= {manifest['slo_itl'] * 1000:.0f}ms")
+    print(f"{'RANK':4} {'ID':4} {'OUT TOK/S':>10} {'AT C':>5} {'REQ/S':>7} {'TTFT P99':>9} {'ITL P99':>8}  VARIANT")
+    for rank, variant in enumerate(manifest["variants"], 1):
+        best = variant["best"]
+        if best is None:
+            status = "no results" if not variant["measured_levels"] else "misses the SLO"
+            print(f"{'-':4} {variant['id']:4} {status:>44}  {variant['label']}")
+            continue
+        print(f"{rank:<4} {variant['id']:4} {variant['score']:>10.1f} {best['concurrency']:>5} {best['request_throughput']:>7.2f} "
+              f"{best['ttft_p99'] * 1000:>7.0f}ms {(best['itl_p99'] or 0) * 1000:>6.0f}ms  {variant['label']}")
+
+    winner = manifest["variants"][0] if manifest["variants"] and manifest["variants"][0]["score"] is not None else None
+    if winner is None:
+        print_warning("No variant met the SLO, relax --slo-ttft/--slo-itl or lower the load levels")
+        return
+    model_config = MODEL_REGISTRY.get(manifest.get("model_id"))
+    if model_config is None:
+        print_success(f"\nFlags of the best variant ({winner['id']}):")
+        print(serve_args(winner["flags"]))
+        return
+    print_success(f"\nRegistry snippet for the best variant ({winner['id']}):")
+    print('        "kwargs": {')
+    for flag, value in (model_config["kwargs"] | winner["flags"]).items():
+        # the registry is Python, bare flags are True there
+        if value is not False:
+            print(f'            "{flag}": {"True" if value is True else json.dumps(value)},')
+    print('        },')
+
+
+def sweep_job_script(args, manifest, variant, serve_command, partition, cluster, environment, logs_dir):
+    """Job script of one variant: serve, wait until ready, run the workload at every load level and exit"""
+    sweep_dir = manifest["dir"]
+    prefix = f"{sweep_dir}/{variant['id']}"
+    bench_steps = "".join(
+        f"python3 {SPIN_MODEL_PATH} bench --url http://127.0.0.1:8080 -c {level} -n {args.num_requests} "
+        f"--input-len {args.input_len} --output-len {args.output_len} -o {prefix}-c{level}.json > /dev/null\n"
+        for level in manifest["levels"])
+    env_vars = "".join(f"export {env_var}\n" for env_var in args.var if "=" in env_var)
+    return f"""#!/bin/bash
+#SBATCH --job-name={variant['job_name']}
+#SBATCH --output={prefix}.out
+#SBATCH --error={prefix}.err
+#SBATCH --container-writable
+#SBATCH --time={manifest['time']}
+#SBATCH --nodes=1
+#SBATCH --ntasks-per-node=1
+#SBATCH --account={args.account}
+#SBATCH --environment={environment}
+{partition}
+
+export NCCL_SOCKET_IFNAME=lo
+export GLOO_SOCKET_IFNAME=lo
+export SP_NCCL_SO_PATH={cluster["nccl_so_path"]}
+export PROMETHEUS_MULTIPROC_DIR=/ocfbin/scratch
+{env_vars}
+# {variant['label']}
+setsid {serve_command} &
+SERVER_PID=$!
+trap 'kill -TERM -- -$SERVER_PID 2>/dev/null; touch {prefix}.done' EXIT
+if ! python3 {job_jobctl(logs_dir)} wait-ready --url http://127.0.0.1:8080/v1/models --timeout {args.ready_timeout}; then
+    exit 1
+fi
+{bench_steps}"""
+
+
+def wait_sweep(manifest, poll):
+    """Block until every variant job has written its done marker or left the queue"""
+    pending = {variant["job_id"]: variant for variant in manifest["variants"] if variant.get("job_id")}
+    while pending:
+        jobs = query_jobs(set(pending))
+        for job_id, variant in list(pending.items()):
+            state = jobs.get(job_id, {}).get("state")
+            if os.path.exists(os.path.join(manifest["dir"], f"{variant['id']}.done")) or \
+                    (state is not None and state not in SWEEP_ACTIVE_STATES):
+                print(f"Sweep: {variant['id']} finished{f' ({state})' if state else ''}")
+                del pending[job_id]
+        if pending:
+            print(f"Sweep: waiting for {len(pending)} variant(s)...", flush=True)
+            time.sleep(poll)
+
+
+def launch_sweep(args, variants, levels):
+    """Submit one job per variant and write the sweep manifest, None when no cluster takes the jobs"""
+    model = MODEL_REGISTRY[args.model_id]["name"] if args.model_id else args.name
+    slurm_time = parse_duration(args.time)
+    node, partition, cluster = select_cluster(args, [model], 1, slurm_time)
+    if node is None:
+        return None
+    if args.model_id and cluster["registry_environment"] and not args.environment:
+        environment = MODEL_REGISTRY[args.model_id].get("environment", cluster["environment"])
+    else:
+        environment = args.environment or cluster["environment"]
+
+    logs_dir = get_logs_dir()
+    sweep_dir = os.path.abspath(args.dir or os.path.join(logs_dir, "sweeps", time.strftime("%Y%m%d-%H%M%S")))
+    os.makedirs(sweep_dir, exist_ok=True)
+    manifest = {"model": model, "model_id": args.model_id, "dir": sweep_dir, "time": slurm_time, "levels": levels,
+                "slo_ttft": args.slo_ttft, "slo_itl": args.slo_itl, "workload": {
+                    "num_requests": args.num_requests, "input_len": args.input_len, "output_len": args.output_len},
+                "variants": []}
+
+    print_success(f"Sweeping {len(variants)} variant(s) of {model} at concurrency {args.levels}, results in {sweep_dir}")
+    submit_time = time.time()
+    for index, flags in enumerate(variants, 1):
+        variant = {"id": f"v{index:02d}", "flags": flags, "label": variant_label(flags) or "baseline"}
+        variant["job_name"] = f"sweep-{model.replace('/', '-')}-{variant['id']}"
+        serve_command = sweep_serve_command(args.model_id, args.serve, flags)
+        print(f"{variant['id']}: {serve_command}")
+        variant["job_id"] = submit_job(sweep_job_script(args, manifest, variant, serve_command, partition, cluster, environment, logs_dir), logs_dir)
+        manifest["variants"].append(variant)
+        if variant["job_id"]:
+            record_submission(logs_dir, {
+                "job_ids": [variant["job_id"]],
+                "task_ids": [variant["job_id"]],
+                "name": variant["job_name"],
+                "model": model,
+                "engine": engine_label(serve_command),
+                "cluster": node,
+                "submitted": submit_time,
+            })
+    with open(os.path.join(sweep_dir, "sweep.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def sweep_command(argv):
+    """Entry point of `spin-model sweep`: launch a grid of serving configurations and rank them by throughput at a latency SLO"""
+    parser = argparse.ArgumentParser(prog="spin-model sweep", description="Benchmark a grid of serving flags for one model")
+    parser.add_argument("-m", "--model-id", type=int, help="Registry model to sweep, the grid overrides its kwargs")
+    parser.add_argument("--serve", help="Serve command listening on port 8080 to sweep instead of a registry model, the variant flags are appended")
+    parser.add_argument("--name", default="custom", help="Name of the --serve model in job names and reports")
+    parser.add_argument("--grid", action="append", default=[], metavar="FLAG=V1,V2", help="Server flag (without the leading dashes) and values to sweep, e.g. max-prefill-tokens=8192,32768, repeat for more axes (true/false switch a bare flag)")
+    parser.add_argument("-a", "--account", help="Slurm account to use for job submission")
+    parser.add_argument("-t", "--time", default="1h", help="Time limit of every variant job")
+    parser.add_argument("--placement", action="store_true", help="Submit to the cluster and partition with the earliest estimated start")
+    parser.add_argument("-e", "--environment", help="Specify a custom environment file path")
+    parser.add_argument("-v", "--var", action="append", help="Specify environment variables in format KEY=VALUE", default=[])
+    parser.add_argument("--levels", default=SWEEP_LEVELS, help="Concurrency levels of the workload, one bench run each")
+    parser.add_argument("-n", "--num-requests", type=int, default=200, help="Requests per load level")
+    parser.add_argument("--input-len", default="512", help="Prompt length in tokens: N, A:B (uniform) or exp:MEAN")
+    parser.add_argument("--output-len", default="128", help="Output length in tokens: N, A:B (uniform) or exp:MEAN")
+    parser.add_argument("--slo-ttft", type=float, default=2.0, help="p99 time to first token in seconds a load level must meet")
+    parser.add_argument("--slo-itl", type=float, default=0.1, help="p99 inter-token latency in seconds a load level must meet")
+    parser.add_argument("--ready-timeout", type=float, default=3600, help="Seconds a variant may take to answer before it is given up")
+    parser.add_argument("--dir", help="Directory of the job scripts' results (default: ~/spinning-logs/sweeps/<timestamp>)")
+    parser.add_argument("--poll", type=float, default=30, help="Seconds between job state polls while waiting")
+    parser.add_argument("--no-wait", action="store_true", help="Submit the variants and exit, collect later with --collect")
+    parser.add_argument("--collect", metavar="DIR", help="Rank the results of an earlier sweep instead of launching one")
+    parser.add_argument("--json", action="store_true", help="Print the ranked results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.collect:
+        sweep_dir = args.collect
+    else:
+        if bool(args.model_id) == bool(args.serve):
+            parser.error("exactly one of -m/--model-id and --serve is required")
+        if args.model_id and args.model_id not in MODEL_REGISTRY:
+            parser.error(f"model ID {args.model_id} not found in registry, use spin-model -l to list available models")
+        try:
+            variants = expand_grid(parse_grid(args.grid))
+            levels = [int(level) for level in args.levels.split(",")]
+            parse_length_dist(args.input_len), parse_length_dist(args.output_len)
+        except ValueError as e:
+            parser.error(str(e))
+        args.account = args.account or get_saved_account()
+        if not args.account:
+            parser.error("no account, pass -a/--account or use spin-model --login")
+
+        manifest = launch_sweep(args, variants, levels)
+        if manifest is None:
+            return 1
+        sweep_dir = manifest["dir"]
+        if args.no_wait:
+            print_success(f"\nSubmitted {len(variants)} variant(s), rank them once they finished with:\n  spin-model sweep --collect {sweep_dir}")
+            return 0
+        try:
+            wait_sweep(manifest, args.poll)
+        except KeyboardInterrupt:
+            print(f"\nStopped waiting, the jobs keep running. Rank them later with:\n  spin-model sweep --collect {sweep_dir}")
+            return 130
+
+    manifest = collect_sweep(sweep_dir)
+    if args.json:
+        print(json.dumps(manifest, indent=2))
+    else:
+        print_sweep(manifest)
+    return 0
+
+
+# Prefix-affinity router: requests sharing a prompt prefix go to the same replica while it isn't overloaded
+ROUTER_PORT = 8000
+ROUTER_HOP_HEADERS = ("connection", "keep-alive", "proxy-connection", "proxy-authorization", "te", "upgrade", "host")
+
+
+def _ring_hash(text):
+    import hashlib
+    return int.from_bytes(hashlib.md5(text.encode()).digest()[:8], "big")
+
+
+def build_ring(urls, vnodes):
+    """Consistent hash ring of the backends, `vnodes` points per backend"""
+    return sorted((_ring_hash(f"{url}#{index}"), url) for url in urls for index in range(vnodes))
+
+
+def affinity_key(body, prefix_chars):
+    """Model and the first `prefix_chars` characters of the prompt (system prompt first for chat), None without a prompt"""
+    if not isinstance(body, dict):
+        return None
+    if "messages" in body:
+        parts = []
+        for message in body.get("messages") or []:
+            content = message.get("content") if isinstance(message, dict) else None
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+            parts.append(f"{message.get('role', '')}:{content or ''}\n" if isinstance(message, dict) else "")
+        prompt = "".join(parts)
+    else:
+        prompt = body.get("prompt")
+        if isinstance(prompt, list):
+            prompt = prompt[0] if prompt else ""
+        if not isinstance(prompt, str):
+            return None
+    if not prompt:
+        return None
+    return f"{body.get('model', '')}\0{prompt[:prefix_chars]}"
+
+
+def pick_backend(ring, backends, key, load_factor, exclude=(), now=None):
+    """(backend url, affinity hit) for a request: the first replica at or after the key on the ring whose
+    outstanding requests stay under `load_factor` times the average, the least loaded one without a key.
+    Ejected replicas are skipped unless no other one is left. (None, False) without candidates."""
+    now = time.monotonic() if now is None else now
+    candidates = [url for url in backends if url not in exclude]
+    healthy = [url for url in candidates if backends[url]["ejected_until"] <= now] or candidates
+    if not healthy:
+        return None, False
+    least_loaded = min(healthy, key=lambda url: backends[url]["outstanding"])
+    if key is None or not ring:
+        return least_loaded, False
+    import bisect
+    start = bisect.bisect(ring, (_ring_hash(key), ""))
+    order = list(dict.fromkeys(url for _, url in ring[start:] + ring[:start] if url in healthy))
+    total = sum(backends[url]["outstanding"] for url in healthy)
+    # bounded loads: a replica takes its share of the requests in flight times the load factor, at least one
+    cap = max(1, -(-load_factor * (total + 1) // len(healthy)))
+    for rank, url in enumerate(order):
+        if backends[url]["outstanding"] < cap:
+            return url, rank == 0
+    return least_loaded, False
+
+
+def _new_backend():
+    import collections
+    return {"requests": 0, "affinity_hits": 0, "spills": 0, "failures": 0, "ejections": 0, "outstanding": 0,
+            "consecutive_failures": 0, "ejected_until": 0.0,
+            "ttfb": collections.deque(maxlen=1000), "latency": collections.deque(maxlen=1000)}
+
+
+def router_stats(router):
+    """Per-replica counters and latency percentiles (seconds) of the router"""
+    now = time.monotonic()
+    backends = {}
+    for url, backend in router["backends"].items():
+        backends[url] = {name: backend[name] for name in ("requests", "affinity_hits", "spills", "failures",
+                                                          "ejections", "outstanding")}
+        backends[url]["hit_rate"] = backend["affinity_hits"] / backend["requests"] if backend["requests"] else None
+        backends[url]["ejected"] = backend["ejected_until"] > now
+        backends[url]["ttfb"] = _distribution(list(backend["ttfb"]))
+        backends[url]["latency"] = _distribution(list(backend["latency"]))
+    return {"requests": router["requests"], "unroutable": router["unroutable"], "backends": backends}
+
+
+def _router_log(msg):
+    print(f"[spin-model router] {msg}", file=sys.stderr, flush=True)
+
+
+def set_backends(router, urls):
+    """Replace the backend set, keeping the counters of the replicas that stay"""
+    urls = list(dict.fromkeys(url.rstrip("/") for url in urls if url.strip()))
+    if set(urls) == set(router["backends"]):
+        return
+    for url in urls:
+        if url not in router["backends"]:
+            _router_log(f"backend {url} added")
+    for url in router["backends"]:
+        if url not in urls:
+            _router_log(f"backend {url} removed")
+    router["backends"] = {url: router["backends"].get(url) or _new_backend() for url in urls}
+    router["ring"] = build_ring(urls, router["vnodes"])
+
+
+def _record_failure(router, url, error):
+    backend = router["backends"].get(url)
+    if backend is None:
+        return
+    backend["failures"] += 1
+    backend["consecutive_failures"] += 1
+    if backend["consecutive_failures"] >= router["eject_after"]:
+        backend["ejected_until"] = time.monotonic() + router["eject_seconds"]
+        backend["ejections"] += 1
+        backend["consecutive_failures"] = 0
+        _router_log(f"backend {url} ejected for {router['eject_seconds']:.0f}s: {error}")
+
+
+async def _read_http_head(reader, timeout):
+    """First line and the headers (name, value) of an HTTP message"""
+    import asyncio
+    first = await asyncio.wait_for(reader.readline(), timeout)
+    headers = []
+    while True:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers.append((name.strip(), value.strip()))
+    return first.decode("latin-1").strip(), headers
+
+
+def _respond(writer, status, payload, content_type="application/json"):
+    reason = {200: "OK", 404: "Not Found", 411: "Length Required", 502: "Bad Gateway", 503: "Service Unavailable"}[status]
+    writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + payload)
+
+
+async def _forward(router, url, method, path, headers, body, client_writer):
+    """Send the request to one backend and stream its response back without buffering, False when the
+    stream broke off. Raises before anything was written to the client when the backend can't be used."""
+    import asyncio
+    import urllib.parse
+
+    parsed = urllib.parse.urlsplit(url)
+    backend = router["backends"][url]
+    started = time.monotonic()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(parsed.hostname, parsed.port or 80),
+                                            router["connect_timeout"])
+    try:
+        request_headers = [(name, value) for name, value in headers if name.lower() not in ROUTER_HOP_HEADERS]
+        request_headers += [("Host", parsed.netloc), ("Connection", "close")]
+        writer.write(f"{method} {path} HTTP/1.1\r\n".encode()
+                     + "".join(f"{name}: {value}\r\n" for name, value in request_headers).encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+        status_line, response_headers = await _read_http_head(reader, router["timeout"])
+        status = int(status_line.split()[1]) if len(status_line.split()) > 1 else 0
+        if status == 0 or status in (502, 503, 504):
+            raise ConnectionError(f"HTTP {status or 'without status'}")
+        backend["ttfb"].append(time.monotonic() - started)
+
+        head = [(name, value) for name, value in response_headers if name.lower() not in ("connection", "keep-alive")]
+        client_writer.write(f"{status_line}\r\n".encode("latin-1")
+                            + "".join(f"{name}: {value}\r\n" for name, value in head + [("Connection", "close")]).encode("latin-1")
+                            + b"\r\n")
+        # the backend closes the connection at the end of the response, chunked bodies pass through as they are
+        try:
+            while True:
+                data = await asyncio.wait_for(reader.read(65536), router["timeout"])
+                if not data:
+                    break
+                client_writer.write(data)
+                await client_writer.drain()
+        except (OSError, asyncio.TimeoutError) as e:
+            # the client already got part of the response, it can't go to another replica anymore
+            _record_failure(router, url, f"response interrupted: {type(e).__name__}: {e}")
+            return False
+        backend["latency"].append(time.monotonic() - started)
+        return True
+    finally:
+        writer.close()
+
+
+async def _route(router, reader, writer):
+    import asyncio
+    try:
+        request_line, headers = await _read_http_head(reader, router["timeout"])
+        parts = request_line.split()
+        if len(parts) < 2:
+            return
+        method, path = parts[0], parts[1]
+        header_map = {name.lower(): value for name, value in headers}
+        if "chunked" in header_map.get("transfer-encoding", "").lower():
+            _respond(writer, 411, b'{"error": "chunked request bodies are not supported"}')
+            return
+        length = int(header_map.get("content-length") or 0)
+        body = await asyncio.wait_for(reader.readexactly(length), router["timeout"]) if length else b""
+
+        if path.startswith("/router/stats"):
+            _respond(writer, 200, json.dumps(router_stats(router), indent=2).encode())
+            return
+
+        router["requests"] += 1
+        key = None
+        if method == "POST" and body:
+            try:
+                key = affinity_key(json.loads(body), router["prefix_chars"])
+            except ValueError:
+                pass
+        tried = []
+        for _ in range(router["retries"] + 1):
+            url, hit = pick_backend(router["ring"], router["backends"], key, router["load_factor"], exclude=tried)
+            if url is None:
+                break
+            backend = router["backends"][url]
+            backend["requests"] += 1
+            if key is not None:
+                backend["affinity_hits" if hit else "spills"] += 1
+            backend["outstanding"] += 1
+            try:
+                if await _forward(router, url, method, path, headers, body, writer):
+                    # a success readmits an ejected replica whose ejection ran out
+                    backend["consecutive_failures"] = 0
+                    backend["ejected_until"] = 0.0
+                return
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                _record_failure(router, url, f"{type(e).__name__}: {e}")
+                tried.append(url)
+            finally:
+                backend["outstanding"] -= 1
+        router["unroutable"] += 1
+        _respond(writer, 503 if not router["backends"] else 502, b'{"error": "no backend could serve the request"}')
+    except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+
+async def _watch_backends(router, path, ttl, interval=5.0):
+    """Reload the backends file every `interval`, replicas add their URL once they are ready and renew its
+    heartbeat while they serve, a URL whose heartbeat is older than `ttl` seconds is dropped"""
+    import asyncio
+    while True:
+        try:
+            with open(path, 'r') as f:
+                set_backends(router, router["static"] + load_jobctl().live_backends(f.read(), ttl))
+        except OSError:
+            pass
+        await asyncio.sleep(interval)
+
+
+def router_command(argv):
+    """Entry point of `spin-model router`: prefix-affinity router in front of OpenAI-compatible replicas"""
+    parser = argparse.ArgumentParser(prog="spin-model router", description="Route requests sharing a prompt prefix to the same replica")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=ROUTER_PORT)
+    parser.add_argument("--backend", action="append", default=[], metavar="URL", help="Replica base URL, repeat for more")
+    parser.add_argument("--backends-file", help="File of replica URLs, one per line, reloaded every few seconds")
+    parser.add_argument("--backend-ttl", type=float, default=load_jobctl().BACKEND_TTL, help="Seconds after the last heartbeat of a --backends-file replica before it is dropped")
+    parser.add_argument("--prefix-chars", type=int, default=2048, help="Characters of the prompt hashed to pick a replica")
+    parser.add_argument("--load-factor", type=float, default=1.25, help="Outstanding requests a replica may take relative to the average before its prefixes spill over")
+    parser.add_argument("--vnodes", type=int, default=64, help="Points per replica on the hash ring")
+    parser.add_argument("--eject-after", type=int, default=3, help="Consecutive failures after which a replica is ejected")
+    parser.add_argument("--eject-seconds", type=float, default=30.0, help="Seconds an ejected replica gets no traffic")
+    parser.add_argument("--retries", type=int, default=2, help="Other replicas tried when one fails before answering")
+    parser.add_argument("--connect-timeout", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds without data from a replica before the request fails")
+    args = parser.parse_args(argv)
+    if not args.backend and not args.backends_file:
+        parser.error("pass --backend or --backends-file")
+    import asyncio
+
+    router = {"backends": {}, "ring": [], "static": args.backend, "requests": 0, "unroutable": 0,
+              "vnodes": args.vnodes, "prefix_chars": args.prefix_chars, "load_factor": args.load_factor,
+              "eject_after": args.eject_after, "eject_seconds": args.eject_seconds, "retries": args.retries,
+              "connect_timeout": args.connect_timeout, "timeout": args.timeout}
+    set_backends(router, args.backend)
+
+    async def serve():
+        server = await asyncio.start_server(lambda reader, writer: _route(router, reader, writer), args.host, args.port)
+        _router_log(f"listening on http://{args.host}:{args.port}, stats on /router/stats")
+        watcher = asyncio.ensure_future(_watch_backends(router, args.backends_file, args.backend_ttl)) if args.backends_file else None
+        async with server:
+            try:
+                await server.serve_forever()
+            finally:
+                if watcher:
+                    watcher.cancel()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+# Resource telemetry: a sidecar (jobctl telemetry) samples the GPUs, host memory and engine gauges of a job
+# into model-logs-<jobid>.telemetry, `spin-model telemetry --summarize` flags over-provisioned models
+def print_telemetry(rows):
+    """Table of summarized telemetry, one row per job"""
+    print(f"{'JOB':14} {'MODEL':32} {'GPUS':>4} {'HOURS':>6} {'UTIL':>5} {'P95':>5} {'MEM PEAK':>12} {'KV PEAK':>7} {'RSS':>7}  FLAGS")
+    for row in rows:
+        summary = row["summary"]
+        kv = f"{summary['kv_peak']:.0%}" if summary["kv_peak"] is not None else "-"
+        memory = f"{summary['mem_peak'] / 1024:.0f}/{summary['mem_total'] / 1024:.0f}G"
+        print(f"{row['job']:14} {row['model'][-32:]:32} {summary['gpus']:>4} {summary['duration'] / 3600:>6.1f} "
+              f"{summary['util_mean']:>4.0f}% {summary['util_p95']:>4.0f}% {memory:>12} {kv:>7} {summary['rss_peak'] / 1024:>6.1f}G  "
+              f"{'; '.join(summary['flags']) or 'ok'}")
+
+
+def telemetry_step(args, logs_dir, job_id, ports):
+    """Job script line starting the telemetry sidecar in the background, empty without --telemetry"""
+    if not args.telemetry:
+        return ""
+    urls = "".join(f" --url http://127.0.0.1:{port}" for port in ports)
+    # disowned so that the `wait` for the servers doesn't wait for the sidecar as well
+    return f"""python3 {job_jobctl(logs_dir)} telemetry --out {logs_dir}/model-logs-{job_id}.telemetry --interval {args.telemetry:g}{urls} & disown
+"""
+
+
+def telemetry_command(argv):
+    """Entry point of `spin-model telemetry`: sample a job's resource usage, or summarize the collected samples"""
+    parser = argparse.ArgumentParser(prog="spin-model telemetry", description="Sample GPU, memory and engine usage of a job, or summarize it for right-sizing")
+    parser.add_argument("--out", help="JSON lines file the samples are appended to")
+    parser.add_argument("--interval", type=float, default=15.0, help="Seconds between samples")
+    parser.add_argument("--url", action="append", default=[], help="Base URL of a server whose /metrics are sampled, repeat for more")
+    parser.add_argument("--gpu-source", default=load_jobctl().GPU_QUERY, help="Command printing index,utilization,memory.used,memory.total csv lines")
+    parser.add_argument("--samples", type=int, default=0, help="Stop after this many samples (default: until killed)")
+    parser.add_argument("--summarize", nargs="*", metavar="FILE", help="Summarize telemetry files (default: the jobs of the ledger)")
+    parser.add_argument("--since", default="168h", help="With --summarize, include ledger jobs submitted within this duration (default: 168h)")
+    parser.add_argument("--json", action="store_true", help="Print the summaries as JSON")
+    args = parser.parse_args(argv)
+
+    if args.summarize is None:
+        if not args.out:
+            parser.error("pass --out to sample or --summarize to report")
+        return load_jobctl().cmd_telemetry(args)
+
+    logs_dir = os.path.join(os.environ.get("HOME", "/tmp"), "spinning-logs")
+    if args.summarize:
+        sources = [(os.path.basename(path).removeprefix("model-logs-").removesuffix(".telemetry"), "", path) for path in args.summarize]
+    else:
+        hours, minutes, seconds = (int(part) for part in parse_duration(args.since).split(":"))
+        since = time.time() - (hours * 3600 + minutes * 60 + seconds)
+        sources = [(task_id, entry["model"], os.path.join(logs_dir, f"model-logs-{task_id}.telemetry"))
+                   for entry in read_jsonl(os.path.join(logs_dir, "jobs.jsonl")) if entry.get("submitted", 0) >= since
+                   for task_id in entry.get("task_ids", [])]
+    rows = []
+    for job, model, path in sources:
+        summary = load_jobctl().summarize_telemetry(read_jsonl(path))
+        if summary:
+            rows.append({"job": job, "model": model, "summary": summary})
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    elif rows:
+        print_telemetry(rows)
+    else:
+        print_warning(f"No telemetry found, launch with --telemetry to sample jobs into {logs_dir}")
+    return 0
+
+
+def _jobctl_command(name):
+    """Subcommand running the in-job helper `name` of jobctl"""
+    return lambda argv: load_jobctl().main([name, *argv])
+
+
+# Subcommands dispatched before the launch arguments are parsed
+SUBCOMMANDS = {
+    "prestage": _jobctl_command("prestage"),
+    "wait-ready": _jobctl_command("wait-ready"),
+    "warmup": _jobctl_command("warmup"),
+    "supervise": _jobctl_command("supervise"),
+    "timeline": timeline_command,
+    "cache-refresh": cache_refresh_command,
+    "bench": bench_command,
+    "bench-stub": bench_stub_command,
+    "plan": plan_command,
+    "status": status_command,
+    "sweep": sweep_command,
+    "router": router_command,
+    "telemetry": telemetry_command,
+}
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        sys.exit(SUBCOMMANDS[sys.argv[1]](sys.argv[2:]))
+
+    # Parse arguments
+    parser = argparse.ArgumentParser(description="Launch a model on SLURM")
+    parser.add_argument("--model", help="Name of the model to launch (deprecated, use -m)")
+    parser.add_argument("-m", "--model-id", type=int, help="Model ID from registry (use -l to list available models)")
+    parser.add_argument("-l", "--list", action="store_true", help="List available models in registry")
+    parser.add_argument("--login", action="store_true", help="Interactive account selection and save for future use")
+    parser.add_argument("-t", "--time", default="1h", help="Time duration for the job. Examples: 2h, 1h30m, 90m, 1:30:00")
+    parser.add_argument("-n", "--num-instances", type=int, default=1, help="Number of model instances to launch.")
+    parser.add_argument("--max-concurrent", type=int, help="Limit how many of the -n instances may run at the same time (job array throttle)")
+    parser.add_argument("--no-array", action="store_true", help="Submit -n instances as separate jobs instead of a single job array")
+    parser.add_argument("--vllm", action="store_true", help="Use vllm instead of sp to serve the model (overrides registry)")
+    parser.add_argument("--sgl", action="store_true", help="Use sglang instead of sp to serve the model (overrides registry)")
+    parser.add_argument("--vllm-help", action="store_true", help="Show available options for **vllm** model server")
+    parser.add_argument("--sp-help", action="store_true", help="Show available options for **sp** model server")
+    parser.add_argument("-a", "--account", help="Slurm account to use for job submission")
+    parser.add_argument("-v", "--var", action="append", help="Specify environment variables in format KEY=VALUE", default=[])
+    parser.add_argument("-e", "--environment", help="Specify a custom environment file path")
+    parser.add_argument("--ocf-version", default=OCF_VERSION, help=f"OCF release to serve with, resolved through the shared cache in {OCF_CACHE_DIR} (default: {OCF_VERSION})")
+    parser.add_argument("--ocf-sha256", default="", help="Expected sha256 of the OCF binary, the cached or downloaded binary must match it")
+    parser.add_argument("--placement", action="store_true", help="Submit to the cluster and partition with the earliest estimated start (sinfo idle nodes, sbatch --test-only) instead of the login node's cluster")
+    parser.add_argument("--nodes", type=int, default=1, help="Number of nodes to serve one instance from (tensor parallel over all GPUs for sp/sglang, pipeline parallel across nodes for vllm)")
+    parser.add_argument("--pack", type=int, nargs="+", metavar="ID", help="Pack several registry models (repeat an ID for more replicas) onto as few nodes as their tp sizes allow, each on its own GPUs and port")
+    parser.add_argument("--auto-plan", action="store_true", help="Derive tp size, context length and memory fraction from the checkpoint's config.json and safetensors headers")
+    parser.add_argument("--gpu-memory", type=float, help="GPU memory in GB for --auto-plan (default: 80 on bristen, 96 on clariden)")
+    parser.add_argument("--plan-context", type=int, help="Context length --auto-plan should fit (default: the model maximum)")
+    parser.add_argument("--max-restarts", type=int, default=5, help="Restarts of a crashed or hung server inside its allocation before giving it up")
+    parser.add_argument("--no-preflight", action="store_true", help="Submit without checking the environment, checkpoint, engine flags and time limit first")
+    parser.add_argument("--drain", type=float, help=f"Seconds before the time limit in which the server is deregistered from OCF and in-flight requests finish, 0 to disable (default: the registry's, else {DRAIN_SECONDS})")
+    parser.add_argument("--router", action="store_true", help=f"With -n > 1, route requests through a prefix-affinity router on instance 1 (port {ROUTER_PORT}), the only endpoint registered with OCF")
+    parser.add_argument("--warmup-corpus", help="JSON lines file of common prefixes replayed once the server is up, OCF only advertises the server afterwards")
+    parser.add_argument("--warmup-concurrency", type=int, default=4, help="Prefixes replayed at the same time by --warmup-corpus")
+    parser.add_argument("--telemetry", type=float, nargs="?", const=15.0, metavar="SECONDS", help="Sample GPU utilization and memory, host memory and engine metrics every SECONDS (default: 15) into the job logs, see `spin-model telemetry --summarize`")
+    parser.add_argument("--prestage", choices=["warm", "copy"], help="Before serving, read a local checkpoint into the page cache (warm) or copy it to node-local storage (copy) with parallel readers")
+    parser.add_argument("--prestage-dir", default="/tmp/spin-model-stage", help="Node-local directory for --prestage copy")
+    parser.add_argument("--prestage-threads", type=int, default=16, help="Number of parallel readers for --prestage")
+    # Parse only known arguments, leaving the rest for the sp command
+    args, extra_args = parser.parse_known_args()
+    served_model_name = next((extra_args[i+1] for i, arg in enumerate(extra_args) if arg == '--served-model-name'), None)
+    if served_model_name and '--' in served_model_name:
+        print_warning("[Warning] The served model name contains dashes (--). This may cause issues.")
+    
+    if args.vllm_help:
+        print(get_help_content("vllm-docs.txt"))
+        sys.exit(0)
+
+    if args.sp_help:
+        print(get_help_content("sp-docs.txt"))
+        sys.exit(0)
+
+    if args.list:
+        list_models()
+        sys.exit(0)
+    
+    if args.login:
+        account = interactive_account_selection()
+        if account:
+            print_success(f"Account '{account}' has been saved and will be used by default in future runs.")
+        sys.exit(0)
+    
+    # Check for interactive mode (spin-model *)
+    if len(sys.argv) == 2 and sys.argv[1] == '*':
+        print_success("Interactive mode activated!")
+        account = interactive_account_selection()
+        if not account:
+            sys.exit(1)
+        
+        # Show model list and get selection
+        list_models()
+        while True:
+            try:
+                model_choice = input(f"\nSelect model (1-{len(MODEL_REGISTRY)}): ").strip()
+                if model_choice.isdigit():
+                    model_id = int(model_choice)
+                    if model_id in MODEL_REGISTRY:
+                        # Set args as if they were passed via command line
+                        args.model_id = model_id
+                        args.account = account
+                        break
+                    else:
+                        print_warning(f"Please enter a number between 1 and {len(MODEL_REGISTRY)}")
+                else:
+                    print_warning("Please enter a valid number")
+            except KeyboardInterrupt:
+                print("\nExiting...")
+                sys.exit(0)
+            except EOFError:
+                print("\nExiting...")
+                sys.exit(0)
+
+    # Require either --model or -m
+    if not args.model and not args.model_id and not args.pack:
+        print_warning("Error: Either --model or -m (model ID) is required. Use -l to list available models.\n")
+        parser.print_help()
+        sys.exit(1)
+    
+    if args.model_id and args.model_id not in MODEL_REGISTRY:
+        print_warning(f"Error: Model ID {args.model_id} not found in registry. Use -l to list available models.")
+        sys.exit(1)
+    if args.drain is None:
+        model_ids = args.pack or ([args.model_id] if args.model_id else [])
+        args.drain = max((MODEL_REGISTRY[model_id].get("drain", DRAIN_SECONDS) for model_id in model_ids if model_id in MODEL_REGISTRY), default=DRAIN_SECONDS)
+    
+    # Handle account
+    if not args.account:
+        # Try to load saved account
+        saved_account = get_saved_account()
+        if saved_account:
+            args.account = saved_account
+            print_success(f"Using saved account: {saved_account}")
+        else:
+            print_warning("No account specified. Use --login to set up an account, or specify with -a/--account")
+            accounts = get_user_accounts()
+            if accounts:
+                print("Available accounts:")
+                for account in accounts:
+                    print(f"  - {account}")
+            print_warning("Please specify an account with -a/--account or use --login for interactive setup")
+            sys.exit(1)
+
+    if args.warmup_corpus and not os.path.isfile(args.warmup_corpus):
+        print_warning(f"Error: Warm-up corpus {args.warmup_corpus} not found")
+        sys.exit(1)
+
+    if args.pack:
+        sys.exit(launch_pack(args, extra_args))
+
+    # Store model information
+    if args.model_id:
+        model_config = MODEL_REGISTRY[args.model_id]
+        model = model_config["path"]
+        model_name = model_config["name"]
+        default_engine = model_config["engine"]
+        
+        # Union: general | model
+        model_kwargs = GENERAL_CONFIG | model_config["kwargs"]
+        tp_size = model_kwargs.get("--tp-size", 4)
+        
+        # Handle engine-specific argument mapping
+        extra_args_str = ' '.join(extra_args)
+        engine_name = default_engine.split()[0] if default_engine else "sp"
+        
+        if engine_name == "vllm" and "--tp-size" in extra_args_str:
+            extra_args_str = extra_args_str.replace("--tp-size", "--tensor-parallel-size")
+        
+        extra_args = extra_args_str.split() if extra_args_str else []
+    else:
+        # Legacy mode using --model
+        model = args.model
+        model_name = args.model
+        default_engine = "sp"
+        tp_size = 1
+        model_kwargs = {}
+
+    print(f"Served model name: {served_model_name if served_model_name else (model_name if args.model_id else model)}")
+
+    # if not served_model_name:
+    #     save_model_logo(model)
 
     # Convert timeout to SLURM format
     slurm_time = parse_duration(args.time)
+
+    # Identify the cluster from the login node hostname, or place the job where it starts first
+    node, PARTITION, cluster = select_cluster(args, [model, model_name] + extra_args, args.nodes, slurm_time)
+    if node is None:
+        sys.exit(1)
+    ocf_command = cluster["ocf_command"]
+    ocf_arch = cluster["ocf_arch"]
+    NCCL_SO_PATH = f"export SP_NCCL_SO_PATH={cluster['nccl_so_path']}"
+    if cluster["registry_environment"] and args.model_id and "environment" in model_config:
+        ENV_TOML = args.environment if args.environment else model_config["environment"]
+    else:
+        ENV_TOML = args.environment if args.environment else cluster["environment"]
+
+    logs_dir = get_logs_dir()
+
     print_success(f"Time allocated for model: {slurm_time}")
 
 
+    if args.model_id:
+        engine_kind = {"python3": "sglang", "vllm": "vllm"}.get(default_engine.split()[0], "sp")
+    else:
+        engine_kind = "sglang" if args.sgl else "vllm" if args.vllm else "sp"
+
+    # Derive tp size, context length and memory fraction from the checkpoint, explicit flags win
+    if args.auto_plan:
+        gpu_memory = args.gpu_memory or GPU_MEMORY_GB[node]
+        config, weights = read_checkpoint(model)
+        plan = plan_memory(config, weights, gpu_memory, args.plan_context, args.nodes) if config and weights else None
+        if plan:
+            print_plan(model, plan, gpu_memory)
+            flags = {flag: value for flag, value in plan_flags(plan, engine_kind).items() if flag not in extra_args}
+            if args.model_id:
+                if engine_kind == "vllm":
+                    model_kwargs.pop("--tp-size", None)
+                    model_kwargs.pop("--context-length", None)
+                model_kwargs.update(flags)
+            else:
+                extra_args += [str(item) for flag, value in flags.items() for item in (flag, value)]
+        elif config and weights:
+            print_warning(f"Warning: The weights of {model} don't fit on {args.nodes} node(s) of {GPUS_PER_NODE}x{gpu_memory} GB, --auto-plan is ignored")
+        else:
+            print_warning(f"Warning: Could not read config.json and weights of {model}, --auto-plan is ignored")
+
+    # Multi-node: sp/sglang shard tp over all GPUs and rendezvous at the head node,
+    # vllm keeps tp inside a node and pipelines across nodes over a Ray cluster
+    if args.nodes > 1:
+        if engine_kind == "vllm":
+            flags = {"--tensor-parallel-size": GPUS_PER_NODE, "--pipeline-parallel-size": args.nodes,
+                     "--distributed-executor-backend": "ray"}
+        else:
+            flags = {"--tp-size": GPUS_PER_NODE * args.nodes, "--nnodes": args.nodes, "--node-rank": "$NODE_RANK",
+                     "--dist-init-addr": f"$HEAD_NODE:{DIST_INIT_PORT}"}
+        flags = {flag: value for flag, value in flags.items() if flag not in extra_args}
+        if args.model_id:
+            if engine_kind == "vllm":
+                model_kwargs.pop("--tp-size", None)
+            model_kwargs.update(flags)
+        else:
+            extra_args += [str(item) for flag, value in flags.items() for item in (flag, value)]
+
     # Build serve command using engine from registry or override
     if args.model_id:
-        engine_cmd = model_config["engine"]
-        serve_args = [f"{key} {value}" for key, value in model_kwargs.items() if value is not True]
-        
-        if engine_cmd.startswith("sp serve"):
-            serve_command = f"{engine_cmd} {model} {' '.join(serve_args)} {' '.join(extra_args)}"
-        else:  # SGL
-            serve_command = f"{engine_cmd} {' '.join(serve_args)} {' '.join(extra_args)}"
+        serve_command = f"{registry_command(model_config, model_kwargs, model)} {' '.join(extra_args)}"
     else:
         # Legacy mode - determine engine from command line args
         if args.sgl:
-            serve_command = f"python3 -m sglang.launch_server --model-path {model} --host localhost --port 8080 --tp-size 4 {' '.join(extra_args)}"
+            tp_arg = "" if "--tp-size" in extra_args else "--tp-size 4 "
+            serve_command = f"python3 -m sglang.launch_server --model-path {model} --host localhost --port 8080 {tp_arg}{' '.join(extra_args)}"
         elif args.vllm:
             serve_command = f"vllm serve {model} --host 0.0.0.0 --port 8080 {' '.join(extra_args)}"
         else:
             serve_command = f"sp serve {model} --host 0.0.0.0 --port 8080 {' '.join(extra_args)}"
 
+    jobctl_path = job_jobctl(logs_dir)
+    # Prestage a local checkpoint before the server starts, a copy is served through $MODEL_PATH
+    prestage_step = ""
+    if args.prestage:
+        if os.path.isabs(model):
+            prestage_step = f"""export MODEL_PATH={model}
+# a prestage that crashes or prints nothing falls back to the original checkpoint
+MODEL_PATH=$(python3 {jobctl_path} prestage "$MODEL_PATH" --mode {args.prestage} --dest {args.prestage_dir} --threads {args.prestage_threads}) || MODEL_PATH={model}
+[ -n "$MODEL_PATH" ] || MODEL_PATH={model}
+spin_phase prestage_done
+"""
+            if args.prestage == "copy":
+                serve_command = serve_command.replace(model, "$MODEL_PATH")
+        else:
+            print_warning(f"Warning: --prestage needs a local checkpoint path, {model} will be loaded by the server directly")
+
     # Print the constructed command
     print_success("Command for serving:")
     print(serve_command)
 
+    if not args.no_preflight and not preflight([
+        ("environment", check_environment, ENV_TOML),
+        ("checkpoint", check_checkpoint, model, serve_tp_size(serve_command)),
+        ("flags", check_flags, serve_command, engine_kind),
+        ("cluster", check_cluster, node, cluster, slurm_time, [model, model_name] + extra_args),
+    ]):
+        sys.exit(1)
+
     # Process environment variables from --var
     env_vars = ""
     for env_var in args.var:
@@ -523,57 +2856,178 @@ def main():
     elif not args.model_id and args.sgl:
         env_vars += "export PROMETHEUS_MULTIPROC_DIR=/ocfbin/scratch\n"
 
+    # Several instances go out as one job array unless asked otherwise
+    use_array = args.num_instances > 1 and not args.no_array
+    use_router = args.router and args.num_instances > 1 and args.nodes == 1
+    if args.router and not use_router:
+        print_warning("Warning: --router needs -n > 1 single-node instances, ignoring it")
+    if use_router:
+        # the router on another node reaches the replicas over the network
+        serve_command = serve_command.replace("--host localhost", "--host 0.0.0.0")
+    if args.max_concurrent and not use_array:
+        print_warning("Warning: --max-concurrent only applies to job arrays (-n > 1 without --no-array), ignoring it")
+
     # Create SLURM script content
-    log_files = f"{logs_dir}/model-logs-%j"
+    log_files = f"{logs_dir}/model-logs-%A_%a" if use_array else f"{logs_dir}/model-logs-%j"
+    timeline_id = "${SLURM_ARRAY_JOB_ID}_${SLURM_ARRAY_TASK_ID}" if use_array else "${SLURM_JOB_ID}"
 
-    try:
-        bootstrap_addr = requests.get("http://148.187.108.172:8092/v1/dnt/bootstraps").json()['bootstraps'][0]
-    except (requests.exceptions.RequestException, KeyError, IndexError) as e:
-        print_warning(f"Failed to fetch or parse bootstrap address: {e}. Using fallback.")
-        bootstrap_addr = "/ip4/148.187.108.172/tcp/43905/p2p/QmcMpnf39qfJcXssHrFFw7nvAioLd4SXKhzBZ4XMcLDoSU"
+    bootstrap_addr = cached("bootstrap")
+    if not bootstrap_addr:
+        print_warning("Failed to fetch or parse bootstrap address. Using fallback.")
+        bootstrap_addr = FALLBACK_BOOTSTRAP_ADDR
+
+    job_name = f"{'sgl' if args.sgl else 'vllm' if args.vllm else 'sp'}-{served_model_name if served_model_name else (model_name if args.model_id else model)}"
+    backends_file = f"{logs_dir}/router-{job_name.replace('/', '-')}-{int(time.time())}.backends" if use_router else ""
+    if use_array:
+        # All array tasks share one job name, so singleton would run them one
+        # at a time; the task index is available as $SLURM_ARRAY_TASK_ID instead.
+        array_range = f"1-{args.num_instances}" + (f"%{args.max_concurrent}" if args.max_concurrent else "")
+        SCHEDULING = f"#SBATCH --array={array_range}"
+        instance_env = "export SPIN_MODEL_INSTANCE=${SLURM_ARRAY_TASK_ID}"
+    else:
+        SCHEDULING = "#SBATCH --dependency=singleton"
+        instance_env = f"export SPIN_MODEL_INSTANCE={INSTANCE_PLACEHOLDER}" if args.num_instances > 1 else ""
+        if args.num_instances > 1:
+            job_name += f"-{INSTANCE_PLACEHOLDER}"
+
+    # the supervisor registers with OCF once the server answers and restarts it inside the allocation,
+    # it replaces the shell so that the drain signal of the batch shell reaches it
+    serve_step = f"""exec python3 {jobctl_path} supervise --timeline "$SPIN_TIMELINE" {supervise_options(args)}\\
+    --serve "{serve_command}" \\
+    --ocf "$OCF_BIN start --bootstrap.addr {bootstrap_addr} --service.name llm --service.port 8080"
+"""
+
+    if args.nodes == 1 and use_router:
+        # replicas announce themselves to the router of instance 1 instead of registering with OCF
+        replica_step = f"""exec python3 {jobctl_path} supervise --timeline "$SPIN_TIMELINE" {supervise_options(args)}--announce {backends_file} \\
+        --serve "{serve_command}\""""
+        server_step = f"""if [ "$SPIN_MODEL_INSTANCE" = 1 ]; then
+    until python3 {SPIN_MODEL_PATH} router --port {ROUTER_PORT} --backends-file {backends_file}; do sleep 5; done &
+    {replica_step} \\
+        --ocf "$OCF_BIN start --bootstrap.addr {bootstrap_addr} --service.name llm --service.port {ROUTER_PORT}"
+else
+    {replica_step}
+fi
+"""
+    elif args.nodes == 1:
+        server_step = serve_step
+    else:
+        # one task per node, only rank 0 serves HTTP and registers with OCF
+        if engine_kind == "vllm":
+            worker_command = f"""sleep 10
+    exec python3 {jobctl_path} supervise --url "" {supervise_options(args)}--serve "ray start --address=$HEAD_NODE:{RAY_PORT} --block\""""
+            head_setup = f"""ray start --head --port={RAY_PORT}
+    until [ "$(ray status 2>/dev/null | grep -c " node_")" -ge {args.nodes} ]; do sleep 5; done
+    """
+        else:
+            # workers are restarted as well, they exit when the rank 0 engine they rendezvous with dies
+            worker_command = f'exec python3 {jobctl_path} supervise --url "" {supervise_options(args)}--serve "{serve_command}"'
+            head_setup = ""
+        head_serve_step = "\n".join(f"    {line}" if line and index else line
+                                    for index, line in enumerate(serve_step.rstrip("\n").split("\n")))
+        # the sidecar samples the GPUs of rank 0 from inside the container
+        head_telemetry = telemetry_step(args, logs_dir, timeline_id, [8080])
+        head_telemetry = f"{head_telemetry.rstrip()}\n    " if head_telemetry else ""
+        # the batch shell runs on the host, where scontrol and srun are, each rank runs in the container
+        server_step = f"""# ranks talk over the network, not the loopback interface
+unset NCCL_SOCKET_IFNAME GLOO_SOCKET_IFNAME
+export OCF_BIN SPIN_TIMELINE
+export -f spin_phase
+export HEAD_NODE=$(scontrol show hostnames "$SLURM_JOB_NODELIST" | head -n 1)
+# srun passes the drain signal on to the supervisors of all ranks
+{DRAIN_TRAP}
+srun -N {args.nodes} --ntasks-per-node=1 --environment={ENV_TOML} --container-writable bash -c '
+spin_phase container_start
+export NODE_RANK=$SLURM_NODEID
+{prestage_step}if [ "$NODE_RANK" = 0 ]; then
+    {head_telemetry}{head_setup}{head_serve_step}
+else
+    {worker_command}
+fi
+' &
+{DRAIN_WAIT}
+"""
+        # every node stages its own copy of the weights
+        prestage_step = ""
 
     job_script_template = f"""#!/bin/bash
-#SBATCH --job-name={'sgl' if args.sgl else 'vllm' if args.vllm else 'sp'}-{served_model_name if served_model_name else (model_name if args.model_id else model)}{"-%s" if args.num_instances > 1 else ""}
+#SBATCH --job-name={job_name}
 #SBATCH --output={log_files}.out
 #SBATCH --error={log_files}.err
 #SBATCH --container-writable
 #SBATCH --time={slurm_time}
+#SBATCH --nodes={args.nodes}
 #SBATCH --ntasks-per-node=1
-#SBATCH --dependency=singleton
+{SCHEDULING}
 #SBATCH --account={args.account}
-#SBATCH --environment={ENV_TOML}
+{f"#SBATCH --environment={ENV_TOML}" if args.nodes == 1 else ""}
+{drain_signal(args, slurm_time)}
 {PARTITION}
 
 export NCCL_SOCKET_IFNAME=lo
 export GLOO_SOCKET_IFNAME=lo
 {NCCL_SO_PATH}
+{instance_env}
 {env_vars}
+export SPIN_TIMELINE={logs_dir}/model-logs-{timeline_id}.timeline
+{TIMELINE_FUNCTION}
+spin_phase job_start
 
-{ocf_command} start --bootstrap.addr {bootstrap_addr} --subprocess "{serve_command}" \\
-    --service.name llm \\
-    --service.port 8080
-"""
+{OCF_CACHE_FUNCTION}
 
-    jobids = []
-    for i in range(1, args.num_instances + 1):
-        jobid = submit_job(job_script_template.replace('%s', str(i)), logs_dir)
-        jobids.append(jobid)
+{prestage_step}
+if ! OCF_BIN=$(resolve_ocf {args.ocf_version} {ocf_arch} "{args.ocf_sha256}" {OCF_CACHE_DIR}); then
+    echo "Unable to resolve OCF {args.ocf_version}/{ocf_arch} through the cache, using {ocf_command}" >&2
+    OCF_BIN={ocf_command}
+fi
+spin_phase ocf_ready
+{telemetry_step(args, logs_dir, timeline_id, [8080]) if args.nodes == 1 else ""}
+{server_step}"""
+
+    submit_time = time.time()
+    if use_array:
+        array_jobid = submit_job(job_script_template, logs_dir)
+        jobids = [array_jobid]
+        task_ids = [f"{array_jobid}_{i}" for i in range(1, args.num_instances + 1)] if array_jobid else []
+        log_hint = log_files.replace('%A', str(array_jobid)).replace('%a', "*")
+    else:
+        jobids = []
+        for i in range(1, args.num_instances + 1):
+            jobid = submit_job(job_script_template.replace(INSTANCE_PLACEHOLDER, str(i)), logs_dir)
+            jobids.append(jobid)
+        task_ids = jobids
+        log_hint = log_files.replace('%j', "<jobid>")
+    task_line = f"\nArray task IDs: {' '.join(task_ids)}" if use_array else ""
+    cluster_flag = f" -M {node}" if node != detect_cluster() else ""
+
+    record_submission(logs_dir, {
+        "job_ids": [jobid for jobid in jobids if jobid],
+        "task_ids": [task_id for task_id in task_ids if task_id],
+        "name": job_name.replace(f"-{INSTANCE_PLACEHOLDER}", ""),
+        "model": model_name if args.model_id else model,
+        "engine": engine_label(serve_command),
+        "cluster": node,
+        "submitted": submit_time,
+    })
 
     print_success(f"""
 Job submitted. To know estimated time of start, run:
-  squeue --me --start
+  squeue{cluster_flag} --me --start
+
+To follow readiness, load time, throughput and errors of all your spin-model jobs:
+  spin-model status --watch
 
-Your job ID is: {' '.join(map(str, jobids))}
+Your job ID is: {' '.join(map(str, jobids))}{task_line}
 
 To get more information about the job: 
-  scontrol show job <jobid>
+  scontrol{cluster_flag} show job <jobid>
 
 To cancel this job/model, run:
-  scancel {' '.join(map(str, jobids))}
+  scancel{cluster_flag} {' '.join(map(str, jobids))}
 
 To view logs for this job:
-  cat {log_files.replace('%j', "<jobid>")}.out  # For stdout
-  cat {log_files.replace('%j', "<jobid>")}.err  # For stderr
+  cat {log_hint}.out  # For stdout
+  cat {log_hint}.err  # For stderr
 
 Chat with model when it's ready: https://serving.swissai.cscs.ch/
 """)
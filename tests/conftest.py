@@ -0,0 +1,14 @@
+import importlib.util
+import os
+import pytest
+
+SPIN_MODEL = os.path.join(os.path.dirname(__file__), "..", "spin-model.py")
+
+
+@pytest.fixture(scope="session")
+def spin_model():
+    """The spin-model.py script as a module, its name isn't importable"""
+    spec = importlib.util.spec_from_file_location("spin_model", SPIN_MODEL)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from test_sweep import _free_port
+
+
+def _get(url, timeout=2):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _wait(check, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def test_backends_file_expires_and_withdraws_replicas(spin_model, tmp_path):
+    """Two bench-stub replicas behind the router, one stops its heartbeat, the other withdraws"""
+    jobctl = spin_model.load_jobctl()
+    ports = [_free_port() for _ in range(3)]
+    stubs = [subprocess.Popen([sys.executable, spin_model.SPIN_MODEL_PATH, "bench-stub", "--port", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for port in ports[1:]]
+    backends_file = str(tmp_path / "router.backends")
+    fresh, stale = (f"http://{jobctl.socket.gethostname()}:{port}" for port in ports[1:])
+    with open(backends_file, "w") as f:
+        f.write(f"{fresh} {time.time():.0f}\n{stale} {time.time() - 3600:.0f}\n")
+    router = subprocess.Popen([sys.executable, spin_model.SPIN_MODEL_PATH, "router", "--host", "127.0.0.1",
+                               "--port", str(ports[0]), "--backends-file", backends_file],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    stats = f"http://127.0.0.1:{ports[0]}/router/stats"
+    try:
+        # the stale entry of a replica whose job left is never routed to
+        assert _wait(lambda: list(_get(stats)["backends"]) == [fresh])
+        for _ in range(4):
+            request = urllib.request.Request(f"http://127.0.0.1:{ports[0]}/v1/completions", method="POST",
+                                             data=json.dumps({"prompt": "hi", "max_tokens": 2}).encode(),
+                                             headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(request, timeout=10) as response:
+                assert response.status == 200
+        assert _get(stats)["backends"][fresh]["requests"] == 4
+
+        jobctl.announce_backend(backends_file, f"http://127.0.0.1:{ports[2]}")
+        assert _wait(lambda: sorted(_get(stats)["backends"]) == sorted([fresh, stale]))
+        with open(backends_file) as f:
+            assert jobctl.live_backends(f.read()) == [fresh, stale]
+
+        jobctl.withdraw_backend(backends_file, f"http://127.0.0.1:{ports[1]}")
+        assert _wait(lambda: list(_get(stats)["backends"]) == [stale])
+    finally:
+        for process in [router, *stubs]:
+            process.terminate()
+            process.wait()
+
+
+def test_expired_entries_are_dropped_from_the_file(spin_model, tmp_path):
+    jobctl = spin_model.load_jobctl()
+    path = str(tmp_path / "router.backends")
+    with open(path, "w") as f:
+        f.write(f"http://static:8080\nhttp://gone:8080 {time.time() - 3600:.0f}\n")
+    jobctl.announce_backend(path, "http://127.0.0.1:8081")
+    with open(path) as f:
+        backends = jobctl.parse_backends(f.read())
+    assert list(backends) == ["http://static:8080", f"http://{jobctl.socket.gethostname()}:8081"]
+    assert not [name for name in os.listdir(tmp_path) if name != "router.backends"]
@@ -0,0 +1,11 @@
+def test_apertus_on_clariden_is_rejected(spin_model):
+    findings = spin_model.check_cluster({}, "clariden", spin_model.CLUSTERS["clariden"], "02:00:00", ["apertus-8B"])
+    assert [level for level, _ in findings] == ["error"]
+
+
+def test_non_json_hub_config_is_a_warning(spin_model, monkeypatch):
+    monkeypatch.setattr(spin_model, "_fetch_hf", lambda *args, **kwargs: b"<html>rate limited</html>")
+    cache = {}
+    findings = spin_model.check_checkpoint(cache, "org/not-cached-model", 4)
+    assert [level for level, _ in findings] == ["warning"]
+    assert cache == {}
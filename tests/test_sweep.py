@@ -0,0 +1,67 @@
+import json
+import os
+import socket
+import stat
+import sys
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _stub(directory, name, body):
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write(f"#!/bin/bash\n{body}\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+
+def test_serve_args_keeps_bare_flags_and_drops_disabled_ones(spin_model):
+    assert spin_model.serve_args({"--tp-size": 4, "--enable-metrics": True, "--disable-radix-cache": False}) == \
+        "--tp-size 4 --enable-metrics"
+
+
+def test_sweep_and_launch_build_the_same_command(spin_model):
+    model_id = next(iter(spin_model.MODEL_REGISTRY))
+    flags = {"--enable-metrics": True}
+    model_config = spin_model.MODEL_REGISTRY[model_id]
+    launched = spin_model.registry_command(model_config, spin_model.GENERAL_CONFIG | model_config["kwargs"] | flags)
+    assert spin_model.sweep_serve_command(model_id, None, flags) == launched
+    assert "--enable-metrics" in launched.split()
+
+
+def test_snippet_writes_bare_flags_as_python_true(spin_model, capsys):
+    model_id = next(iter(spin_model.MODEL_REGISTRY))
+    manifest = {"model": "m", "model_id": model_id, "slo_ttft": 2.0, "slo_itl": 0.1, "variants": [
+        {"id": "v01", "label": "enable-metrics=on", "flags": {"--enable-metrics": True}, "score": 10.0,
+         "measured_levels": 1, "best": {"concurrency": 1, "request_throughput": 1.0, "ttft_p99": 0.1, "itl_p99": 0.01}}]}
+    spin_model.print_sweep(manifest)
+    assert '"--enable-metrics": True,' in capsys.readouterr().out
+
+
+def test_sweep_ranks_variants_against_a_stub_endpoint(spin_model, tmp_path, monkeypatch, capsys):
+    """Every variant job runs right away through a stub sbatch and benchmarks bench-stub on a free port"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    port = _free_port()
+    # the job scripts serve on 8080, the stub moves them to a free port and runs them to completion
+    _stub(bin_dir, "sbatch", f'sed "s/8080/{port}/g" "$1" | bash > /dev/null 2>&1\n'
+                             'echo "Submitted batch job $RANDOM"')
+    _stub(bin_dir, "squeue", "exit 0")
+    _stub(bin_dir, "sacct", "exit 0")
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(spin_model, "detect_cluster", lambda: "bristen")
+
+    serve = f"{sys.executable} {spin_model.SPIN_MODEL_PATH} bench-stub --port 8080 --tokens-per-second 500"
+    code = spin_model.sweep_command(["--serve", serve, "--grid", "ttft=0.01,1.5", "--levels", "1,2", "-n", "4",
+                                     "--input-len", "8", "--output-len", "8", "-a", "acct", "--slo-ttft", "1",
+                                     "--ready-timeout", "60", "--poll", "0.1", "--dir", str(tmp_path / "sweep"), "--json"])
+    assert code == 0
+    output = capsys.readouterr().out
+    manifest = json.loads(output[output.index("{\n"):])
+    fast, slow = manifest["variants"]
+    assert fast["flags"] == {"--ttft": 0.01} and fast["measured_levels"] == 2 and fast["score"] > 0
+    assert slow["flags"] == {"--ttft": 1.5} and slow["measured_levels"] == 2 and slow["score"] is None